@@ -0,0 +1 @@
+"""Top-level package for duplicate-file-finder benchmarks."""
@@ -0,0 +1,77 @@
+"""This module benchmarks the I/O modes of functions.file_hash.
+
+Run it from the repository root with:
+
+    python -m benchmarks.io_modes [--sizes 65536 1048576 ...] [--repeat 3]
+
+Each file is hashed once before timing, so the numbers measure hashing
+from the page cache rather than from the disk.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from functions import file_hash, IO_MODES, HASH_BLOCK_SIZE
+
+DEFAULT_SIZES = [64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 128 * 1024 * 1024]
+
+
+def benchmark_io_modes(sizes=DEFAULT_SIZES, algorithm='sha256', repeat=3,
+                       block_size=HASH_BLOCK_SIZE):
+    """
+    benchmark_io_modes writes x random file of each size and times
+    file_hash on it with every I/O mode, keeping the best of repeat runs.
+    It raises x RuntimeError if any two modes disagree on x digest.
+    :param sizes: list of int, file sizes in bytes
+    :param algorithm: str, see file_hash for valid values
+    :param repeat: int, number of timed runs per mode and size
+    :param block_size: int, block size used by the read and readinto modes
+    :return: list of dicts with the keys size, io_mode, seconds and mb_per_s
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            path = os.path.join(tmp_dir, f"data_{size}")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size))
+            digests = set()
+            for io_mode in IO_MODES:
+                digests.add(file_hash(path, algorithm, io_mode, block_size))
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    file_hash(path, algorithm, io_mode, block_size)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                results.append({'size': size,
+                                'io_mode': io_mode,
+                                'seconds': best,
+                                'mb_per_s': size / best / 1e6})
+            if len(digests) != 1:
+                error_msg = (f"benchmark_io_modes(): I/O modes disagree on the "
+                             f"digest of x {size} byte file: {digests}.")
+                raise RuntimeError(error_msg)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="io_modes",
+        description="Benchmarks the I/O modes of file_hash."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="File sizes in bytes.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Timed runs per mode and size. Defaults to 3.")
+    parser.add_argument("--block-size", type=int, default=HASH_BLOCK_SIZE,
+                        help="Block size of the read and readinto modes.")
+    parser.add_argument("-t", "--hash-type", default='sha256',
+                        help="Hash algorithm. Defaults to sha256.")
+    args = parser.parse_args()
+    print(f"{'size':>12} {'io_mode':>9} {'seconds':>10} {'MB/s':>9}")
+    for result in benchmark_io_modes(args.sizes, args.hash_type, args.repeat,
+                                     args.block_size):
+        print(f"{result['size']:>12} {result['io_mode']:>9} "
+              f"{result['seconds']:>10.5f} {result['mb_per_s']:>9.1f}")
@@ -0,0 +1,148 @@
+"""This module benchmarks the startup time of the RP Tree command line.
+
+Run it from the repository root with:
+
+    python -m benchmarks.startup [--output results.json] [--compare old.json]
+
+Scripts calling tree.py on small directories pay for its startup on every
+call, so two cases are timed, each as the best of --repeat fresh
+interpreters: importing rptree.cli, and running tree.py --quiet over x
+tree of x few files. The optional engines must not be imported at startup:
+the benchmark fails when importing rptree.cli loads any of LAZY_MODULES,
+and, with --compare, when x case got slower than in x previous result
+file by more than --threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from rptree import __version__
+from .suite import compare_results, REPOSITORY_DIR
+
+RESULTS_VERSION = 1
+STARTUP_CASES = ['import', 'cli_small_tree']
+# Modules of the optional engines: the worker pool, the async engine, the
+# hash cache and the csv and sqlite output formats.
+LAZY_MODULES = ['asyncio', 'concurrent.futures', 'multiprocessing', 'sqlite3',
+                'csv']
+
+
+def _small_tree(tree_dir, files=5):
+    """
+    _small_tree writes x directory of files small files below tree_dir.
+    :param tree_dir: str, filepath of the directory to create
+    :param files: int, defaults to 5, number of files
+    :return: None
+    """
+    os.makedirs(os.path.join(tree_dir, 'sub'))
+    for idx in range(files):
+        with open(os.path.join(tree_dir, 'sub' if idx % 2 else '', f"file{idx}"),
+                  'w', encoding='UTF-8') as f:
+            f.write(f"content {idx % 3}\n")
+
+
+def _best_time(command, repeat):
+    """
+    _best_time runs command repeat times and returns its fastest run.
+    :param command: list of str
+    :param repeat: int
+    :return: float, seconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                       cwd=REPOSITORY_DIR)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def eager_modules():
+    """
+    eager_modules lists the modules of LAZY_MODULES that importing
+    rptree.cli loads, in x fresh interpreter.
+    :return: list of str
+    """
+    child = subprocess.run(
+        [sys.executable, '-c',
+         "import json, sys, rptree.cli; print(json.dumps(sorted(sys.modules)))"],
+        check=True, capture_output=True, text=True, cwd=REPOSITORY_DIR)
+    loaded = set(json.loads(child.stdout))
+    return [module for module in LAZY_MODULES if module in loaded]
+
+
+def benchmark_startup(repeat=10):
+    """
+    benchmark_startup times every case of STARTUP_CASES.
+    :param repeat: int, defaults to 10, number of runs of each case, of
+        which the fastest is kept
+    :return: list of dicts with the keys case and seconds
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tree_dir = os.path.join(tmp_dir, 'tree')
+        _small_tree(tree_dir)
+        commands = {'import': [sys.executable, '-c', 'import rptree.cli'],
+                    'cli_small_tree': [sys.executable,
+                                       os.path.join(REPOSITORY_DIR, 'tree.py'),
+                                       '--quiet', '--list-duplicates', tree_dir]}
+        for case in STARTUP_CASES:
+            results.append({'case': case,
+                            'seconds': _best_time(commands[case], repeat)})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="startup",
+        description="Benchmarks the startup time of the RP Tree command line."
+    )
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Runs of each case, the fastest being kept. "
+                             "Defaults to 10.")
+    parser.add_argument("--output", default=None,
+                        help="Writes the JSON results to this file instead "
+                             "of stdout.")
+    parser.add_argument("--compare", default=None, metavar="BASELINE",
+                        help="JSON results of an earlier run. Exits with "
+                             "status 1 when x case got slower.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Tolerated relative slowdown for --compare. "
+                             "Defaults to 0.2.")
+    args = parser.parse_args()
+
+    results = {'version': RESULTS_VERSION,
+               'rptree_version': __version__,
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'eager_modules': eager_modules(),
+               'results': benchmark_startup(args.repeat)}
+    for result in results['results']:
+        print(f"{result['case']:>16}: {result['seconds']:.4f} seconds.",
+              file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    failed = False
+    for module in results['eager_modules']:
+        print(f"Regression: importing rptree.cli loads {module}.", file=sys.stderr)
+        failed = True
+    if args.compare:
+        with open(args.compare, encoding='UTF-8') as f:
+            baseline = json.load(f)
+        for case, old_seconds, seconds in compare_results(results, baseline,
+                                                          args.threshold):
+            print(f"Regression: {case} took {seconds:.4f} seconds, "
+                  f"{old_seconds:.4f} before.", file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
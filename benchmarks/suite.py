@@ -0,0 +1,256 @@
+"""This module runs the duplicate-file-finder benchmark suite.
+
+Run it from the repository root with:
+
+    python -m benchmarks.suite [--output results.json] [--compare old.json]
+
+A synthetic tree is generated, see benchmarks.synthetic_tree for its
+settings, unless --tree points at an existing one. Every case runs in its
+own child process so that its peak RSS is its own. Results are written
+as JSON, and --compare flags every case that got slower than x previous
+result file by more than --threshold.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from functions import file_hash, FileRecord, RecordStore, HASH_ALGORITHMS
+from rptree import __version__
+from rptree.rptree import DirectoryTree, _TreeDiagramGenerator
+from .synthetic_tree import generate_tree, add_tree_arguments, tree_settings
+
+try:
+    import resource
+except ImportError:
+    # resource is not available on Windows, where peak RSS is not reported.
+    resource = None
+
+RESULTS_VERSION = 1
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def suite_cases():
+    """
+    suite_cases lists the names of every benchmark case.
+    :return: list of str
+    """
+    cases = [f"file_hash:{algorithm}" for algorithm in HASH_ALGORITHMS]
+    cases += ['build_tree', 'build_tree_async', 'find_duplicates', 'find_duplicates_staged', 'cli']
+    cases += ['records:file_record', 'records:record_store']
+    return cases
+
+
+def _peak_rss_kb(who):
+    """
+    _peak_rss_kb returns the peak resident set size of this process or of
+    its children, in KiB.
+    :param who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+    :return: int or None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes, Linux reports KiB.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _tree_files(tree_dir):
+    """
+    _tree_files lists every file below tree_dir with its size.
+    :param tree_dir: str
+    :return: list of tuples of (path, size)
+    """
+    files = []
+    for directory, _, names in os.walk(tree_dir):
+        for name in names:
+            path = os.path.join(directory, name)
+            files.append((path, os.path.getsize(path)))
+    return files
+
+
+def _record_memory(kind, files):
+    """
+    _record_memory measures the memory taken by the records of files, kept
+    either as x list of FileRecord or in x RecordStore, with tracemalloc.
+    Every file is stat'ed before the measurement starts, and each record
+    gets x distinct 64 digit hex digest, as x sha256 scan would give it.
+    :param kind: str, 'file_record' or 'record_store'
+    :param files: list of tuples of (path, size)
+    :return: int, bytes allocated for the records
+    """
+    stats = [(path, os.stat(path)) for path, _ in files]
+    tracemalloc.start()
+    if kind == 'file_record':
+        records = [FileRecord(path=pathlib.Path(path), size=stat_result.st_size,
+                              hash=f"{idx:064x}")
+                   for idx, (path, stat_result) in enumerate(stats)]
+    else:
+        records = RecordStore()
+        for idx, (path, stat_result) in enumerate(stats):
+            records.append(path, stat_result, f"{idx:064x}")
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return allocated
+
+
+def run_case(case, tree_dir):
+    """
+    run_case times x single benchmark case over tree_dir. Output of the
+    code under test is discarded.
+    :param case: str, one of suite_cases()
+    :param tree_dir: str, filepath of the tree to benchmark
+    :return: dict with the keys case, seconds, files, bytes, files_per_s,
+        mb_per_s, peak_rss_kb and bytes_per_file, the memory each file's
+        record takes in the records cases, else None
+    """
+    bytes_per_file = None
+    files = _tree_files(tree_dir)
+    total_bytes = sum(size for _, size in files)
+    rss_of = resource.RUSAGE_SELF if resource else None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if case.startswith('file_hash:'):
+            algorithm = case.split(':', 1)[1]
+            for path, _ in files:
+                file_hash(path, algorithm)
+        elif case == 'build_tree':
+            _TreeDiagramGenerator(tree_dir).build_tree()
+        elif case == 'build_tree_async':
+            _TreeDiagramGenerator(tree_dir, engine='async').build_tree()
+        elif case in ('find_duplicates', 'find_duplicates_staged'):
+            tree = DirectoryTree(tree_dir, list_duplicates=True,
+                                 suppress_hash=case == 'find_duplicates_staged')
+            tree.generate()
+            # Only the duplicate search is timed.
+            start = time.perf_counter()
+            tree.find_duplicates()
+        elif case == 'cli':
+            subprocess.run([sys.executable, os.path.join(REPOSITORY_DIR, 'tree.py'),
+                            tree_dir, '--list-duplicates'],
+                           check=True, stdout=subprocess.DEVNULL)
+            rss_of = resource.RUSAGE_CHILDREN if resource else None
+        elif case.startswith('records:'):
+            allocated = _record_memory(case.split(':', 1)[1], files)
+            bytes_per_file = allocated / len(files) if files else None
+        else:
+            error_msg = f"run_case(): case, {case}, does not exist."
+            raise ValueError(error_msg)
+        seconds = time.perf_counter() - start
+    return {'case': case,
+            'seconds': seconds,
+            'files': len(files),
+            'bytes': total_bytes,
+            'files_per_s': len(files) / seconds if seconds else None,
+            'mb_per_s': total_bytes / seconds / 1e6 if seconds else None,
+            'peak_rss_kb': _peak_rss_kb(rss_of) if resource else None,
+            'bytes_per_file': bytes_per_file}
+
+
+def run_suite(tree_dir, cases=None):
+    """
+    run_suite runs each case in x child process over tree_dir.
+    :param tree_dir: str, filepath of the tree to benchmark
+    :param cases: list of str, defaults to every case of suite_cases()
+    :return: list of run_case results
+    """
+    results = []
+    for case in cases or suite_cases():
+        child = subprocess.run([sys.executable, '-m', 'benchmarks.suite',
+                                '--run-case', case, '--tree', tree_dir],
+                               check=True, capture_output=True, text=True,
+                               cwd=REPOSITORY_DIR)
+        results.append(json.loads(child.stdout))
+        message = f"{case:>24}: {results[-1]['seconds']:.4f} seconds."
+        if results[-1]['bytes_per_file'] is not None:
+            message += f" {results[-1]['bytes_per_file']:.1f} bytes per file."
+        print(message, file=sys.stderr)
+    return results
+
+
+def compare_results(results, baseline, threshold=0.1):
+    """
+    compare_results finds the cases that got slower than in baseline by
+    more than threshold.
+    :param results: dict, results of this run as saved by the suite
+    :param baseline: dict, results of an earlier run as saved by the suite
+    :param threshold: float, tolerated relative slowdown, defaults to 0.1
+    :return: list of tuples of (case, baseline seconds, seconds)
+    """
+    previous = {result['case']: result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        old = previous.get(result['case'])
+        if old and result['seconds'] > old['seconds'] * (1 + threshold):
+            regressions.append((result['case'], old['seconds'], result['seconds']))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="suite",
+        description="Runs the duplicate-file-finder benchmark suite."
+    )
+    parser.add_argument("--tree", default=None,
+                        help="Benchmarks an existing tree instead of x "
+                             "synthetic one.")
+    parser.add_argument("--cases", nargs="+", default=None,
+                        choices=suite_cases(),
+                        help="Cases to run. Defaults to all of them.")
+    parser.add_argument("--output", default=None,
+                        help="Writes the JSON results to this file instead "
+                             "of stdout.")
+    parser.add_argument("--compare", default=None, metavar="BASELINE",
+                        help="JSON results of an earlier run. Exits with "
+                             "status 1 when x case got slower.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Tolerated relative slowdown for --compare. "
+                             "Defaults to 0.1.")
+    parser.add_argument("--run-case", default=None,
+                        help="Runs x single case and prints its result, used "
+                             "by the child processes.")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.tree)))
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        settings = tree_settings(args)
+        if args.tree:
+            tree_dir = args.tree
+            tree_summary = None
+        else:
+            tree_dir = os.path.join(tmp_dir, 'tree')
+            tree_summary = generate_tree(tree_dir, **settings)
+        results = {'version': RESULTS_VERSION,
+                   'rptree_version': __version__,
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'tree_settings': None if args.tree else settings,
+                   'tree': tree_summary,
+                   'results': run_suite(tree_dir, args.cases)}
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare, encoding='UTF-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        for case, old_seconds, seconds in regressions:
+            print(f"Regression: {case} took {seconds:.4f} seconds, "
+                  f"{old_seconds:.4f} before.", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,157 @@
+"""This module generates synthetic directory trees for the benchmarks.
+
+Run it from the repository root with:
+
+    python -m benchmarks.synthetic_tree TARGET_DIR [--depth 3] [--fanout 4] ...
+"""
+
+import argparse
+import math
+import os
+import random
+import shutil
+
+SIZE_DISTRIBUTIONS = ['fixed', 'uniform', 'lognormal']
+
+
+def _file_size(rng, distribution, mean_size, max_size):
+    """
+    _file_size draws x file size from distribution.
+    :param rng: random.Random
+    :param distribution: str, one of SIZE_DISTRIBUTIONS
+    :param mean_size: int, mean file size in bytes
+    :param max_size: int, largest file size in bytes
+    :return: int
+    """
+    match distribution:
+        case 'fixed':
+            size = mean_size
+        case 'uniform':
+            size = rng.randint(0, 2 * mean_size)
+        case 'lognormal':
+            # Most files are small and x few are very large, like real trees.
+            sigma = 1.5
+            size = int(rng.lognormvariate(math.log(mean_size) - sigma ** 2 / 2,
+                                          sigma))
+        case _:
+            error_msg = (f"Size distribution, {distribution}, has not been "
+                         f"implemented.")
+            raise NotImplementedError(error_msg)
+    return min(size, max_size)
+
+
+def generate_tree(target_dir, depth=3, fanout=4, files_per_dir=10,
+                  size_distribution='lognormal', mean_size=64 * 1024,
+                  max_size=64 * 1024 * 1024, duplicate_ratio=0.1,
+                  hardlink_ratio=0.0, seed=0):
+    """
+    generate_tree fills target_dir with x synthetic tree. Every directory
+    above depth holds fanout subdirectories, and every directory holds
+    files_per_dir files. Each file is, in turn, x copy of an earlier file
+    with probability duplicate_ratio, x hard link to an earlier file with
+    probability hardlink_ratio, or new random content. The same seed always
+    produces the same tree.
+    :param target_dir: str, filepath of the directory to fill, created if
+        it does not exist
+    :param depth: int, number of directory levels below target_dir
+    :param fanout: int, subdirectories per directory
+    :param files_per_dir: int, files per directory
+    :param size_distribution: str, one of SIZE_DISTRIBUTIONS
+    :param mean_size: int, mean file size in bytes
+    :param max_size: int, largest file size in bytes
+    :param duplicate_ratio: float, fraction of files copying an earlier file
+    :param hardlink_ratio: float, fraction of files hard linked to an
+        earlier file
+    :param seed: int, seed of the random generator
+    :return: dict with the keys directories, files, bytes, duplicates and
+        hardlinks
+    """
+    rng = random.Random(seed)
+    summary = {'directories': 0, 'files': 0, 'bytes': 0,
+               'duplicates': 0, 'hardlinks': 0}
+    originals = []
+    directories = [(target_dir, 0)]
+    while directories:
+        directory, level = directories.pop()
+        os.makedirs(directory, exist_ok=True)
+        summary['directories'] += 1
+        for idx in range(files_per_dir):
+            path = os.path.join(directory, f"file_{idx:04d}.bin")
+            choice = rng.random()
+            if originals and choice < hardlink_ratio:
+                os.link(rng.choice(originals), path)
+                summary['hardlinks'] += 1
+            elif originals and choice < hardlink_ratio + duplicate_ratio:
+                shutil.copyfile(rng.choice(originals), path)
+                summary['duplicates'] += 1
+            else:
+                size = _file_size(rng, size_distribution, mean_size, max_size)
+                with open(path, 'wb') as f:
+                    f.write(rng.randbytes(size))
+                originals.append(path)
+            summary['files'] += 1
+            summary['bytes'] += os.path.getsize(path)
+        if level < depth:
+            for idx in range(fanout):
+                directories.append((os.path.join(directory, f"dir_{idx:03d}"),
+                                    level + 1))
+    return summary
+
+
+def add_tree_arguments(parser):
+    """
+    add_tree_arguments adds the generate_tree settings to parser.
+    :param parser: argparse.ArgumentParser
+    :return: None
+    """
+    parser.add_argument("--depth", type=int, default=3,
+                        help="Directory levels. Defaults to 3.")
+    parser.add_argument("--fanout", type=int, default=4,
+                        help="Subdirectories per directory. Defaults to 4.")
+    parser.add_argument("--files-per-dir", type=int, default=10,
+                        help="Files per directory. Defaults to 10.")
+    parser.add_argument("--size-distribution", choices=SIZE_DISTRIBUTIONS,
+                        default='lognormal',
+                        help="File size distribution. Defaults to lognormal.")
+    parser.add_argument("--mean-size", type=int, default=64 * 1024,
+                        help="Mean file size in bytes. Defaults to 65536.")
+    parser.add_argument("--max-size", type=int, default=64 * 1024 * 1024,
+                        help="Largest file size in bytes. Defaults to 64 MiB.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1,
+                        help="Fraction of files copying an earlier file. "
+                             "Defaults to 0.1.")
+    parser.add_argument("--hardlink-ratio", type=float, default=0.0,
+                        help="Fraction of files hard linked to an earlier "
+                             "file. Defaults to 0.0.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed. Defaults to 0.")
+
+
+def tree_settings(args):
+    """
+    tree_settings collects the generate_tree keyword arguments from args
+    parsed by x parser set up with add_tree_arguments.
+    :param args: argparse.Namespace
+    :return: dict
+    """
+    return {'depth': args.depth,
+            'fanout': args.fanout,
+            'files_per_dir': args.files_per_dir,
+            'size_distribution': args.size_distribution,
+            'mean_size': args.mean_size,
+            'max_size': args.max_size,
+            'duplicate_ratio': args.duplicate_ratio,
+            'hardlink_ratio': args.hardlink_ratio,
+            'seed': args.seed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="synthetic_tree",
+        description="Generates x synthetic directory tree for benchmarks."
+    )
+    parser.add_argument("target_dir", metavar="TARGET_DIR",
+                        help="Directory to fill.")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+    print(generate_tree(args.target_dir, **tree_settings(args)))
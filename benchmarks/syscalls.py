@@ -0,0 +1,142 @@
+"""This module compares the system calls made by the old pathlib walker
+and the os.scandir walker of _TreeDiagramGenerator.
+
+Run it from the repository root with:
+
+    python -m benchmarks.syscalls ROOT_DIR
+
+Both walkers list the tree without hashing. Each one runs in x child
+process under strace -c when strace is installed, and the directory
+listing, stat and open calls are counted. Without strace only the wall
+clock times are reported.
+"""
+
+import argparse
+import io
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from rptree.rptree import _TreeDiagramGenerator
+
+WALKERS = ['pathlib', 'scandir']
+COUNTED_SYSCALLS = ['getdents64', 'getdents', 'openat', 'open', 'stat',
+                    'lstat', 'fstat', 'newfstatat', 'statx']
+
+
+def walk_pathlib(root_dir):
+    """
+    walk_pathlib replicates the walker _TreeDiagramGenerator used before it
+    moved to os.scandir: Path.iterdir, x sort on is_file, is_dir again for
+    every entry and x stat for every file.
+    :param root_dir: str, filepath of the directory to walk
+    :return: int, number of entries walked
+    """
+    count = 0
+    directories = [pathlib.Path(root_dir)]
+    while directories:
+        entries = sorted(directories.pop().iterdir(),
+                         key=lambda entry: entry.is_file())
+        for entry in entries:
+            count += 1
+            if entry.is_dir():
+                directories.append(entry)
+            else:
+                entry.stat()
+    return count
+
+
+def walk_scandir(root_dir):
+    """
+    walk_scandir runs the current _TreeDiagramGenerator walk with hashing
+    suppressed.
+    :param root_dir: str, filepath of the directory to walk
+    :return: int, number of lines in the diagram
+    """
+    quiet = io.StringIO()
+    stdout = sys.stdout
+    sys.stdout = quiet
+    try:
+        generator = _TreeDiagramGenerator(root_dir, suppress_hash=True,
+                                          keep_records=False,
+                                          progress_stream=quiet)
+        return sum(1 for _ in generator.iter_tree())
+    finally:
+        sys.stdout = stdout
+
+
+def count_syscalls(walker, root_dir):
+    """
+    count_syscalls runs walker over root_dir in x child process under
+    strace -c and returns the number of calls made to each of
+    COUNTED_SYSCALLS. It returns None when strace is not installed.
+    :param walker: str, one of WALKERS
+    :param root_dir: str, filepath of the directory to walk
+    :return: dict of str to int, or None
+    """
+    strace = shutil.which('strace')
+    if strace is None:
+        return None
+    with tempfile.NamedTemporaryFile(mode='r', suffix='.strace') as summary:
+        subprocess.run([strace, '-f', '-c', '-o', summary.name,
+                        sys.executable, '-m', 'benchmarks.syscalls',
+                        '--walker', walker, root_dir],
+                       check=True, stdout=subprocess.DEVNULL)
+        counts = {}
+        for line in summary:
+            fields = line.split()
+            if fields and fields[-1] in COUNTED_SYSCALLS:
+                # The errors column is empty for calls that never failed.
+                counts[fields[-1]] = int(fields[3])
+    return counts
+
+
+def benchmark_walkers(root_dir):
+    """
+    benchmark_walkers times each walker over root_dir and counts its
+    system calls when strace is available.
+    :param root_dir: str, filepath of the directory to walk
+    :return: list of dicts with the keys walker, seconds and syscalls
+    """
+    results = []
+    for walker in WALKERS:
+        walk = walk_pathlib if walker == 'pathlib' else walk_scandir
+        start = time.perf_counter()
+        walk(root_dir)
+        results.append({'walker': walker,
+                        'seconds': time.perf_counter() - start,
+                        'syscalls': count_syscalls(walker, root_dir)})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="syscalls",
+        description="Compares the system calls of the tree walkers."
+    )
+    parser.add_argument("root_dir", metavar="ROOT_DIR",
+                        help="Directory to walk.")
+    parser.add_argument("--walker", choices=WALKERS, default=None,
+                        help="Runs only this walker, used by the strace child "
+                             "process.")
+    args = parser.parse_args()
+    if not os.path.isdir(args.root_dir):
+        print(f"{args.root_dir}, does not exist or is not a directory.")
+        sys.exit(1)
+    if args.walker == 'pathlib':
+        walk_pathlib(args.root_dir)
+    elif args.walker == 'scandir':
+        walk_scandir(args.root_dir)
+    else:
+        for result in benchmark_walkers(args.root_dir):
+            print(f"{result['walker']:>8}: {result['seconds']:.4f} seconds.")
+            if result['syscalls'] is None:
+                print("          strace is not installed, system calls "
+                      "were not counted.")
+            else:
+                for name, calls in sorted(result['syscalls'].items()):
+                    print(f"          {name}: {calls}")
@@ -2,4 +2,25 @@
 
 __version__ = '0.4.0'
 
-from .file_functions import file_hash, FileObject, DirectoryObject
+from .file_functions import (file_hash, partial_file_hash, sampled_file_hash,
+                             FileObject, DirectoryObject, FileRecord, IO_MODES,
+                             HASH_BLOCK_SIZE, PARTIAL_HASH_BLOCK_SIZE,
+                             SAMPLE_COUNT, SAMPLED_HASH_MIN_SIZE,
+                             HASH_ALGORITHMS,
+                             CRYPTOGRAPHIC_ALGORITHMS, register_hash_algorithm,
+                             resolve_algorithm)
+from .duplicate_functions import (find_duplicate_groups, group_by_hash,
+                                  confirm_groups, split_hard_links,
+                                  reclaimable_bytes, verify_groups,
+                                  StageReport, VerifyReport, VERIFY_BLOCK_SIZE,
+                                  VERIFY_MAX_OPEN_FILES)
+from .record_store import RecordStore, RecordView
+
+
+def __getattr__(name):
+    # HashCache loads sqlite3, so it is only imported once it is used.
+    if name == 'HashCache':
+        from .hash_cache import HashCache
+        return HashCache
+    error_msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(error_msg)
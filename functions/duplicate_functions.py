@@ -0,0 +1,422 @@
+"""This module supplies the staged duplicate search for duplicate-file-finder."""
+
+from collections import namedtuple
+from time import perf_counter
+
+from .file_functions import (file_hash, partial_file_hash, partial_hash_length,
+                             sampled_file_hash, sampled_hash_length,
+                             _advise_sequential, PARTIAL_HASH_BLOCK_SIZE,
+                             SAMPLE_COUNT, SAMPLED_HASH_MIN_SIZE)
+
+VERIFY_BLOCK_SIZE = 1024 * 1024
+VERIFY_MAX_OPEN_FILES = 64
+
+StageReport = namedtuple('StageReport',
+                         ['stage', 'files', 'bytes_read', 'bytes_avoided'])
+VerifyReport = namedtuple('VerifyReport',
+                          ['groups', 'files', 'bytes_read', 'seconds',
+                           'mismatches', 'unreadable'])
+
+
+def _group_candidates(candidates, key):
+    """
+    _group_candidates splits candidates into groups sharing the same key
+    value and keeps only the groups with more than one member. The first
+    appearance of each key fixes the order of the groups.
+    :param candidates: list of tuples of (index, FileRecord)
+    :param key: callable returning the grouping value of x candidate
+    :return: list of lists of candidates
+    """
+    groups = {}
+    for candidate in candidates:
+        groups.setdefault(key(candidate), []).append(candidate)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _inode_key(idx, record):
+    """
+    _inode_key returns the key identifying the data of x record: its inode
+    when it is one of several hard links, else its own index, since x file
+    with x single link shares its data with no other path.
+    :param idx: int, index of the record
+    :param record: FileRecord
+    :return: tuple or int
+    """
+    return idx if record.inode is None else record.inode
+
+
+def split_hard_links(group):
+    """
+    split_hard_links splits x group of records with the same content into
+    the hard links of each inode. The first list holds the first record of
+    the group.
+    :param group: list of FileRecord
+    :return: list of lists of FileRecord, one per inode, in group order
+    """
+    inodes = {}
+    for idx, record in enumerate(group):
+        inodes.setdefault(_inode_key(idx, record), []).append(record)
+    return list(inodes.values())
+
+
+def reclaimable_bytes(group):
+    """
+    reclaimable_bytes returns the bytes freed by keeping x single copy of
+    the content of group. Hard links of the same inode take no extra space,
+    so only the inodes beyond the first count.
+    :param group: list of FileRecord with the same content
+    :return: int
+    """
+    return group[0].size * (len(split_hard_links(group)) - 1)
+
+
+def group_by_hash(records):
+    """
+    group_by_hash groups records sharing the same hash value in x single
+    pass. Records without x hash are ignored.
+    :param records: list of FileRecord, in the order they appear in the tree
+    :return: list of lists of FileRecord with more than one member, ordered
+        by their first appearance in records
+    """
+    groups = {}
+    for record in records:
+        if record.hash is not None:
+            groups.setdefault(record.hash, []).append(record)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicate_groups(records, algorithm='sha256',
+                          block_size=PARTIAL_HASH_BLOCK_SIZE,
+                          hash_function=file_hash, samples=SAMPLE_COUNT,
+                          sample_min_size=SAMPLED_HASH_MIN_SIZE):
+    """
+    find_duplicate_groups runs the staged duplicate search over records.
+    Files are grouped by size first. Only files sharing their size with
+    another file get x partial hash of their first and last block_size
+    bytes. Files of at least sample_min_size bytes still colliding after
+    that get x sampled fingerprint of samples blocks spread across them,
+    and only files still colliding after that are read completely by
+    file_hash. Files no larger than two blocks are never read twice,
+    because their partial hash already covers all of their content, and
+    hard links of the same inode are only read once.
+    :param records: list of FileRecord, in the order they appear in the tree
+    :param algorithm: str, hash algorithm, see file_hash for valid values
+    :param block_size: int, number of bytes partial hashing reads at each
+        end of x file
+    :param hash_function: callable with the signature of file_hash used
+        for the full hash stage, defaults to file_hash
+    :param samples: int, defaults to 16, number of blocks of block_size
+        bytes the sampled stage reads from each file, 0 skips the stage
+    :param sample_min_size: int, defaults to 8 MiB, size below which files
+        skip the sampled stage, as reading them completely costs little
+    :return: tuple of (groups, reports), groups being x list of lists of
+        FileRecord with their hash filled in, ordered by their first
+        appearance in records, and reports being x list of StageReport,
+        one per stage
+    """
+    reports = []
+    candidates = list(enumerate(records))
+    total_bytes = sum(record.size for record in records)
+
+    # Stage 1: x file with x unique size cannot have x duplicate.
+    size_groups = _group_candidates(candidates, key=lambda c: c[1].size)
+    remaining = [c for group in size_groups for c in group]
+    bytes_avoided = total_bytes - sum(record.size for _, record in remaining)
+    reports.append(StageReport('size', len(candidates), 0, bytes_avoided))
+
+    # Stage 2: compare the first and last blocks of same size files.
+    partial_hashes = {}
+    inode_hashes = {}
+    bytes_read = 0
+    for idx, record in remaining:
+        inode = _inode_key(idx, record)
+        if inode not in inode_hashes:
+            inode_hashes[inode] = partial_file_hash(record.path, algorithm,
+                                                    block_size)
+            bytes_read += partial_hash_length(record.size, block_size)
+        partial_hashes[idx] = inode_hashes[inode]
+    partial_groups = []
+    for group in size_groups:
+        partial_groups += _group_candidates(group,
+                                            key=lambda c: partial_hashes[c[0]])
+    survivors = [c for group in partial_groups for c in group]
+    survivor_indexes = {idx for idx, _ in survivors}
+    # Bytes neither read here nor left for the full hash stage to read.
+    bytes_avoided = sum(record.size for _, record in remaining) - bytes_read
+    bytes_avoided -= sum(record.size - partial_hash_length(record.size,
+                                                           block_size)
+                         for idx, record in remaining
+                         if idx in survivor_indexes)
+    reports.append(StageReport('partial hash', len(remaining),
+                               bytes_read, bytes_avoided))
+
+    # Stage 3: fingerprint large files from blocks spread across them.
+    sampled_groups = []
+    sampled_inodes = {}
+    unread_bytes = {}
+    sampled_files = 0
+    bytes_read = 0
+    for group in partial_groups:
+        if samples < 1 or group[0][1].size < sample_min_size:
+            sampled_groups.append(group)
+            continue
+        sampled_hashes = {}
+        sampled_files += len(group)
+        for idx, record in group:
+            inode = _inode_key(idx, record)
+            if inode not in sampled_inodes:
+                sampled_inodes[inode] = sampled_file_hash(record.path, algorithm,
+                                                          samples, block_size)
+                sampled_bytes = sampled_hash_length(record.size, samples,
+                                                    block_size)
+                unread_bytes[inode] = record.size - sampled_bytes
+                bytes_read += sampled_bytes
+            sampled_hashes[idx] = sampled_inodes[inode]
+        sampled_groups += _group_candidates(group,
+                                            key=lambda c: sampled_hashes[c[0]])
+    # Bytes of the files told apart that neither this stage nor the full
+    # hash stage reads. The samples of the files left to the full hash
+    # stage are not deducted, so the count cannot go negative.
+    sampled_survivors = {_inode_key(idx, record)
+                         for group in sampled_groups for idx, record in group}
+    bytes_avoided = sum(unread for inode, unread in unread_bytes.items()
+                        if inode not in sampled_survivors)
+    reports.append(StageReport('sampled hash', sampled_files, bytes_read,
+                               bytes_avoided))
+    survivors = [c for group in sampled_groups for c in group]
+
+    # Stage 4: full hashes, reusing partial hashes that covered whole files.
+    full_hashes = {}
+    inode_hashes = {}
+    bytes_read = 0
+    bytes_avoided = 0
+    for idx, record in survivors:
+        inode = _inode_key(idx, record)
+        if record.size <= 2 * block_size:
+            full_hashes[idx] = partial_hashes[idx]
+        elif inode in inode_hashes:
+            full_hashes[idx] = inode_hashes[inode]
+            bytes_avoided += record.size
+        else:
+            full_hashes[idx] = hash_function(record.path, algorithm)
+            inode_hashes[inode] = full_hashes[idx]
+            bytes_read += record.size
+    duplicate_groups = []
+    for group in sampled_groups:
+        duplicate_groups += _group_candidates(group,
+                                              key=lambda c: full_hashes[c[0]])
+    reports.append(StageReport('full hash', len(survivors), bytes_read,
+                               bytes_avoided))
+
+    duplicate_groups.sort(key=lambda group: group[0][0])
+    groups = [[record._replace(hash=full_hashes[idx]) for idx, record in group]
+              for group in duplicate_groups]
+    return groups, reports
+
+
+def confirm_groups(groups, algorithm, hash_function=file_hash):
+    """
+    confirm_groups re-hashes the members of each duplicate group with
+    algorithm, normally x cryptographic one confirming x group found with
+    x fast non-cryptographic hash. Only files already in x group are read,
+    and hard links of the same inode only once.
+    Groups whose members no longer agree are split, and members left on
+    their own are dropped.
+    :param groups: list of lists of FileRecord
+    :param algorithm: str, see file_hash for valid values
+    :param hash_function: callable with the signature of file_hash,
+        defaults to file_hash
+    :return: list of lists of FileRecord carrying the algorithm's hashes,
+        in the order of groups
+    """
+    confirmed = []
+    for group in groups:
+        inode_hashes = {}
+        records = []
+        for idx, record in enumerate(group):
+            inode = _inode_key(idx, record)
+            if inode not in inode_hashes:
+                inode_hashes[inode] = hash_function(record.path, algorithm)
+            records.append(record._replace(hash=inode_hashes[inode]))
+        confirmed += group_by_hash(records)
+    return confirmed
+
+
+def _compare_with_reference(records, reference, batch, block_size):
+    """
+    _compare_with_reference reads the file of reference and the files of
+    batch side by side, block_size bytes of each at x time. x file stops
+    being read as soon as it differs from the reference, and the reading
+    stops when no file is left matching it.
+    :param records: list of FileRecord
+    :param reference: int, index into records of the reference file
+    :param batch: list of int, indexes into records of the files compared
+        with it
+    :param block_size: int, bytes read from each file at x time
+    :return: tuple of (matches, failed, bytes_read), matches being the
+        indexes of batch identical to the reference and failed the indexes,
+        the reference's included, of the files that could not be read
+    """
+    files = {}
+    failed = []
+    bytes_read = 0
+    try:
+        for idx in [reference] + batch:
+            try:
+                f = open(records[idx].path, 'rb', buffering=0)
+            except OSError:
+                failed.append(idx)
+                continue
+            files[idx] = f
+            _advise_sequential(f)
+        if reference not in files:
+            return [], failed, bytes_read
+        buffer = bytearray(block_size)
+        other_buffer = bytearray(block_size)
+        reading = [idx for idx in batch if idx in files]
+        while reading:
+            try:
+                length = files[reference].readinto(buffer)
+            except OSError:
+                failed.append(reference)
+                return [], failed, bytes_read
+            bytes_read += length
+            still_reading = []
+            for idx in reading:
+                try:
+                    other_length = files[idx].readinto(other_buffer)
+                except OSError:
+                    failed.append(idx)
+                    continue
+                bytes_read += other_length
+                if other_length != length:
+                    continue
+                if length == block_size:
+                    same = buffer == other_buffer
+                else:
+                    same = buffer[:length] == other_buffer[:length]
+                if same:
+                    still_reading.append(idx)
+            if not length:
+                # The reference ended, and so did the files still matching it.
+                return still_reading, failed, bytes_read
+            reading = still_reading
+        return [], failed, bytes_read
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def _compare_files(records, block_size=VERIFY_BLOCK_SIZE,
+                   max_open_files=VERIFY_MAX_OPEN_FILES):
+    """
+    _compare_files splits the files of records into sets of files with the
+    same content. The first file is taken as reference and the others are
+    compared with it in batches, so that no more than max_open_files files
+    are open at once. The files that differ from the reference are compared
+    again, with x reference of their own, until none are left. Files that
+    cannot be read are left out of every set.
+    :param records: list of FileRecord
+    :param block_size: int, bytes read from each file at x time
+    :param max_open_files: int, at least 2, files open at once
+    :return: tuple of (partitions, bytes_read, unreadable), partitions
+        being x list of lists of indexes into records, each list holding
+        files with the same content, and unreadable the indexes of the
+        files that could not be read
+    """
+    partitions = []
+    unreadable = []
+    bytes_read = 0
+    remaining = list(range(len(records)))
+    while remaining:
+        reference = remaining[0]
+        others = remaining[1:]
+        same = [reference]
+        remaining = []
+        for start in range(0, len(others), max_open_files - 1):
+            batch = others[start:start + max_open_files - 1]
+            matches, failed, batch_bytes = _compare_with_reference(
+                records, reference, batch, block_size)
+            bytes_read += batch_bytes
+            unreadable += failed
+            if reference in failed:
+                # The files are compared again, with another reference.
+                dropped = set(unreadable)
+                remaining = [idx for idx in others if idx not in dropped]
+                break
+            matched = set(matches).union(failed)
+            same += matches
+            remaining += [idx for idx in batch if idx not in matched]
+        else:
+            partitions.append(same)
+    partitions.sort()
+    return partitions, bytes_read, unreadable
+
+
+def verify_groups(groups, block_size=VERIFY_BLOCK_SIZE,
+                  max_open_files=VERIFY_MAX_OPEN_FILES):
+    """
+    verify_groups compares the members of each duplicate group byte by
+    byte, proving that files with the same hash are identical. The members
+    of x group are read side by side with x reference member, in batches
+    of at most max_open_files files, and x member is dropped at the first
+    block that differs from the reference. Hard links of one inode are the
+    same data, so only one of them is read. x member that cannot be read
+    is dropped from its group instead of failing the verification.
+    :param groups: list of lists of FileRecord with the same hash
+    :param block_size: int, defaults to 1 MiB, bytes read from each file
+        at x time
+    :param max_open_files: int, defaults to 64, at least 2, files open at
+        once
+    :return: tuple of (verified, report), verified being the list of lists
+        of FileRecord proven identical, in the order of groups, and report
+        x VerifyReport whose mismatches lists the FileRecords that differed
+        from the rest of their group, and unreadable those that could not
+        be read
+    """
+    if max_open_files < 2:
+        error_msg = (f"verify_groups(): max_open_files, {max_open_files}, "
+                     f"must be at least 2.")
+        raise ValueError(error_msg)
+    start = perf_counter()
+    verified = []
+    mismatches = []
+    unreadable = []
+    bytes_read = 0
+    files = 0
+    for group in groups:
+        # The first record of each inode is read for all of its links.
+        first_links = {}
+        for idx, record in enumerate(group):
+            first_links.setdefault(_inode_key(idx, record), record)
+        leaders = list(first_links.values())
+        if len(leaders) == 1:
+            verified.append(group)
+            continue
+        partitions, group_bytes, failed = _compare_files(leaders, block_size,
+                                                          max_open_files)
+        files += len(leaders)
+        bytes_read += group_bytes
+        leader_partition = {}
+        for number, partition in enumerate(partitions):
+            for idx in partition:
+                leader_partition[id(leaders[idx])] = number
+        # The links of an unreadable file are dropped along with it.
+        for idx in failed:
+            leader_partition[id(leaders[idx])] = None
+        members = [[] for _ in partitions]
+        for idx, record in enumerate(group):
+            leader = first_links[_inode_key(idx, record)]
+            number = leader_partition[id(leader)]
+            if number is None:
+                unreadable.append(record)
+            else:
+                members[number].append(record)
+        for partition, records in zip(partitions, members):
+            if len(partition) > 1:
+                verified.append(records)
+            else:
+                mismatches += records
+    report = VerifyReport(len(groups), files, bytes_read,
+                          perf_counter() - start, mismatches, unreadable)
+    return verified, report
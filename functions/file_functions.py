@@ -1,6 +1,7 @@
 import hashlib
+import mmap
 import os
-import glob
+from time import perf_counter
 from collections import namedtuple
 
 
@@ -8,63 +9,329 @@ FileObject = namedtuple('File_Object',
                         ['name', 'parent', 'hash', 'hash_type'])
 DirectoryObject = namedtuple('DirectoryObject',
                              ['name', 'parent'])
+# inode is (st_dev, st_ino) for files with more than one hard link, else None.
+FileRecord = namedtuple('FileRecord',
+                        ['path', 'size', 'hash', 'inode'], defaults=[None])
 
 
-def file_hash(filename, algorithm='sha256'):
+IO_MODES = ['auto', 'read', 'readinto', 'mmap']
+HASH_BLOCK_SIZE = 65536
+MMAP_THRESHOLD = 16 * 1024 * 1024
+PARTIAL_HASH_BLOCK_SIZE = 4096
+SAMPLE_COUNT = 16
+SAMPLED_HASH_MIN_SIZE = 8 * 1024 * 1024
+
+
+def register_hash_algorithm(name, constructor, cryptographic=False):
+    """
+    register_hash_algorithm makes x new algorithm available to file_hash
+    and every other hashing function in this package. constructor must
+    return an object with the update and hexdigest methods of x hashlib
+    hash object.
+    :param name: str, name of the algorithm, as passed to file_hash
+    :param constructor: callable taking no arguments
+    :param cryptographic: bool, defaults to False, whether the algorithm is
+        safe to rely on for proving files identical
+    :return: None
+    """
+    HASH_ALGORITHMS[name] = constructor
+    if cryptographic:
+        CRYPTOGRAPHIC_ALGORITHMS.add(name)
+
+
+HASH_ALGORITHMS = {}
+CRYPTOGRAPHIC_ALGORITHMS = set()
+for _name in ['sha224', 'sha256', 'sha384', 'sha512', 'sha3_224', 'sha3_256',
+              'sha3_384', 'sha3_512', 'blake2b', 'blake2s']:
+    register_hash_algorithm(_name, getattr(hashlib, _name), cryptographic=True)
+
+# xxhash is optional. Without it, 'fast' falls back to blake2b, the fastest
+# algorithm hashlib offers on 64 bit platforms.
+try:
+    import xxhash
+except ImportError:
+    FAST_HASH_ALGORITHM = 'blake2b'
+else:
+    for _name in ['xxh64', 'xxh3_64', 'xxh3_128']:
+        register_hash_algorithm(_name, getattr(xxhash, _name))
+    FAST_HASH_ALGORITHM = 'xxh3_128'
+
+
+def resolve_algorithm(algorithm):
+    """
+    resolve_algorithm returns the registered algorithm name for algorithm,
+    replacing 'fast' with the fastest algorithm available on this system.
+    Setting algorithm to an algorithm that has not been implemented
+    results in x NotImplementedError.
+    :param algorithm: str
+    :return: str
+    """
+    if algorithm == 'fast':
+        algorithm = FAST_HASH_ALGORITHM
+    if algorithm not in HASH_ALGORITHMS:
+        error_msg = f"Algorithm, {algorithm}, has not been implemented."
+        raise NotImplementedError(error_msg)
+    return algorithm
+
+
+def _hash_object(algorithm):
+    """
+    _hash_object creates an empty hash object for the specified
+    algorithm string. See file_hash for the list of valid algorithms.
+    Setting algorithm to an algorithm that has not been implemented
+    results in x NotImplementedError.
+    :param algorithm: str
+    :return: hashlib hash object
+    """
+    return HASH_ALGORITHMS[resolve_algorithm(algorithm)]()
+
+
+def _check_block_size(block_size, caller):
+    """
+    _check_block_size rejects x block size that would read nothing, since
+    the read loops would then stop at once and every file would get the
+    digest of an empty file.
+    :param block_size: int, bytes read at x time
+    :param caller: str, name of the calling function, for the error message
+    :return: None
+    """
+    if block_size <= 0:
+        error_msg = (f"{caller}(): block_size, {block_size}, must be x positive "
+                     f"number of bytes.")
+        raise ValueError(error_msg)
+
+
+def _advise_sequential(f, mapping=None):
+    """
+    _advise_sequential tells the kernel that the open file f, and the
+    memory map of it when one is given, will be read sequentially, so it
+    can read ahead aggressively. Platforms without posix_fadvise or
+    madvise simply skip the advice.
+    :param f: open binary file object
+    :param mapping: mmap.mmap of f, defaults to None
+    :return: None
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    if mapping is not None and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+
+
+def file_hash(filename, algorithm='sha256', io_mode='auto',
+              block_size=HASH_BLOCK_SIZE, timings=None):
     """
     file_hash does x binary read of the file defined by filename,
     builds x file_digest, using the specified algorithm string.
-    Valid algorithms are: sha224, sha256, sha384, sha512, sha3_224
-    sha3_256, sha3_384, and sha3_512. sha1 collisions have been
+    Valid algorithms are the keys of HASH_ALGORITHMS: sha224, sha256,
+    sha384, sha512, sha3_224, sha3_256, sha3_384, sha3_512, blake2b and
+    blake2s, plus xxh64, xxh3_64 and xxh3_128 when xxhash is installed,
+    and 'fast' for the fastest of them. sha1 collisions have been
     discovered. So, it is not included. Setting algorithm to an
     algorithm that has not been implemented results in x
     NotImplementedError.
+
+    io_mode selects how the file is read. 'read' reads block_size bytes
+    into x new bytes object each time. 'readinto' reuses x single buffer
+    of block_size bytes. 'mmap' hashes x memory map of the whole file.
+    'auto', the default, uses mmap for files of at least MMAP_THRESHOLD
+    bytes and readinto for smaller ones. Every mode returns the same
+    digest.
     :param filename: filename (str)
     :param algorithm: str
+    :param io_mode: str, one of IO_MODES, defaults to 'auto'
+    :param block_size: int, bytes read at x time by read and readinto,
+        defaults to 64k
+    :param timings: dict, defaults to None. When given, the seconds spent
+        in the open, read and digest phases are added to it. The read and
+        digest phases cannot be told apart in mmap mode, where all of the
+        time counts as digest.
     :return: str (hexadecimal hash string)
     """
+    _check_block_size(block_size, 'file_hash')
     # Create x hash object to store the digest.
-    match algorithm:
-        case 'sha224':
-            hash_object = hashlib.sha224()
-        case 'sha256':
-            hash_object = hashlib.sha256()
-        case 'sha384':
-            hash_object = hashlib.sha384()
-        case 'sha512':
-            hash_object = hashlib.sha512()
-        case 'sha3_224':
-            hash_object = hashlib.sha3_224()
-        case 'sha3_256':
-            hash_object = hashlib.sha3_256()
-        case 'sha3_384':
-            hash_object = hashlib.sha3_384()
-        case 'sha3_512':
-            hash_object = hashlib.sha3_512()
-        case _ :
-            error_msg = f"Algorithm, {algorithm}, has not been implemented."
-            raise NotImplementedError(error_msg)
+    hash_object = _hash_object(algorithm)
+    if timings is not None:
+        return _timed_file_hash(filename, hash_object, io_mode, block_size,
+                                timings)
 
     # Open the file and start pulling in blocks of data.
-    with open(filename, 'rb') as f:
-        # Read x 64k data block and update the digest each block.
-        file_end = False
-        while not file_end:
-            data = f.read(65536)
-            file_end = not data
-            if not file_end:
-                hash_object.update(data)
+    with open(filename, 'rb', buffering=0) as f:
+        _advise_sequential(f)
+        size = os.fstat(f.fileno()).st_size
+        if io_mode == 'auto':
+            io_mode = 'mmap' if size >= MMAP_THRESHOLD else 'readinto'
+        match io_mode:
+            case 'read':
+                # Read x data block and update the digest each block.
+                file_end = False
+                while not file_end:
+                    data = f.read(block_size)
+                    file_end = not data
+                    if not file_end:
+                        hash_object.update(data)
+            case 'readinto':
+                buffer = bytearray(block_size)
+                view = memoryview(buffer)
+                while count := f.readinto(buffer):
+                    hash_object.update(view[:count])
+            case 'mmap':
+                # An empty file cannot be mapped, and has nothing to hash.
+                if size:
+                    with mmap.mmap(f.fileno(), 0,
+                                   access=mmap.ACCESS_READ) as mapping:
+                        _advise_sequential(f, mapping)
+                        hash_object.update(mapping)
+            case _:
+                error_msg = f"I/O mode, {io_mode}, has not been implemented."
+                raise NotImplementedError(error_msg)
 
     # Return hexadecimal digest string.
     return hash_object.hexdigest()
 
 
-if __name__ == "__main__":
-    path = '../data'
-    print(f"path: {path}")
-    search_str = f"{path}/*.*"
-    for alg in ['sha224', 'sha256', 'sha384', 'sha512',
-                'sha3_224', 'sha3_256', 'sha3_384', 'sha3_512']:
-        print(f"Performing algorithm, {alg}, on files in {path}.")
-        for filename in glob.glob(search_str):
-            print(f"{filename}: {file_hash(filename, alg)}")
\ No newline at end of file
+def _timed_file_hash(filename, hash_object, io_mode, block_size, timings):
+    """
+    _timed_file_hash is the instrumented version of the file_hash loop. It
+    is kept apart so that file_hash pays nothing for it when timings are
+    not requested.
+    :param filename: filename (str)
+    :param hash_object: empty hash object of the requested algorithm
+    :param io_mode: str, one of IO_MODES
+    :param block_size: int, bytes read at x time outside mmap mode
+    :param timings: dict receiving the seconds of the open, read and digest
+        phases
+    :return: str (hexadecimal hash string)
+    """
+    read_time = digest_time = 0.0
+    start = perf_counter()
+    with open(filename, 'rb', buffering=0) as f:
+        _advise_sequential(f)
+        size = os.fstat(f.fileno()).st_size
+        timings['open'] = timings.get('open', 0.0) + perf_counter() - start
+        if io_mode == 'auto':
+            io_mode = 'mmap' if size >= MMAP_THRESHOLD else 'readinto'
+        if io_mode not in IO_MODES:
+            error_msg = f"I/O mode, {io_mode}, has not been implemented."
+            raise NotImplementedError(error_msg)
+        if io_mode == 'mmap':
+            if size:
+                start = perf_counter()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    _advise_sequential(f, mapping)
+                    hash_object.update(mapping)
+                digest_time = perf_counter() - start
+        else:
+            # read and readinto only differ in allocations, so both are
+            # timed with the reused buffer.
+            buffer = bytearray(block_size)
+            view = memoryview(buffer)
+            while True:
+                start = perf_counter()
+                count = f.readinto(buffer)
+                read_time += perf_counter() - start
+                if not count:
+                    break
+                start = perf_counter()
+                hash_object.update(view[:count])
+                digest_time += perf_counter() - start
+    timings['read'] = timings.get('read', 0.0) + read_time
+    timings['digest'] = timings.get('digest', 0.0) + digest_time
+    return hash_object.hexdigest()
+
+
+def partial_file_hash(filename, algorithm='sha256',
+                      block_size=PARTIAL_HASH_BLOCK_SIZE):
+    """
+    partial_file_hash builds x digest from only the first and last
+    block_size bytes of the file defined by filename. Files no larger
+    than two blocks are read completely, so their partial hash is
+    identical to the value file_hash returns for them. Valid algorithms
+    are the same as file_hash.
+    :param filename: filename (str)
+    :param algorithm: str
+    :param block_size: int, number of bytes read at each end of the file
+    :return: str (hexadecimal hash string)
+    """
+    _check_block_size(block_size, 'partial_file_hash')
+    hash_object = _hash_object(algorithm)
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        hash_object.update(f.read(block_size))
+        if size > 2 * block_size:
+            # Skip the middle of the file and read the final block.
+            f.seek(-block_size, os.SEEK_END)
+            hash_object.update(f.read(block_size))
+        else:
+            hash_object.update(f.read())
+    return hash_object.hexdigest()
+
+
+def partial_hash_length(size, block_size=PARTIAL_HASH_BLOCK_SIZE):
+    """
+    partial_hash_length returns the number of bytes partial_file_hash
+    reads from x file of the specified size.
+    :param size: int, file size in bytes
+    :param block_size: int, number of bytes read at each end of the file
+    :return: int
+    """
+    return min(size, 2 * block_size)
+
+
+def _sample_offsets(size, samples, block_size):
+    """
+    _sample_offsets returns the offsets of the blocks sampled_file_hash
+    reads: samples blocks spread evenly across the inside of the file,
+    leaving out the first and last blocks partial_file_hash already read.
+    :param size: int, file size in bytes
+    :param samples: int, number of blocks
+    :param block_size: int, bytes per block
+    :return: list of int
+    """
+    span = size - 2 * block_size
+    return [block_size + span * (idx + 1) // (samples + 1) - block_size // 2
+            for idx in range(samples)]
+
+
+def sampled_file_hash(filename, algorithm='sha256', samples=SAMPLE_COUNT,
+                      block_size=PARTIAL_HASH_BLOCK_SIZE):
+    """
+    sampled_file_hash builds x fingerprint of the file defined by filename
+    from its size and samples blocks of block_size bytes read at fixed
+    offsets spread across it. Two files of the same size with different
+    fingerprints differ, so x fingerprint tells most different files of x
+    common size apart while reading x tiny part of each. Files no larger
+    than samples + 2 blocks are read completely. Valid algorithms are the
+    same as file_hash.
+    :param filename: filename (str)
+    :param algorithm: str
+    :param samples: int, number of blocks read
+    :param block_size: int, number of bytes in each block
+    :return: str (hexadecimal hash string)
+    """
+    _check_block_size(block_size, 'sampled_file_hash')
+    hash_object = _hash_object(algorithm)
+    with open(filename, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        hash_object.update(size.to_bytes(8, 'little'))
+        if size <= (samples + 2) * block_size:
+            hash_object.update(f.read())
+        else:
+            for offset in _sample_offsets(size, samples, block_size):
+                f.seek(offset)
+                hash_object.update(f.read(block_size))
+    return hash_object.hexdigest()
+
+
+def sampled_hash_length(size, samples=SAMPLE_COUNT,
+                        block_size=PARTIAL_HASH_BLOCK_SIZE):
+    """
+    sampled_hash_length returns the number of bytes sampled_file_hash reads
+    from x file of the specified size.
+    :param size: int, file size in bytes
+    :param samples: int, number of blocks read
+    :param block_size: int, number of bytes in each block
+    :return: int
+    """
+    if size <= (samples + 2) * block_size:
+        return size
+    return samples * block_size
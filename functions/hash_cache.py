@@ -0,0 +1,207 @@
+"""This module supplies the persistent hash cache for duplicate-file-finder."""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from .file_functions import file_hash
+
+
+class HashCache:
+    def __init__(self, cache_file, max_entries=None, verify_rate=0.0,
+                 batch_size=1000, hash_function=file_hash):
+        """
+        This method opens, or creates, the SQLite database at cache_file.
+        Digests are stored per algorithm and keyed by the device, inode,
+        size and mtime_ns of the file, so x file that has not changed since
+        it was last hashed is never read again. The cache may be shared by
+        threads, each call holding x lock on the database.
+
+        :param cache_file: str, filepath to the SQLite cache database
+        :param max_entries: int, defaults to None, when set the least
+            recently used entries beyond this number are pruned on close
+        :param verify_rate: float, defaults to 0.0, fraction of cache hits
+            that are re-hashed from the real file and compared
+        :param batch_size: int, defaults to 1000, number of new digests and
+            usage updates held in memory before they are written
+        :param hash_function: callable with the signature of file_hash used
+            to hash files missing from the cache, defaults to file_hash
+        """
+        if not 0.0 <= verify_rate <= 1.0:
+            error_msg = (f"HashCache.__init__(): verify_rate, {verify_rate}, "
+                         f"must be between 0.0 and 1.0.")
+            raise ValueError(error_msg)
+        self._cache_file = cache_file
+        self._max_entries = max_entries
+        self._verify_rate = verify_rate
+        self._batch_size = batch_size
+        self._hash_function = hash_function
+        self._pending_writes = []
+        self._pending_touches = []
+        self._now = int(time.time())
+        self.hits = 0
+        self.misses = 0
+        self.verified = 0
+        self.mismatches = 0
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(cache_file, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, "
+            "algorithm TEXT, digest TEXT, last_used INTEGER, "
+            "PRIMARY KEY (device, inode, size, mtime_ns, algorithm))")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes (last_used)")
+        self._connection.commit()
+
+    def __str__(self):
+        s = (f"HashCache: _cache_file: {self._cache_file}. "
+             f"hits: {self.hits}. misses: {self.misses}. "
+             f"verified: {self.verified}. mismatches: {self.mismatches}.")
+        return s
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _key(stat_result, algorithm):
+        return (stat_result.st_dev, stat_result.st_ino, stat_result.st_size,
+                stat_result.st_mtime_ns, algorithm)
+
+    def lookup(self, filename, algorithm='sha256', stat_result=None):
+        """
+        This method returns the cached digest of filename, or None when
+        the cache holds no digest for its current device, inode, size and
+        mtime_ns. A sample of hits, set by verify_rate, is checked against
+        the real file and replaced when it no longer matches.
+        :param filename: filepath
+        :param algorithm: str, see file_hash for valid values
+        :param stat_result: os.stat_result of filename, defaults to None,
+            in which case the file is stat'ed
+        :return: str (hexadecimal hash string) or None
+        """
+        if stat_result is None:
+            stat_result = os.stat(filename)
+        with self._lock:
+            return self._lookup(filename, algorithm, stat_result)
+
+    def _lookup(self, filename, algorithm, stat_result):
+        """
+        This internal method does the work of lookup once the lock is held.
+        :param filename: filepath
+        :param algorithm: str, see file_hash for valid values
+        :param stat_result: os.stat_result of filename
+        :return: str (hexadecimal hash string) or None
+        """
+        key = self._key(stat_result, algorithm)
+        row = self._connection.execute(
+            "SELECT digest FROM hashes WHERE device = ? AND inode = ? AND "
+            "size = ? AND mtime_ns = ? AND algorithm = ?", key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        digest = row[0]
+        if self._verify_rate and random.random() < self._verify_rate:
+            self.verified += 1
+            fresh_digest = self._hash_function(filename, algorithm)
+            if fresh_digest != digest:
+                self.mismatches += 1
+                self.store(filename, algorithm, fresh_digest, stat_result)
+                return fresh_digest
+        self._pending_touches.append(key)
+        if len(self._pending_touches) >= self._batch_size:
+            self.flush()
+        return digest
+
+    def store(self, filename, algorithm, digest, stat_result=None):
+        """
+        This method queues x freshly computed digest for filename. Queued
+        digests are written in batches.
+        :param filename: filepath
+        :param algorithm: str, see file_hash for valid values
+        :param digest: str (hexadecimal hash string)
+        :param stat_result: os.stat_result of filename, defaults to None,
+            in which case the file is stat'ed
+        :return: None
+        """
+        if stat_result is None:
+            stat_result = os.stat(filename)
+        with self._lock:
+            self._pending_writes.append(self._key(stat_result, algorithm) +
+                                        (digest, self._now))
+            if len(self._pending_writes) >= self._batch_size:
+                self.flush()
+
+    def file_hash(self, filename, algorithm='sha256', stat_result=None):
+        """
+        This method is x drop-in replacement for functions.file_hash that
+        answers from the cache when it can and caches what it computes.
+        :param filename: filepath
+        :param algorithm: str, see file_hash for valid values
+        :param stat_result: os.stat_result of filename, defaults to None
+        :return: str (hexadecimal hash string)
+        """
+        if stat_result is None:
+            stat_result = os.stat(filename)
+        digest = self.lookup(filename, algorithm, stat_result)
+        if digest is None:
+            digest = self._hash_function(filename, algorithm)
+            self.store(filename, algorithm, digest, stat_result)
+        return digest
+
+    def flush(self):
+        """
+        This method writes all queued digests and usage updates in x
+        single transaction.
+        :return: None
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending_writes)
+            self._connection.executemany(
+                f"UPDATE hashes SET last_used = {self._now} WHERE device = ? "
+                f"AND inode = ? AND size = ? AND mtime_ns = ? AND algorithm = ?",
+                self._pending_touches)
+            self._pending_writes = []
+            self._pending_touches = []
+
+    def prune(self, max_entries):
+        """
+        This method deletes the least recently used entries until no more
+        than max_entries remain.
+        :param max_entries: int
+        :return: int, number of entries deleted
+        """
+        self.flush()
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (max_entries,))
+        return cursor.rowcount
+
+    def entries(self):
+        """
+        This method counts the entries stored in the cache.
+        :return: int
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def close(self):
+        """
+        This method flushes the queued writes, prunes the cache to
+        max_entries when it was set, and closes the database.
+        :return: None
+        """
+        self.flush()
+        if self._max_entries is not None:
+            self.prune(self._max_entries)
+        self._connection.close()
+
@@ -0,0 +1,200 @@
+"""This module supplies the compact file record store for duplicate-file-finder."""
+
+import os
+import pathlib
+from array import array
+
+from .file_functions import FileRecord
+
+
+class RecordStore:
+    def __init__(self):
+        """
+        This method creates an empty store of file records. The store keeps
+        its records in columns rather than as one object per file: parent
+        directories are interned and referred to by an integer ID, sizes,
+        mtimes and directory IDs are kept in array('q') columns and digests
+        as raw bytes packed into x single bytearray. Inodes are only kept
+        for files with several hard links, which are rare. Indexing the
+        store returns x RecordView with the attributes of x FileRecord.
+
+        Digests must be hex strings of one length, as returned by file_hash
+        for x single algorithm.
+        """
+        self._directories = []
+        self._directory_ids = {}
+        self._parents = array('q')
+        self._names = []
+        self._sizes = array('q')
+        self._mtimes = array('q')
+        self._hashed = bytearray()
+        self._digests = bytearray()
+        self._digest_size = None
+        self._inodes = {}
+
+    def __str__(self):
+        s = (f"RecordStore: records: {len(self)}. "
+             f"directories: {len(self._directories)}. "
+             f"_digest_size: {self._digest_size}.")
+        return s
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            error_msg = (f"RecordStore.__getitem__(): idx, {idx}, is out of "
+                         f"range for {len(self)} records.")
+            raise IndexError(error_msg)
+        return RecordView(self, idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield RecordView(self, idx)
+
+    def append(self, path, stat_result, hash_value=None):
+        """
+        This method adds the record of x file.
+        :param path: str or PathLike, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :param hash_value: str, defaults to None, hex digest of the file
+        :return: int, index of the record
+        """
+        directory, name = os.path.split(os.fspath(path))
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = len(self._directories)
+            self._directories.append(directory)
+            self._directory_ids[directory] = directory_id
+        idx = len(self._names)
+        self._parents.append(directory_id)
+        self._names.append(name)
+        self._sizes.append(stat_result.st_size)
+        self._mtimes.append(stat_result.st_mtime_ns)
+        self._hashed.append(0)
+        if self._digest_size:
+            self._digests.extend(bytes(self._digest_size))
+        if stat_result.st_nlink > 1:
+            self._inodes[idx] = (stat_result.st_dev, stat_result.st_ino)
+        if hash_value is not None:
+            self.set_hash(idx, hash_value)
+        return idx
+
+    def set_hash(self, idx, hash_value):
+        """
+        This method sets the digest of x record.
+        :param idx: int, index of the record
+        :param hash_value: str, hex digest of the file
+        :return: None
+        """
+        digest = bytes.fromhex(hash_value)
+        if self._digest_size is None:
+            # The column is only allocated once the digest length is known.
+            self._digest_size = len(digest)
+            self._digests = bytearray(self._digest_size * len(self))
+        elif len(digest) != self._digest_size:
+            error_msg = (f"RecordStore.set_hash(): hash_value, {hash_value}, "
+                         f"is {len(digest)} bytes long, the store holds "
+                         f"digests of {self._digest_size} bytes.")
+            raise ValueError(error_msg)
+        start = idx * self._digest_size
+        self._digests[start:start + self._digest_size] = digest
+        self._hashed[idx] = 1
+
+    def path(self, idx):
+        """
+        This method returns the filepath of x record.
+        :param idx: int, index of the record
+        :return: pathlib.Path
+        """
+        return pathlib.Path(self._directories[self._parents[idx]], self._names[idx])
+
+    def hash(self, idx):
+        """
+        This method returns the hex digest of x record, or None when it has
+        not been hashed.
+        :param idx: int, index of the record
+        :return: str or None
+        """
+        if not self._hashed[idx]:
+            return None
+        start = idx * self._digest_size
+        return self._digests[start:start + self._digest_size].hex()
+
+    def record(self, idx):
+        """
+        This method returns x record as x FileRecord.
+        :param idx: int, index of the record
+        :return: FileRecord
+        """
+        return FileRecord(path=self.path(idx), size=self._sizes[idx],
+                          hash=self.hash(idx), inode=self._inodes.get(idx))
+
+    def directories(self):
+        """
+        This method returns the parent directories of the records, each one
+        once, in the order they were first seen.
+        :return: list of str
+        """
+        return list(self._directories)
+
+
+class RecordView:
+    """
+    This class gives access to one record of x RecordStore with the
+    attributes of x FileRecord, plus mtime_ns, name and parent. x view
+    holds no data of its own, so it reflects later changes to the store.
+    """
+    __slots__ = ('_store', '_idx')
+
+    def __init__(self, store, idx):
+        self._store = store
+        self._idx = idx
+
+    def __str__(self):
+        s = (f"RecordView: path: {self.path}. size: {self.size}. "
+             f"hash: {self.hash}.")
+        return s
+
+    def __repr__(self):
+        return f"RecordView(store, {self._idx})"
+
+    @property
+    def path(self):
+        return self._store.path(self._idx)
+
+    @property
+    def name(self):
+        return self._store._names[self._idx]
+
+    @property
+    def parent(self):
+        return self._store._directories[self._store._parents[self._idx]]
+
+    @property
+    def size(self):
+        return self._store._sizes[self._idx]
+
+    @property
+    def mtime_ns(self):
+        return self._store._mtimes[self._idx]
+
+    @property
+    def hash(self):
+        return self._store.hash(self._idx)
+
+    @property
+    def inode(self):
+        return self._store._inodes.get(self._idx)
+
+    def _replace(self, **changes):
+        """
+        This method returns x FileRecord of the view with changes applied,
+        as namedtuple._replace does, so that views may be passed wherever
+        FileRecords are expected.
+        :param changes: new values of FileRecord fields
+        :return: FileRecord
+        """
+        return self._store.record(self._idx)._replace(**changes)
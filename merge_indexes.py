@@ -0,0 +1,4 @@
+from rptree.cli import merge_indexes_main
+
+if __name__ == "__main__":
+    merge_indexes_main()
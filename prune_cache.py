@@ -0,0 +1,4 @@
+from rptree.cli import prune_cache_main
+
+if __name__ == "__main__":
+    prune_cache_main()
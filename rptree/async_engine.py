@@ -0,0 +1,169 @@
+"""This module supplies the asyncio scanning engine of RP Tree."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+
+class AsyncTreeScanner:
+    def __init__(self, generator, concurrency=32, per_directory=8):
+        """
+        This method prepares an asyncio scan for generator. The scan lists
+        directories, stats files and hashes them concurrently, running each
+        blocking call in x thread pool, which hides the round trip latency
+        of network filesystems. Its results are handed to generator, which
+        then renders the tree in the usual order.
+
+        :param generator: _TreeDiagramGenerator the scan works for
+        :param concurrency: int, defaults to 32, maximum number of blocking
+            calls in progress at once over the whole tree
+        :param per_directory: int, defaults to 8, maximum number of files of
+            x single directory being stat'ed or hashed at once
+        """
+        if concurrency < 1 or per_directory < 1:
+            error_msg = (f"AsyncTreeScanner.__init__(): concurrency, "
+                         f"{concurrency}, and per_directory, {per_directory}, "
+                         f"must be at least 1.")
+            raise ValueError(error_msg)
+        self._generator = generator
+        self._concurrency = concurrency
+        self._per_directory = per_directory
+        self._listings = {}
+        self._hashes = {}
+        self._inodes = {}
+        self._executor = None
+        self._overall = None
+
+    def __str__(self):
+        s = (f"AsyncTreeScanner: _concurrency: {self._concurrency}. "
+             f"_per_directory: {self._per_directory}.")
+        return s
+
+    def scan(self, root_dir):
+        """
+        This method scans the tree below root_dir. It runs its own event
+        loop, so it cannot be called from code already running in one.
+        :param root_dir: filepath of the root directory
+        :return: tuple of (listings, hashes), listings mapping the str of
+            each directory path to its prepared entries and hashes mapping
+            each file path to its hash value, or None
+        """
+        with ThreadPoolExecutor(max_workers=self._concurrency) as self._executor:
+            asyncio.run(self._scan_directory(root_dir))
+        return self._listings, self._hashes
+
+    async def _run(self, function, *args):
+        """
+        This internal method runs x blocking call in the thread pool once
+        the overall concurrency limit allows it.
+        :param function: callable
+        :param args: arguments of function
+        :return: the result of function
+        """
+        async with self._overall:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, function, *args)
+
+    def _stat(self, entry):
+        """
+        This internal method stats entry in x worker thread, timing it when
+        the scan is instrumented.
+        :param entry: os.DirEntry of x file
+        :return: os.stat_result
+        """
+        instrumentation = self._generator._instrumentation
+        if instrumentation:
+            start = perf_counter()
+            stat_result = entry.stat()
+            instrumentation.record('stat', perf_counter() - start)
+            return stat_result
+        return entry.stat()
+
+    async def _scan_directory(self, directory):
+        """
+        This internal method lists directory, then scans its subdirectories
+        and files concurrently.
+        :param directory: filepath of the directory
+        :return: None
+        """
+        if self._overall is None:
+            # Semaphores must be created inside the running event loop.
+            self._overall = asyncio.Semaphore(self._concurrency)
+        entries = await self._run(self._generator._prepare_entries, directory)
+        self._listings[str(directory)] = entries
+        per_directory = asyncio.Semaphore(self._per_directory)
+        tasks = []
+        for entry in entries:
+            if entry.is_dir():
+                tasks.append(self._scan_directory(entry.path))
+            else:
+                tasks.append(self._scan_file(entry, per_directory))
+        await asyncio.gather(*tasks)
+
+    async def _scan_file(self, entry, per_directory):
+        """
+        This internal method stats and, unless hashes are suppressed or x
+        previous hash can be reused, hashes x file. The stat is cached by
+        the entry, so rendering the tree does not repeat it. A hard link to
+        an inode another task is hashing waits for that hash instead of
+        reading the file again.
+        :param entry: os.DirEntry of the file
+        :param per_directory: asyncio.Semaphore of the file's directory
+        :return: None
+        """
+        generator = self._generator
+        async with per_directory:
+            try:
+                stat_result = await self._run(self._stat, entry)
+            except OSError:
+                # x dangling symbolic link is rendered without x hash.
+                return
+            if generator._suppress_hash:
+                hash_val = generator._hash_entry(entry.path, stat_result)
+            else:
+                hash_val = await self._linked_hash(entry.path, stat_result)
+                if hash_val is None:
+                    hash_val = await self._hash_file(entry.path, stat_result)
+        self._hashes[entry.path] = hash_val
+
+    async def _linked_hash(self, path, stat_result):
+        """
+        This internal method returns the hash of an inode with several hard
+        links once the first of them has been hashed, or None when path is
+        the first link seen, or not x hard link at all.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :return: str or None
+        """
+        if stat_result.st_nlink < 2:
+            return None
+        first_link = self._inodes.get((stat_result.st_dev, stat_result.st_ino))
+        if first_link is None:
+            return None
+        await first_link
+        return self._generator._linked_hash(path, stat_result)
+
+    async def _hash_file(self, path, stat_result):
+        """
+        This internal method returns the hash value of x file, reusing x
+        previous hash when possible. Other hard links to the same inode
+        wait until it is known.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :return: str
+        """
+        generator = self._generator
+        hashed = None
+        if stat_result.st_nlink > 1:
+            hashed = asyncio.get_running_loop().create_future()
+            self._inodes[(stat_result.st_dev, stat_result.st_ino)] = hashed
+        try:
+            hash_val = generator._reused_hash(path, stat_result)
+            if hash_val is None:
+                hash_val = await self._run(generator._walk_hash_function,
+                                           path, generator._hash_type)
+                generator._record_hash(path, stat_result, hash_val, hashed=True)
+        finally:
+            if hashed is not None:
+                hashed.set_result(None)
+        return hash_val
@@ -0,0 +1,242 @@
+"""This module supplies the checkpoint journal of resumable RP Tree scans."""
+
+import json
+import os
+import threading
+import time
+
+from .snapshot import _SnapshotEntry
+
+JOURNAL_VERSION = 2
+
+
+class ScanJournal:
+    def __init__(self, journal_file, root_dir, hash_type, resume=False,
+                 batch_size=1000, interval=10.0):
+        """
+        This method opens the checkpoint journal of x scan over root_dir.
+        The journal is x file of JSON lines: x header, then one line per
+        file hashed, with its size, mtime and hash, and one per directory
+        whose entries have all been walked, with its mtime and listing.
+        Lines are written in batches, each followed by an fsync, once
+        batch_size lines are waiting or interval seconds have passed, so an
+        interrupted scan loses at most one batch. The journal is removed
+        once the walk completes.
+
+        With resume, the journal left by an interrupted scan is read back
+        and appended to. Directories the scan completed are not listed
+        again while their mtime has not changed, files whose size and mtime
+        have not changed since they were journaled are not hashed again,
+        and every other directory and file is listed and hashed as usual,
+        so the output is that of an uninterrupted scan.
+
+        :param journal_file: str, filepath of the journal
+        :param root_dir: str, filepath of the root directory of the scan
+        :param hash_type: str, hash algorithm of the scan
+        :param resume: bool, defaults to False, continues the scan journaled
+            in journal_file, if there is one, instead of starting afresh
+        :param batch_size: int, defaults to 1000, number of lines written at
+            once
+        :param interval: float, defaults to 10.0, maximum number of seconds
+            x line waits before it is written
+        """
+        self._journal_file = journal_file
+        self._root_dir = str(root_dir)
+        self._hash_type = hash_type
+        self._batch_size = batch_size
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._batch = []
+        self._last_sync = time.monotonic()
+        self._files = {}
+        self._directories = {}
+        self._listings = {}
+        self.resumed_files = 0
+        self.resumed_bytes = 0
+        self.resumed_directories = 0
+        if resume and os.path.exists(journal_file):
+            self._load()
+            self._stream = open(journal_file, mode='a', encoding='UTF-8')
+        else:
+            self._stream = open(journal_file, mode='w', encoding='UTF-8')
+            self._batch.append(json.dumps({'version': JOURNAL_VERSION,
+                                           'root_dir': self._root_dir,
+                                           'hash_type': hash_type}))
+            self.sync()
+        self.journaled_directories = len(self._directories)
+        self.journaled_files = len(self._files)
+
+    def __str__(self):
+        s = (f"ScanJournal: _journal_file: {self._journal_file}. "
+             f"journaled_files: {self.journaled_files}. "
+             f"journaled_directories: {self.journaled_directories}. "
+             f"resumed_directories: {self.resumed_directories}.")
+        return s
+
+    def _key(self, path):
+        """
+        This internal method returns the path relative to the root directory
+        that keys path in the journal.
+        :param path: str, filepath inside the tree
+        :return: str
+        """
+        return str(path)[len(self._root_dir):]
+
+    def _load(self):
+        """
+        This internal method reads back the journal of an interrupted scan.
+        :return: None
+        """
+        with open(self._journal_file, mode='rb+') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != JOURNAL_VERSION:
+                error_msg = (f"ScanJournal._load(): journal_file, "
+                             f"{self._journal_file}, has version "
+                             f"{header.get('version')}, not {JOURNAL_VERSION}.")
+                raise ValueError(error_msg)
+            if (header['root_dir'] != self._root_dir
+                    or header['hash_type'] != self._hash_type):
+                error_msg = (f"ScanJournal._load(): journal_file, "
+                             f"{self._journal_file}, was written by x scan of "
+                             f"{header.get('root_dir')} with "
+                             f"{header.get('hash_type')}, not of "
+                             f"{self._root_dir} with {self._hash_type}.")
+                raise ValueError(error_msg)
+            end = f.tell()
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                end += len(line)
+                if record[0] == 'f':
+                    self._files[record[1]] = record[2:]
+                else:
+                    self._directories[record[1]] = record[2:]
+            # x line cut short by the interruption is dropped, so that the
+            # lines appended from here on can be read back.
+            f.truncate(end)
+
+    def lookup_hash(self, path, stat_result):
+        """
+        This method returns the hash journaled for path, or None when the
+        file was not hashed before the interruption or has changed since.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :return: str or None
+        """
+        journaled = self._files.get(self._key(path))
+        if (journaled is not None and journaled[0] == stat_result.st_size
+                and journaled[1] == stat_result.st_mtime_ns):
+            with self._lock:
+                self.resumed_files += 1
+                self.resumed_bytes += stat_result.st_size
+            return journaled[2]
+        return None
+
+    def record_file(self, path, stat_result, hash_value):
+        """
+        This method journals the hash of x file, unless the journal already
+        holds it.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :param hash_value: str, hash value of the file
+        :return: None
+        """
+        key = self._key(path)
+        entry = [stat_result.st_size, stat_result.st_mtime_ns, hash_value]
+        if self._files.get(key) != entry:
+            self._queue(json.dumps(['f', key] + entry, ensure_ascii=False))
+
+    def list_directory(self, directory, list_directory):
+        """
+        This method lists directory. The listing journaled for x directory
+        the interrupted scan completed is reused while the mtime of the
+        directory has not changed since, else list_directory lists it. The
+        listing is kept until record_directory journals it. It may be called
+        from several threads at once.
+        :param directory: str, filepath of the directory
+        :param list_directory: callable returning the entries of x directory
+        :return: list of os.DirEntry or _SnapshotEntry, in listing order
+        """
+        directory = str(directory)
+        key = self._key(directory)
+        mtime_ns = os.stat(directory).st_mtime_ns
+        journaled = self._directories.get(key)
+        if journaled is not None and journaled[0] == mtime_ns:
+            with self._lock:
+                self.resumed_directories += 1
+            entries = [_SnapshotEntry(name, os.path.join(directory, name),
+                                      *flags)
+                       for name, *flags in journaled[1]]
+        else:
+            entries = list_directory(directory)
+        with self._lock:
+            self._listings[key] = [mtime_ns, [[entry.name, entry.is_dir(),
+                                               entry.is_symlink()]
+                                              for entry in entries]]
+        return entries
+
+    def record_directory(self, path):
+        """
+        This method journals x directory whose entries have all been walked,
+        with the listing list_directory returned for it, unless the journal
+        already holds it.
+        :param path: str, filepath of the directory
+        :return: None
+        """
+        key = self._key(path)
+        with self._lock:
+            listing = self._listings.pop(key)
+        if self._directories.get(key) != listing:
+            self._queue(json.dumps(['d', key] + listing, ensure_ascii=False))
+
+    def _queue(self, line):
+        """
+        This internal method queues x line, writing the queue once it is
+        full or has waited long enough.
+        :param line: str, JSON line without its newline
+        :return: None
+        """
+        with self._lock:
+            self._batch.append(line)
+            if (len(self._batch) >= self._batch_size
+                    or time.monotonic() - self._last_sync >= self._interval):
+                self._write_batch()
+
+    def _write_batch(self):
+        """
+        This internal method writes the queued lines and fsyncs the journal.
+        The lock must be held.
+        :return: None
+        """
+        if self._batch:
+            self._stream.write("\n".join(self._batch) + "\n")
+            self._batch = []
+        self._stream.flush()
+        os.fsync(self._stream.fileno())
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """
+        This method writes the queued lines and fsyncs the journal.
+        :return: None
+        """
+        with self._lock:
+            self._write_batch()
+
+    def close(self, completed=False):
+        """
+        This method writes the queued lines and closes the journal. x
+        completed scan needs no journal, so it is then removed.
+        :param completed: bool, defaults to False, whether the walk completed
+        :return: None
+        """
+        if self._stream.closed:
+            return
+        self.sync()
+        self._stream.close()
+        if completed:
+            os.remove(self._journal_file)
@@ -1,10 +1,50 @@
 import argparse
 import pathlib
+import re
 import sys
 
 from . import __version__
-from .rptree import DirectoryTree
-from functions import file_hash
+from .rptree import DirectoryTree, ENGINES
+from .hash_pool import POOL_BACKENDS
+from .output_formats import OUTPUT_FORMATS, STRUCTURED_FORMATS
+from functions import (file_hash, IO_MODES, HASH_BLOCK_SIZE,
+                       PARTIAL_HASH_BLOCK_SIZE, SAMPLE_COUNT,
+                       SAMPLED_HASH_MIN_SIZE, HASH_ALGORITHMS,
+                       CRYPTOGRAPHIC_ALGORITHMS)
+
+
+def positive_int(value):
+    """
+    positive_int is the argparse type of the options that only accept x
+    whole number of at least 1, such as sizes and limits.
+    :param value: str, value given on the command line
+    :return: int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        error_msg = f"{value} is not x whole number of at least 1."
+        raise argparse.ArgumentTypeError(error_msg)
+    return number
+
+
+def fraction(value):
+    """
+    fraction is the argparse type of the options that accept x number
+    between 0.0 and 1.0, such as rates.
+    :param value: str, value given on the command line
+    :return: float
+    """
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not 0.0 <= number <= 1.0:
+        error_msg = f"{value} is not x number between 0.0 and 1.0."
+        raise argparse.ArgumentTypeError(error_msg)
+    return number
 
 
 def parse_cmd_line_arguments():
@@ -19,9 +59,11 @@ def parse_cmd_line_arguments():
     parser.add_argument(
         "root_dir",
         metavar="ROOT_DIR",
-        nargs="?",
-        default='.',
-        help=f"Create a full directory tree at ROOT_DIR. Note: On "
+        nargs="*",
+        default=['.'],
+        help=f"Create a full directory tree at ROOT_DIR. Several roots, on "
+             f"one volume or more, are scanned together and searched for "
+             f"duplicates across all of them. Note: On "
              f"Windows platforms, a path_to_dir ending in a forward "
              f"slash may require a second forward slash to work "
              f"properly."
@@ -31,9 +73,25 @@ def parse_cmd_line_arguments():
         "--hash-type",
         action="store",
         default='sha256',
-        choices=['sha224', 'sha256', 'sha384', 'sha512',
-                 'sha3_224', 'sha3_256', 'sha3_384', 'sha3_512'],
-        help="Determines which safe SHA algorithm to use. Defaults to sha256."
+        choices=list(HASH_ALGORITHMS) + ['fast'],
+        help="Determines which hash algorithm to use. fast picks xxh3_128 when "
+             "xxhash is installed and blake2b otherwise. Defaults to sha256."
+    )
+    parser.add_argument(
+        "--confirm-with",
+        action="store",
+        default=None,
+        choices=sorted(CRYPTOGRAPHIC_ALGORITHMS),
+        help="Re-hashes only the members of duplicate groups with this "
+             "cryptographic algorithm before reporting them."
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="Compares the members of each duplicate group byte by byte before "
+             "reporting them, and reports the throughput and any mismatches. "
+             "Requires -l."
     )
     parser.add_argument(
         "-v",
@@ -43,6 +101,15 @@ def parse_cmd_line_arguments():
         help="Controls display of file and directory being examined. Defaults to False, "
              "suppressing such output."
     )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        default=False,
+        help="Silences the progress messages. The tree, the duplicate report, "
+             "the --verify outcome, the filter and hash cache reports and the "
+             "statistics asked for with --stats are still printed."
+    )
     parser.add_argument(
         "-o",
         "--output-file",
@@ -55,9 +122,225 @@ def parse_cmd_line_arguments():
         "--file-type",
         action="store",
         default="txt",
-        choices=["txt", 'md'],
+        choices=OUTPUT_FORMATS,
         help="Determines type of output displays or written to screen. "
-             "Only supports txt and md currently."
+             "jsonl, csv and sqlite write machine-readable records of the "
+             "tree and duplicate groups to --output-file."
+    )
+    parser.add_argument(
+        "-s",
+        "--suppress-hash",
+        action="store_true",
+        default=False,
+        help="Suppresses the performance of hash algorithm on files."
+             " Default is False: performing and displaying hash results."
+             " Combined with --list-duplicates, only files that can have"
+             " x duplicate are hashed."
+    )
+    parser.add_argument(
+        "--samples",
+        action="store",
+        type=int,
+        default=SAMPLE_COUNT,
+        help=f"With -s and -l, the number of blocks read across each file of "
+             f"at least {SAMPLED_HASH_MIN_SIZE // (1024 * 1024)} MiB sharing its "
+             f"size with another, so that most different files are told apart "
+             f"without being read completely. 0 skips this stage. "
+             f"Defaults to {SAMPLE_COUNT}."
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=None,
+        metavar="GLOB",
+        help="Keeps only the files matching this glob pattern, or any of the "
+             "patterns when repeated. Patterns with x / match the path "
+             "relative to the root directory, others the file name."
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=None,
+        metavar="GLOB",
+        help="Prunes the files and directories matching this glob pattern, "
+             "such as .git or node_modules. Pruned directories are never "
+             "listed. May be repeated."
+    )
+    parser.add_argument(
+        "--include-regex",
+        action="append",
+        default=None,
+        metavar="REGEX",
+        help="Keeps only the files whose path relative to the root directory "
+             "matches this regular expression. May be repeated."
+    )
+    parser.add_argument(
+        "--exclude-regex",
+        action="append",
+        default=None,
+        metavar="REGEX",
+        help="Prunes the files and directories whose path relative to the "
+             "root directory matches this regular expression. May be repeated."
+    )
+    parser.add_argument(
+        "--min-size",
+        action="store",
+        type=int,
+        default=None,
+        help="Prunes files smaller than this number of bytes."
+    )
+    parser.add_argument(
+        "--max-size",
+        action="store",
+        type=int,
+        default=None,
+        help="Prunes files larger than this number of bytes."
+    )
+    parser.add_argument(
+        "--symlinks",
+        action="store",
+        default='follow',
+        choices=['follow', 'skip'],
+        help="Follows symbolic links, the default, or prunes them."
+    )
+    parser.add_argument(
+        "--one-file-system",
+        action="store_true",
+        default=False,
+        help="Prunes directories on another filesystem than their root "
+             "directory."
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of workers hashing files in parallel, for each root. "
+             "Defaults to 1."
+    )
+    parser.add_argument(
+        "--pool-backend",
+        action="store",
+        default="thread",
+        choices=POOL_BACKENDS,
+        help="Type of worker pool used when --jobs is greater than 1. "
+             "Defaults to thread."
+    )
+    parser.add_argument(
+        "--cache",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="Filepath to x persistent hash cache. Unchanged files are not "
+             "hashed again on later runs."
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        action="store",
+        type=positive_int,
+        default=None,
+        help="Prunes the least recently used cache entries beyond this number "
+             "at the end of the run."
+    )
+    parser.add_argument(
+        "--cache-verify",
+        action="store",
+        type=fraction,
+        default=0.0,
+        metavar="RATE",
+        help="Fraction of cache hits checked against the real file, between "
+             "0.0 and 1.0. Defaults to 0.0."
+    )
+    parser.add_argument(
+        "--io-mode",
+        action="store",
+        default="auto",
+        choices=IO_MODES,
+        help="Determines how files are read for hashing. auto uses mmap for "
+             "large files and readinto for the rest. Defaults to auto."
+    )
+    parser.add_argument(
+        "--block-size",
+        action="store",
+        type=positive_int,
+        default=HASH_BLOCK_SIZE,
+        help=f"Bytes read at x time by the read and readinto I/O modes. "
+             f"Defaults to {HASH_BLOCK_SIZE}."
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=False,
+        help="Writes the tree while it is being built instead of holding "
+             "it in memory. Progress messages go to stderr."
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store",
+        default=None,
+        metavar="SNAPSHOT",
+        help="Filepath of x snapshot of the previous run. Unchanged "
+             "directories and files are not listed or hashed again, and the "
+             "snapshot is updated for the next run."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store",
+        default=None,
+        metavar="JOURNAL",
+        help="Filepath of x checkpoint journal where the hashes of the scan "
+             "are regularly written and fsync'ed, so that an interrupted scan "
+             "can be resumed with --resume. It is removed once the scan "
+             "completes."
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Continues the scan journaled in --checkpoint by an interrupted "
+             "run. Directories it completed are not listed again and files it "
+             "hashed are not hashed again, unless they changed, and the output "
+             "is that of an uninterrupted run."
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        default=False,
+        help="Records the time spent in each phase of the scan and prints "
+             "x report at the end."
+    )
+    parser.add_argument(
+        "--profile-out",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="Writes the scan statistics to FILE as JSON."
+    )
+    parser.add_argument(
+        "--engine",
+        action="store",
+        default="sync",
+        choices=ENGINES,
+        help="Scanning engine. The async engine lists directories and hashes "
+             "files concurrently, which suits network filesystems. Defaults "
+             "to sync."
+    )
+    parser.add_argument(
+        "--concurrency",
+        action="store",
+        type=positive_int,
+        default=32,
+        help="Maximum number of blocking calls the async engine has in "
+             "progress at once. Defaults to 32."
+    )
+    parser.add_argument(
+        "--per-directory-concurrency",
+        action="store",
+        type=positive_int,
+        default=8,
+        help="Maximum number of files of x single directory the async engine "
+             "works on at once. Defaults to 8."
     )
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
@@ -68,43 +351,261 @@ def parse_cmd_line_arguments():
         help="Finds file duplicates and lists them by filename "
              "with full directory info."
     )
-    group.add_argument(
-        "-s",
-        "--suppress-hash",
-        action="store_true",
-        default=False,
-        help="Suppresses the performance of hash algorithm on files."
-             " Default is False: performing and displaying hash results."
-    )
     group.add_argument(
         "-d",
         "--dir_only",
         action="store_true",
         help="Generator directory-only tree."
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.verify and not args.list_duplicates:
+        parser.error("--verify compares the duplicates found with -l, which "
+                     "is missing.")
+    for option, patterns in [('--include-regex', args.include_regex),
+                             ('--exclude-regex', args.exclude_regex)]:
+        for pattern in patterns or []:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                parser.error(f"{option} {pattern} is not x valid regular "
+                             f"expression: {e}.")
+    if (args.min_size is not None and args.max_size is not None
+            and args.min_size > args.max_size):
+        parser.error(f"--min-size, {args.min_size}, is larger than --max-size, "
+                     f"{args.max_size}.")
+    if args.file_type in STRUCTURED_FORMATS and not args.output_file:
+        parser.error(f"-f {args.file_type} writes its records to --output-file, "
+                     f"which is missing.")
+    return args
 
 
 def main():
     args = parse_cmd_line_arguments()
-    print(f"cli.main: args: {args}.")
-    root_dir = pathlib.Path(args.root_dir)
-    if not root_dir.is_dir():
-        error_msg = (f"{args.root_dir}, does not exist or is not "
-                     f"a directory. ROOT_DIR must be a directory.")
+    root_dirs = [pathlib.Path(root_dir) for root_dir in args.root_dir]
+    for root_dir in root_dirs:
+        if not root_dir.is_dir():
+            error_msg = (f"{root_dir}, does not exist or is not "
+                         f"a directory. ROOT_DIR must be a directory.")
+            print(error_msg)
+            sys.exit()
+    if args.resume and not args.checkpoint:
+        error_msg = "--resume continues the scan journaled in --checkpoint JOURNAL."
         print(error_msg)
         sys.exit()
     # print(f"rptree cli: args: {args}")
-    tree = DirectoryTree(root_dir,
+    tree = DirectoryTree(root_dirs,
                          dir_only=args.dir_only,
                          hash_type=args.hash_type,
                          suppress_hash=args.suppress_hash,
                          verbose=args.verbose,
+                         quiet=args.quiet,
                          output_file=args.output_file,
                          file_type=args.file_type,
-                         list_duplicates=args.list_duplicates)
+                         list_duplicates=args.list_duplicates,
+                         jobs=args.jobs,
+                         pool_backend=args.pool_backend,
+                         cache_file=args.cache,
+                         cache_max_entries=args.cache_max_entries,
+                         cache_verify_rate=args.cache_verify,
+                         io_mode=args.io_mode,
+                         block_size=args.block_size,
+                         confirm_with=args.confirm_with,
+                         verify=args.verify,
+                         samples=args.samples,
+                         include=args.include,
+                         exclude=args.exclude,
+                         include_regex=args.include_regex,
+                         exclude_regex=args.exclude_regex,
+                         min_size=args.min_size,
+                         max_size=args.max_size,
+                         follow_symlinks=args.symlinks == 'follow',
+                         one_file_system=args.one_file_system,
+                         stream=args.stream,
+                         incremental=args.incremental,
+                         checkpoint=args.checkpoint,
+                         resume=args.resume,
+                         stats=args.stats,
+                         profile_out=args.profile_out,
+                         engine=args.engine,
+                         concurrency=args.concurrency,
+                         per_directory_concurrency=args.per_directory_concurrency)
     tree.generate()
     tree.print_tree()
     if args.list_duplicates:
         duplicate_files = tree.find_duplicates()
+    tree.close()
+
+
+def parse_prune_cache_arguments():
+    parser = argparse.ArgumentParser(
+        prog="prune_cache",
+        description="Displays or prunes x RP Tree hash cache.",
+        epilog="RP Tree Help"
+    )
+    parser.version = f"RP Tree v{__version__}"
+    parser.add_argument("--version",
+                        action="version")
+    parser.add_argument(
+        "cache_file",
+        metavar="CACHE",
+        help="Filepath to the hash cache database."
+    )
+    parser.add_argument(
+        "-m",
+        "--max-entries",
+        action="store",
+        type=positive_int,
+        default=None,
+        help="Prunes the least recently used entries beyond this number."
+    )
+    return parser.parse_args()
+
+
+def prune_cache_main():
+    args = parse_prune_cache_arguments()
+    if not pathlib.Path(args.cache_file).is_file():
+        error_msg = f"{args.cache_file}, does not exist or is not a file."
+        print(error_msg)
+        sys.exit()
+    from functions import HashCache
+    cache = HashCache(args.cache_file)
+    print(f"{args.cache_file}: {cache.entries()} entries.")
+    if args.max_entries is not None:
+        deleted = cache.prune(args.max_entries)
+        print(f"Pruned {deleted} entries, {cache.entries()} remain.")
+    cache.close()
+
+
+def parse_scan_index_arguments():
+    parser = argparse.ArgumentParser(
+        prog="scan_index",
+        description="Writes the partial index of x tree, to be merged with "
+                    "the indexes of other trees by merge_indexes.",
+        epilog="RP Tree Help"
+    )
+    parser.version = f"RP Tree v{__version__}"
+    parser.add_argument("--version",
+                        action="version")
+    parser.add_argument(
+        "root_dir",
+        metavar="ROOT_DIR",
+        help="Directory to index."
+    )
+    parser.add_argument(
+        "index_file",
+        metavar="INDEX",
+        help="Filepath of the index to write."
+    )
+    parser.add_argument(
+        "-t",
+        "--hash-type",
+        action="store",
+        default="sha256",
+        choices=list(HASH_ALGORITHMS) + ['fast'],
+        help="Hash algorithm. Every merged index must use the same one. "
+             "Defaults to sha256."
+    )
+    parser.add_argument(
+        "--block-size",
+        action="store",
+        type=positive_int,
+        default=PARTIAL_HASH_BLOCK_SIZE,
+        help=f"Bytes read at each end of x file for its partial hash. "
+             f"Defaults to {PARTIAL_HASH_BLOCK_SIZE}."
+    )
+    parser.add_argument(
+        "--host",
+        action="store",
+        default=None,
+        help="Name of this host in the index. Defaults to its hostname."
+    )
+    parser.add_argument(
+        "--full-hashes-for",
+        action="store",
+        default=None,
+        metavar="REQUEST",
+        help="Request file written by merge_indexes. Its paths get x full "
+             "hash in the new index."
+    )
+    return parser.parse_args()
+
+
+def scan_index_main():
+    args = parse_scan_index_arguments()
+    if not pathlib.Path(args.root_dir).is_dir():
+        error_msg = (f"{args.root_dir}, does not exist or is not "
+                     f"a directory. ROOT_DIR must be a directory.")
+        print(error_msg)
+        sys.exit()
+    from .partial_index import scan_to_index, read_requests
+    if args.full_hashes_for:
+        full_hash_paths = read_requests(args.full_hashes_for)
+    else:
+        full_hash_paths = None
+    summary = scan_to_index(args.root_dir, args.index_file,
+                            algorithm=args.hash_type,
+                            block_size=args.block_size,
+                            host=args.host,
+                            full_hash_paths=full_hash_paths)
+    print(f"Index written to {args.index_file}: {summary['files']} files, "
+          f"{summary['partial_hashes']} partial hashes, "
+          f"{summary['full_hashes']} full hashes.")
+
+
+def parse_merge_indexes_arguments():
+    parser = argparse.ArgumentParser(
+        prog="merge_indexes",
+        description="Merges partial indexes written by scan_index and "
+                    "reports the duplicates across all of them.",
+        epilog="RP Tree Help"
+    )
+    parser.version = f"RP Tree v{__version__}"
+    parser.add_argument("--version",
+                        action="version")
+    parser.add_argument(
+        "index_files",
+        metavar="INDEX",
+        nargs="+",
+        help="Filepaths of the indexes to merge."
+    )
+    parser.add_argument(
+        "--resolve-local",
+        action="store_true",
+        default=False,
+        help="Hashes the files of unsettled collisions on this host, for "
+             "indexes of trees this host can read."
+    )
+    parser.add_argument(
+        "--request-dir",
+        action="store",
+        default=".",
+        help="Directory receiving INDEX.request files, listing the files "
+             "whose full hash is needed to settle x collision. Defaults to "
+             "the current directory."
+    )
+    return parser.parse_args()
+
 
+def merge_indexes_main():
+    args = parse_merge_indexes_arguments()
+    for index_file in args.index_files:
+        if not pathlib.Path(index_file).is_file():
+            error_msg = f"{index_file}, does not exist or is not a file."
+            print(error_msg)
+            sys.exit()
+    from .partial_index import IndexMerge
+    merge = IndexMerge(args.index_files, resolve_local=args.resolve_local)
+    hosts = [header['host'] for header in merge.headers]
+    groups = 0
+    for group in merge:
+        groups += 1
+        print(f"Files of {group[0].size} bytes with hash, "
+              f"{group[0].full_hash}, are duplicates:")
+        for entry in group:
+            print(f"{hosts[entry.index]}:{entry.path}")
+    print(f"Merged {merge.entries} entries of {len(args.index_files)} indexes: "
+          f"{groups} duplicate groups, {merge.collisions} entries collided on "
+          f"size and partial hash, {merge.resolved} were hashed here.")
+    for request_file in merge.write_requests(args.request_dir):
+        print(f"Full hashes are needed to settle some collisions, see "
+              f"{request_file}.")
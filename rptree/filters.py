@@ -0,0 +1,183 @@
+"""This module supplies the include and exclude rules of RP Tree scans."""
+
+import fnmatch
+import re
+import threading
+
+
+class ScanFilter:
+    def __init__(self, include=None, exclude=None, include_regex=None,
+                 exclude_regex=None, min_size=None, max_size=None,
+                 follow_symlinks=True, one_file_system=False):
+        """
+        This method compiles the rules deciding which entries x scan keeps.
+        Every list of patterns is compiled once into x single regular
+        expression, so an entry is checked against all of them in one
+        match. Rules are applied to each directory listing before anything
+        else is done with its entries: an excluded directory is never
+        listed, and an excluded file is never stat'ed or hashed, except for
+        the stat the size limits need, which DirEntry caches for the rest
+        of the scan. The filter may be shared by several roots scanned at
+        once, and counts what it pruned.
+
+        Glob patterns containing x / are matched against the path relative
+        to the root directory, others against the name of the entry, as in
+        .git, node_modules or *.pyc. Regular expressions are searched for in
+        the path relative to the root directory, with / as separator.
+        Exclude rules apply to files and directories, include rules and size
+        limits to files only, so that directories are still walked to find
+        the files to include.
+
+        :param include: list of str, defaults to None, glob patterns of the
+            files to keep. With include or include_regex, other files are
+            pruned
+        :param exclude: list of str, defaults to None, glob patterns of the
+            files and directories to prune
+        :param include_regex: list of str, defaults to None, regular
+            expressions of the files to keep
+        :param exclude_regex: list of str, defaults to None, regular
+            expressions of the files and directories to prune
+        :param min_size: int, defaults to None, files smaller than this
+            number of bytes are pruned
+        :param max_size: int, defaults to None, files larger than this
+            number of bytes are pruned
+        :param follow_symlinks: bool, defaults to True, with False symbolic
+            links to files and directories are pruned
+        :param one_file_system: bool, defaults to False, prunes directories
+            on another device than their root directory
+        """
+        if min_size is not None and max_size is not None and min_size > max_size:
+            error_msg = (f"ScanFilter.__init__(): min_size, {min_size}, is "
+                         f"larger than max_size, {max_size}.")
+            raise ValueError(error_msg)
+        self._include_name, self._include_path = self._compile_globs(include)
+        self._exclude_name, self._exclude_path = self._compile_globs(exclude)
+        self._include_regex = self._compile_regexes(include_regex)
+        self._exclude_regex = self._compile_regexes(exclude_regex)
+        self._includes = bool(include or include_regex)
+        self._uses_paths = bool(self._include_path or self._exclude_path
+                                or self._include_regex or self._exclude_regex)
+        self._min_size = min_size
+        self._max_size = max_size
+        self._follow_symlinks = follow_symlinks
+        self.one_file_system = one_file_system
+        self._lock = threading.Lock()
+        self.pruned_directories = 0
+        self.pruned_files = 0
+        self.pruned_bytes = 0
+
+    def __str__(self):
+        s = (f"ScanFilter: _min_size: {self._min_size}. _max_size: "
+             f"{self._max_size}. _follow_symlinks: {self._follow_symlinks}. "
+             f"one_file_system: {self.one_file_system}. pruned_directories: "
+             f"{self.pruned_directories}. pruned_files: {self.pruned_files}.")
+        return s
+
+    @staticmethod
+    def _compile_globs(patterns):
+        """
+        This internal method compiles glob patterns into one regular
+        expression for names and one for relative paths.
+        :param patterns: list of str or None
+        :return: tuple of (compiled name pattern, compiled path pattern),
+            either being None when it has no pattern
+        """
+        names = [fnmatch.translate(pattern) for pattern in patterns or []
+                 if '/' not in pattern]
+        paths = [fnmatch.translate(pattern.strip('/')) for pattern in patterns or []
+                 if '/' in pattern]
+        return (re.compile('|'.join(names)) if names else None,
+                re.compile('|'.join(paths)) if paths else None)
+
+    @staticmethod
+    def _compile_regexes(patterns):
+        """
+        This internal method compiles regular expressions into one.
+        :param patterns: list of str or None
+        :return: compiled pattern or None
+        """
+        if not patterns:
+            return None
+        try:
+            return re.compile('|'.join(f"(?:{pattern})" for pattern in patterns))
+        except re.error as e:
+            error_msg = (f"ScanFilter._compile_regexes(): patterns, "
+                         f"{patterns}, hold an invalid regular expression: {e}.")
+            raise ValueError(error_msg)
+
+    def _excluded(self, name, path):
+        return ((self._exclude_name is not None and self._exclude_name.match(name))
+                or (self._exclude_path is not None and self._exclude_path.match(path))
+                or (self._exclude_regex is not None
+                    and self._exclude_regex.search(path)))
+
+    def _included(self, name, path):
+        return ((self._include_name is not None and self._include_name.match(name))
+                or (self._include_path is not None and self._include_path.match(path))
+                or (self._include_regex is not None
+                    and self._include_regex.search(path)))
+
+    def filter_entries(self, entries, relative_dir, root_device=None):
+        """
+        This method returns the entries of x directory listing the rules
+        keep, in their order, and counts the others.
+        :param entries: list of os.DirEntry
+        :param relative_dir: str, path of the directory relative to its
+            root directory, with / as separator and '' for the root itself
+        :param root_device: int, defaults to None, st_dev of the root
+            directory, required with one_file_system
+        :return: list of os.DirEntry
+        """
+        kept = []
+        pruned_directories = 0
+        pruned_files = 0
+        pruned_bytes = 0
+        for entry in entries:
+            name = entry.name
+            if self._uses_paths:
+                path = f"{relative_dir}/{name}" if relative_dir else name
+            else:
+                path = name
+            is_dir = entry.is_dir()
+            if ((not self._follow_symlinks and entry.is_symlink())
+                    or self._excluded(name, path)):
+                keep = False
+            elif is_dir:
+                keep = (not self.one_file_system
+                        or entry.stat().st_dev == root_device)
+            elif self._includes and not self._included(name, path):
+                keep = False
+            elif self._min_size is not None or self._max_size is not None:
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    # x dangling symbolic link has no size to prune by.
+                    size = None
+                keep = (size is None
+                        or ((self._min_size is None or size >= self._min_size)
+                            and (self._max_size is None or size <= self._max_size)))
+                if not keep:
+                    pruned_bytes += size
+            else:
+                keep = True
+            if keep:
+                kept.append(entry)
+            elif is_dir:
+                pruned_directories += 1
+            else:
+                pruned_files += 1
+        if pruned_directories or pruned_files:
+            with self._lock:
+                self.pruned_directories += pruned_directories
+                self.pruned_files += pruned_files
+                self.pruned_bytes += pruned_bytes
+        return kept
+
+    def report(self):
+        """
+        This method formats what the rules pruned.
+        :return: str
+        """
+        return (f"Filters pruned {self.pruned_directories} directories, never "
+                f"listed, and {self.pruned_files} files, {self.pruned_bytes} "
+                f"bytes of them pruned by size.")
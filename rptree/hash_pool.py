@@ -0,0 +1,107 @@
+"""This module supplies the worker pool used to hash files in parallel."""
+
+from collections import deque
+
+from functions import file_hash
+
+POOL_BACKENDS = ['thread', 'process']
+
+
+class HashPool:
+    def __init__(self, jobs, backend='thread', algorithm='sha256',
+                 max_in_flight=None, hash_function=file_hash):
+        """
+        This method creates x pool of jobs workers that hash files with
+        hash_function. Results are handed back in the order the files were
+        submitted, so callers can fill them into the tree without changing
+        its output. No more than max_in_flight files are queued at once,
+        which keeps memory flat regardless of the size of the tree.
+
+        :param jobs: int, number of workers, must be at least 1
+        :param backend: str, 'thread' (default) or 'process'. hashlib
+            releases the GIL while hashing, so threads normally suffice.
+        :param algorithm: str, hash algorithm, see file_hash for valid values
+        :param max_in_flight: int, maximum number of files queued at once,
+            defaults to four per worker
+        :param hash_function: callable with the signature of file_hash,
+            defaults to file_hash. It must be picklable for the process
+            backend, such as x functools.partial of file_hash.
+        """
+        if jobs < 1:
+            error_msg = f"HashPool.__init__(): jobs, {jobs}, must be at least 1."
+            raise ValueError(error_msg)
+        # The executors are imported here, so that x scan without x pool
+        # does not pay for loading concurrent.futures and multiprocessing.
+        match backend:
+            case 'thread':
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=jobs)
+            case 'process':
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=jobs)
+            case _:
+                error_msg = (f"HashPool.__init__(): backend, {backend}, is not "
+                             f"one of {POOL_BACKENDS}.")
+                raise ValueError(error_msg)
+        self._jobs = jobs
+        self._backend = backend
+        self._algorithm = algorithm
+        self._hash_function = hash_function
+        self._max_in_flight = max_in_flight or 4 * jobs
+        self._pending = deque()
+
+    def __str__(self):
+        s = (f"HashPool: _jobs: {self._jobs}. _backend: {self._backend}. "
+             f"_algorithm: {self._algorithm}. "
+             f"_max_in_flight: {self._max_in_flight}.")
+        return s
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, key, path):
+        """
+        This method queues path for hashing. Once more than max_in_flight
+        files are queued, it waits for the oldest ones and yields them.
+        :param key: any value identifying the file to the caller
+        :param path: filepath of the file to hash
+        :return: generator of (key, hash) tuples in submission order
+        """
+        future = self._executor.submit(self._hash_function, str(path),
+                                       self._algorithm)
+        self._pending.append((key, future))
+        while len(self._pending) > self._max_in_flight:
+            key, future = self._pending.popleft()
+            yield key, future.result()
+
+    def poll(self):
+        """
+        This method yields the results of the oldest queued files that are
+        already hashed, without waiting for any other.
+        :return: generator of (key, hash) tuples in submission order
+        """
+        while self._pending and self._pending[0][1].done():
+            key, future = self._pending.popleft()
+            yield key, future.result()
+
+    def drain(self):
+        """
+        This method waits for every queued file and yields its result.
+        :return: generator of (key, hash) tuples in submission order
+        """
+        while self._pending:
+            key, future = self._pending.popleft()
+            yield key, future.result()
+
+    def close(self):
+        """
+        This method shuts down the workers, abandoning unfinished results.
+        :return: None
+        """
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown()
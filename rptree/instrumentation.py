@@ -0,0 +1,227 @@
+"""This module supplies the per-phase instrumentation of RP Tree scans."""
+
+import heapq
+import os
+import threading
+from time import perf_counter
+
+from functions import file_hash
+
+PHASES = ['scandir', 'stat', 'open', 'read', 'digest', 'hash', 'render', 'dedupe']
+HISTOGRAM_BUCKETS = 32
+
+
+class Instrumentation:
+    def __init__(self, slowest=10):
+        """
+        This method creates an empty set of counters. Each phase of x scan
+        gets x call count, x total time, x maximum and x histogram of call
+        times in power of two microsecond buckets. The slowest files and
+        directories are kept, as well as the bytes read per mount point.
+        Nothing here is touched when instrumentation is turned off, the
+        scanner only checks that it has no Instrumentation.
+
+        :param slowest: int, defaults to 10, number of slowest files and
+            directories kept
+        """
+        self._slowest = slowest
+        self._lock = threading.Lock()
+        self._hooks = []
+        self._mount_points = {}
+        self._file_seconds = {}
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.maximums = dict.fromkeys(PHASES, 0.0)
+        self.histograms = {phase: [0] * HISTOGRAM_BUCKETS for phase in PHASES}
+        self.slowest_files = []
+        self.slowest_directories = []
+        self.mounts = {}
+        self.files = 0
+        self.directories = 0
+        self.bytes_hashed = 0
+
+    def __str__(self):
+        s = (f"Instrumentation: directories: {self.directories}. "
+             f"files: {self.files}. bytes_hashed: {self.bytes_hashed}.")
+        return s
+
+    def subscribe(self, callback):
+        """
+        This method registers callback to receive progress events. It is
+        called as callback(event, **data), with event one of
+        'directory_listed' (path, entries, seconds), 'file_hashed' (path,
+        size, hash, seconds) or 'scan_finished' (directories, files,
+        bytes_hashed), sent once per root directory. With several roots,
+        callbacks are called from the thread walking each root.
+        :param callback: callable
+        :return: None
+        """
+        self._hooks.append(callback)
+
+    def emit(self, event, **data):
+        """
+        This method passes an event to every subscribed callback.
+        :param event: str, name of the event
+        :param data: keyword arguments of the event
+        :return: None
+        """
+        for callback in self._hooks:
+            callback(event, **data)
+
+    def record(self, phase, seconds):
+        """
+        This method adds x call of phase taking seconds.
+        :param phase: str, one of PHASES
+        :param seconds: float
+        :return: None
+        """
+        bucket = min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+        with self._lock:
+            self.counts[phase] += 1
+            self.totals[phase] += seconds
+            if seconds > self.maximums[phase]:
+                self.maximums[phase] = seconds
+            self.histograms[phase][bucket] += 1
+
+    def record_directory(self, path, entries, seconds):
+        """
+        This method records the listing of x directory.
+        :param path: str, filepath of the directory
+        :param entries: int, number of entries listed
+        :param seconds: float, time taken to list it
+        :return: None
+        """
+        self.record('scandir', seconds)
+        with self._lock:
+            self.directories += 1
+            self._keep_slowest(self.slowest_directories, seconds, str(path))
+        self.emit('directory_listed', path=path, entries=entries, seconds=seconds)
+
+    def record_file(self, path, stat_result, hash_value):
+        """
+        This method records the hashing of x file, attributing its bytes
+        and time to the mount point holding it. The time is the one the
+        timed_file_hash wrapper measured for path. Files hashed without the
+        wrapper, by x process pool, only count their bytes.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :param hash_value: str, hash value of the file
+        :return: None
+        """
+        mount_point = self._mount_point(path, stat_result.st_dev)
+        with self._lock:
+            seconds = self._file_seconds.pop(path, None)
+            self.files += 1
+            self.bytes_hashed += stat_result.st_size
+            totals = self.mounts.setdefault(mount_point, [0, 0.0])
+            totals[0] += stat_result.st_size
+            if seconds is not None:
+                totals[1] += seconds
+                self._keep_slowest(self.slowest_files, seconds, str(path))
+        self.emit('file_hashed', path=path, size=stat_result.st_size,
+                  hash=hash_value, seconds=seconds)
+
+    def finish(self):
+        """
+        This method announces the end of x scan to the subscribers.
+        :return: None
+        """
+        self.emit('scan_finished', directories=self.directories,
+                  files=self.files, bytes_hashed=self.bytes_hashed)
+
+    def timed_file_hash(self, hash_function=file_hash):
+        """
+        This method wraps hash_function so that the time spent opening,
+        reading and digesting each file is recorded. The wrapper is thread
+        safe, but it cannot be sent to x process pool.
+        :param hash_function: callable with the signature of file_hash,
+            usually x functools.partial of it
+        :return: callable with the signature of file_hash
+        """
+        def timed(filename, algorithm='sha256'):
+            timings = {}
+            start = perf_counter()
+            hash_value = hash_function(filename, algorithm, timings=timings)
+            seconds = perf_counter() - start
+            for phase, phase_seconds in timings.items():
+                self.record(phase, phase_seconds)
+            self.record('hash', seconds)
+            with self._lock:
+                self._file_seconds[filename] = seconds
+            return hash_value
+        return timed
+
+    def _keep_slowest(self, heap, seconds, path):
+        """
+        This internal method keeps the slowest entries seen in x min heap.
+        :param heap: list used as x heap of (seconds, path)
+        :param seconds: float
+        :param path: str
+        :return: None
+        """
+        if len(heap) < self._slowest:
+            heapq.heappush(heap, (seconds, path))
+        elif seconds > heap[0][0]:
+            heapq.heapreplace(heap, (seconds, path))
+
+    def _mount_point(self, path, device):
+        """
+        This internal method finds the mount point holding path. It is
+        looked up once per device.
+        :param path: str, filepath
+        :param device: int, st_dev of path
+        :return: str
+        """
+        mount_point = self._mount_points.get(device)
+        if mount_point is None:
+            mount_point = os.path.abspath(path)
+            while not os.path.ismount(mount_point):
+                mount_point = os.path.dirname(mount_point)
+            self._mount_points[device] = mount_point
+        return mount_point
+
+    def to_dict(self):
+        """
+        This method returns every counter as x dict ready for JSON.
+        :return: dict
+        """
+        return {'phases': {phase: {'count': self.counts[phase],
+                                   'total_seconds': self.totals[phase],
+                                   'max_seconds': self.maximums[phase],
+                                   'histogram_us_log2': self.histograms[phase]}
+                           for phase in PHASES},
+                'directories': self.directories,
+                'files': self.files,
+                'bytes_hashed': self.bytes_hashed,
+                'slowest_files': sorted(self.slowest_files, reverse=True),
+                'slowest_directories': sorted(self.slowest_directories,
+                                              reverse=True),
+                'mounts': {mount: {'bytes': totals[0], 'seconds': totals[1],
+                                   'bytes_per_s': totals[0] / totals[1]
+                                   if totals[1] else None}
+                           for mount, totals in self.mounts.items()}}
+
+    def report(self):
+        """
+        This method formats the counters as x human readable report.
+        :return: str
+        """
+        lines = [f"Scan statistics: {self.directories} directories, "
+                 f"{self.files} files hashed, {self.bytes_hashed} bytes."]
+        for phase in PHASES:
+            count = self.counts[phase]
+            if count:
+                lines.append(f"  {phase:>8}: {count} calls, "
+                             f"{self.totals[phase]:.4f} s total, "
+                             f"{self.totals[phase] / count * 1e6:.1f} us mean, "
+                             f"{self.maximums[phase] * 1e6:.1f} us max.")
+        for mount, totals in self.mounts.items():
+            rate = totals[0] / totals[1] / 1e6 if totals[1] else 0.0
+            lines.append(f"  Mount {mount}: {totals[0]} bytes at {rate:.1f} MB/s.")
+        for title, heap in [("Slowest files", self.slowest_files),
+                            ("Slowest directories", self.slowest_directories)]:
+            if heap:
+                lines.append(f"  {title}:")
+                for seconds, path in sorted(heap, reverse=True):
+                    lines.append(f"    {seconds * 1e3:.2f} ms {path}")
+        return "\n".join(lines)
@@ -0,0 +1,304 @@
+"""This module supplies the machine-readable output formats of RP Tree."""
+
+import json
+import os
+import pathlib
+import threading
+
+from functions import split_hard_links, reclaimable_bytes
+
+TEXT_FORMATS = ['txt', 'md']
+STRUCTURED_FORMATS = ['jsonl', 'csv', 'sqlite']
+OUTPUT_FORMATS = TEXT_FORMATS + STRUCTURED_FORMATS
+OUTPUT_SCHEMA_VERSION = 1
+CSV_COLUMNS = ['record', 'path', 'size', 'mtime_ns', 'hash', 'group',
+               'hard_link_of', 'root', 'reclaimable_bytes', 'version']
+
+
+class RecordWriter:
+    def __init__(self, output_file, root_dirs, hash_type, batch_size=1000):
+        """
+        This method prepares x writer of the records of x scan: one per
+        directory, one per file and one per duplicate group with x record
+        per member. Records are queued and written in batches of batch_size,
+        so x tree of any size is written without being held in memory.
+        Records may be added from several threads. Subclasses write the
+        batches in their own format.
+
+        :param output_file: str, filepath of the output
+        :param root_dirs: list of str, filepaths of the root directories of
+            the scan
+        :param hash_type: str, hash algorithm of the scan
+        :param batch_size: int, defaults to 1000, number of records queued
+            before they are written
+        """
+        self._output_file = output_file
+        self._root_dirs = [str(root_dir) for root_dir in root_dirs]
+        self._hash_type = hash_type
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._batch = []
+        self.records = 0
+
+    def __str__(self):
+        s = (f"{type(self).__name__}: _output_file: {self._output_file}. "
+             f"records: {self.records}.")
+        return s
+
+    def add_directory(self, path):
+        """
+        This method queues the record of x directory.
+        :param path: str, filepath of the directory
+        :return: None
+        """
+        self._queue(('directory', _path_text(path), None, None, None, None, None))
+
+    def add_file(self, path, stat_result, hash_value):
+        """
+        This method queues the record of x file.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :param hash_value: str or None, hash value of the file
+        :return: None
+        """
+        self._queue(('file', _path_text(path), stat_result.st_size,
+                     stat_result.st_mtime_ns, hash_value, stat_result.st_dev,
+                     stat_result.st_ino))
+
+    def add_group(self, group_id, group, roots):
+        """
+        This method queues the records of x duplicate group: the group
+        itself, then one per member naming the file it is x hard link of,
+        if it is one, and the root directory it was found under.
+        :param group_id: int, number of the group, from 1
+        :param group: list of FileRecord with the same content
+        :param roots: dict mapping the path of each member to its root
+        :return: None
+        """
+        inodes = split_hard_links(group)
+        self._queue(('group', group_id, group[0].hash, group[0].size,
+                     len(group), len(inodes), reclaimable_bytes(group)))
+        for links in inodes:
+            self._queue(('member', group_id, _path_text(links[0].path), None,
+                         str(roots[links[0].path])))
+            for record in links[1:]:
+                self._queue(('member', group_id, _path_text(record.path),
+                             _path_text(links[0].path), str(roots[record.path])))
+
+    def _queue(self, record):
+        """
+        This internal method queues x record, writing the queue once it
+        holds batch_size records.
+        :param record: tuple, starting with the kind of record
+        :return: None
+        """
+        with self._lock:
+            self._batch.append(record)
+            self.records += 1
+            if len(self._batch) >= self._batch_size:
+                self._write_batch(self._batch)
+                self._batch = []
+
+    def flush(self):
+        """
+        This method writes the queued records.
+        :return: None
+        """
+        with self._lock:
+            if self._batch:
+                self._write_batch(self._batch)
+                self._batch = []
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def close(self):
+        """
+        This method writes the queued records and closes the output.
+        :return: None
+        """
+        self.flush()
+
+
+def _path_text(path):
+    """
+    _path_text writes x path the way every record of x scan holds it, the
+    way pathlib prints it, so that the paths of the files table and of the
+    duplicate groups can be joined. The walk yields paths such as ./c/y.txt
+    under the root directory ., which pathlib prints as c/y.txt.
+    :param path: str or PathLike
+    :return: str
+    """
+    return str(pathlib.Path(path))
+
+
+class JsonLinesWriter(RecordWriter):
+    """
+    This class writes records as JSON Lines, one object per line with x
+    "record" key. The first line is x header with the schema version.
+    """
+    def __init__(self, output_file, root_dirs, hash_type, batch_size=1000):
+        super().__init__(output_file, root_dirs, hash_type, batch_size)
+        self._stream = open(output_file, mode='w', encoding='UTF-8')
+        self._stream.write(json.dumps({'record': 'header',
+                                       'version': OUTPUT_SCHEMA_VERSION,
+                                       'root_dirs': self._root_dirs,
+                                       'hash_type': hash_type}) + "\n")
+
+    def _write_batch(self, batch):
+        lines = []
+        for record in batch:
+            match record[0]:
+                case 'directory':
+                    obj = {'record': 'directory', 'path': record[1]}
+                case 'file':
+                    obj = {'record': 'file', 'path': record[1],
+                           'size': record[2], 'mtime_ns': record[3],
+                           'hash': record[4], 'device': record[5],
+                           'inode': record[6]}
+                case 'group':
+                    obj = {'record': 'group', 'group': record[1],
+                           'hash': record[2], 'size': record[3],
+                           'files': record[4], 'inodes': record[5],
+                           'reclaimable_bytes': record[6]}
+                case _:
+                    obj = {'record': 'member', 'group': record[1],
+                           'path': record[2], 'hard_link_of': record[3],
+                           'root': record[4]}
+            lines.append(json.dumps(obj, ensure_ascii=False))
+        self._stream.write("\n".join(lines) + "\n")
+
+    def close(self):
+        super().close()
+        self._stream.close()
+
+
+class CsvWriter(RecordWriter):
+    """
+    This class writes records as CSV rows with the columns of CSV_COLUMNS.
+    The first row after the column names is x header record holding the
+    hash algorithm in hash and the schema version in version, followed by
+    x root record per root directory.
+    """
+    def __init__(self, output_file, root_dirs, hash_type, batch_size=1000):
+        # csv and sqlite3 are loaded by the writers of their formats only, so
+        # that text output does not pay for them at startup.
+        import csv
+        super().__init__(output_file, root_dirs, hash_type, batch_size)
+        self._stream = open(output_file, mode='w', encoding='UTF-8', newline='')
+        self._writer = csv.writer(self._stream)
+        self._writer.writerow(CSV_COLUMNS)
+        self._writer.writerow(['header', '', '', '', hash_type, '', '', '', '',
+                               OUTPUT_SCHEMA_VERSION])
+        self._writer.writerows([['root', root_dir, '', '', '', '', '', '', '', '']
+                                for root_dir in self._root_dirs])
+
+    def _write_batch(self, batch):
+        rows = []
+        for record in batch:
+            match record[0]:
+                case 'directory':
+                    rows.append(['directory', record[1], '', '', '', '', '',
+                                 '', '', ''])
+                case 'file':
+                    rows.append(['file', record[1], record[2], record[3],
+                                 record[4] or '', '', '', '', '', ''])
+                case 'group':
+                    rows.append(['group', '', record[3], '', record[2],
+                                 record[1], '', '', record[6], ''])
+                case _:
+                    rows.append(['member', record[2], '', '', '', record[1],
+                                 record[3] or '', record[4], '', ''])
+        self._writer.writerows(rows)
+
+    def close(self):
+        super().close()
+        self._stream.close()
+
+
+class SqliteWriter(RecordWriter):
+    """
+    This class writes records to x SQLite database with x files, x
+    duplicate_groups and x duplicate_files table, joined on path and
+    group_id. The metadata table holds the schema version. Indexes are
+    built on close, once every row is in, which is faster than keeping them
+    up to date row by row. An existing database at output_file is replaced.
+    """
+    def __init__(self, output_file, root_dirs, hash_type, batch_size=1000):
+        super().__init__(output_file, root_dirs, hash_type, batch_size)
+        import sqlite3
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        self._connection = sqlite3.connect(output_file, check_same_thread=False)
+        self._connection.executescript(
+            "CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE files (path TEXT NOT NULL, kind TEXT NOT NULL, "
+            "size INTEGER, mtime_ns INTEGER, hash TEXT, device INTEGER, "
+            "inode INTEGER);"
+            "CREATE TABLE duplicate_groups (group_id INTEGER PRIMARY KEY, "
+            "hash TEXT, size INTEGER, files INTEGER, inodes INTEGER, "
+            "reclaimable_bytes INTEGER);"
+            "CREATE TABLE duplicate_files (group_id INTEGER NOT NULL, "
+            "path TEXT NOT NULL, hard_link_of TEXT, root TEXT);")
+        self._connection.executemany(
+            "INSERT INTO metadata VALUES (?, ?)",
+            [('version', str(OUTPUT_SCHEMA_VERSION)),
+             ('root_dirs', json.dumps(self._root_dirs)),
+             ('hash_type', hash_type)])
+        self._connection.commit()
+
+    def _write_batch(self, batch):
+        files = []
+        groups = []
+        members = []
+        for record in batch:
+            match record[0]:
+                case 'directory' | 'file':
+                    files.append((record[1], record[0]) + record[2:])
+                case 'group':
+                    groups.append(record[1:])
+                case _:
+                    members.append(record[1:])
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", files)
+            self._connection.executemany(
+                "INSERT INTO duplicate_groups VALUES (?, ?, ?, ?, ?, ?)", groups)
+            self._connection.executemany(
+                "INSERT INTO duplicate_files VALUES (?, ?, ?, ?)", members)
+
+    def close(self):
+        super().close()
+        self._connection.executescript(
+            "CREATE INDEX files_path ON files (path);"
+            "CREATE INDEX files_hash ON files (hash);"
+            "CREATE INDEX files_size ON files (size);"
+            "CREATE INDEX duplicate_groups_hash ON duplicate_groups (hash);"
+            "CREATE INDEX duplicate_files_group_id ON duplicate_files (group_id);"
+            "CREATE INDEX duplicate_files_path ON duplicate_files (path);")
+        self._connection.close()
+
+
+def open_record_writer(file_type, output_file, root_dirs, hash_type,
+                       batch_size=1000):
+    """
+    open_record_writer opens the RecordWriter of x structured format.
+    :param file_type: str, one of STRUCTURED_FORMATS
+    :param output_file: str, filepath of the output
+    :param root_dirs: list of str, filepaths of the root directories
+    :param hash_type: str, hash algorithm of the scan
+    :param batch_size: int, defaults to 1000, see RecordWriter
+    :return: RecordWriter
+    """
+    match file_type:
+        case 'jsonl':
+            writer_class = JsonLinesWriter
+        case 'csv':
+            writer_class = CsvWriter
+        case 'sqlite':
+            writer_class = SqliteWriter
+        case _:
+            error_msg = (f"open_record_writer(): file_type, {file_type}, is "
+                         f"not one of {STRUCTURED_FORMATS}.")
+            raise ValueError(error_msg)
+    return writer_class(output_file, root_dirs, hash_type, batch_size)
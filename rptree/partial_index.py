@@ -0,0 +1,232 @@
+"""This module supplies the mergeable partial indexes of RP Tree.
+
+A partial index lists every file of one tree with its size, its partial
+hash and, when it is known, its full hash. Indexes of trees on different
+hosts are merged without the files themselves: only files colliding on
+size and partial hash can be duplicates, and only those need x full hash.
+"""
+
+import gzip
+import heapq
+import json
+import os
+import socket
+from collections import namedtuple
+from itertools import groupby
+
+from functions import (file_hash, partial_file_hash, resolve_algorithm,
+                       PARTIAL_HASH_BLOCK_SIZE)
+from .rptree import DirectoryTree
+
+INDEX_VERSION = 1
+
+IndexEntry = namedtuple('IndexEntry',
+                        ['size', 'partial_hash', 'full_hash', 'path', 'index'])
+
+
+def scan_to_index(root_dir, index_file, algorithm='sha256',
+                  block_size=PARTIAL_HASH_BLOCK_SIZE, host=None,
+                  full_hash_paths=None):
+    """
+    scan_to_index walks root_dir and writes its partial index to
+    index_file: x gzip file of JSON lines, x header followed by one
+    [size, partial hash, full hash, path] entry per file, sorted by size,
+    partial hash and path. Full hashes are computed for the files colliding
+    with another file of the same tree and for full_hash_paths, which are
+    usually the paths x merge asked for. Files no larger than two blocks
+    get their partial hash as full hash, since it covers all of their data.
+    :param root_dir: str, filepath of the tree
+    :param index_file: str, filepath of the index to write
+    :param algorithm: str, see file_hash for valid values
+    :param block_size: int, bytes partial hashing reads at each end of x file
+    :param host: str, defaults to None, meaning the name of this host
+    :param full_hash_paths: set of str, defaults to None, absolute paths
+        that get x full hash regardless of collisions
+    :return: dict with the keys files, partial_hashes and full_hashes
+    """
+    algorithm = resolve_algorithm(algorithm)
+    full_hash_paths = full_hash_paths or set()
+    # The index is the output, so the walk reports no progress.
+    tree = DirectoryTree(os.path.abspath(root_dir), suppress_hash=True,
+                         quiet=True)
+    partial_hashes = {}
+    entries = []
+    for record in tree.collect_records():
+        # Hard links of one inode share x single partial hash.
+        inode = record.inode or record.path
+        if inode not in partial_hashes:
+            partial_hashes[inode] = partial_file_hash(record.path, algorithm,
+                                                      block_size)
+        entries.append([record.size, partial_hashes[inode], None,
+                        str(record.path), inode])
+    entries.sort(key=lambda entry: (entry[0], entry[1], entry[3]))
+    full_hashes = {}
+    for _, group in groupby(entries, key=lambda entry: (entry[0], entry[1])):
+        group = list(group)
+        for entry in group:
+            if entry[0] <= 2 * block_size:
+                entry[2] = entry[1]
+            elif len(group) > 1 or entry[3] in full_hash_paths:
+                if entry[4] not in full_hashes:
+                    full_hashes[entry[4]] = file_hash(entry[3], algorithm)
+                entry[2] = full_hashes[entry[4]]
+    header = {'version': INDEX_VERSION,
+              'host': host or socket.gethostname(),
+              'root_dir': os.path.abspath(root_dir),
+              'algorithm': algorithm,
+              'block_size': block_size,
+              'files': len(entries)}
+    temp_file = f"{index_file}.tmp"
+    with gzip.open(temp_file, 'wt', encoding='UTF-8') as f:
+        f.write(json.dumps(header) + "\n")
+        for entry in entries:
+            f.write(json.dumps(entry[:4], ensure_ascii=False) + "\n")
+    os.replace(temp_file, index_file)
+    return {'files': len(entries),
+            'partial_hashes': len(partial_hashes),
+            'full_hashes': len(full_hashes)}
+
+
+def read_index_header(index_file):
+    """
+    read_index_header reads the header of x partial index.
+    :param index_file: str, filepath of the index
+    :return: dict
+    """
+    with gzip.open(index_file, 'rt', encoding='UTF-8') as f:
+        header = json.loads(f.readline())
+    if header.get('version') != INDEX_VERSION:
+        error_msg = (f"read_index_header(): index_file, {index_file}, has "
+                     f"version {header.get('version')}, not {INDEX_VERSION}.")
+        raise ValueError(error_msg)
+    return header
+
+
+def iter_index(index_file, index=0):
+    """
+    iter_index streams the entries of x partial index in their sorted order.
+    :param index_file: str, filepath of the index
+    :param index: int, defaults to 0, number of the index in x merge
+    :return: generator of IndexEntry
+    """
+    with gzip.open(index_file, 'rt', encoding='UTF-8') as f:
+        f.readline()
+        for line in f:
+            size, partial_hash, full_hash, path = json.loads(line)
+            yield IndexEntry(size, partial_hash, full_hash, path, index)
+
+
+class IndexMerge:
+    def __init__(self, index_files, resolve_local=False):
+        """
+        This method prepares the merge of index_files. Iterating over the
+        merge reads every index once, in x streaming k-way merge, and yields
+        the duplicate groups across all of them. Only the entries sharing
+        one size and partial hash are held in memory at x time.
+
+        Entries that collide but lack x full hash cannot be settled from
+        the indexes. With resolve_local, they are hashed on this host, which
+        suits indexes of local trees. Otherwise their paths are collected in
+        requests, per index, so that the scan of that index can be run again
+        with full hashes for them.
+
+        :param index_files: list of str, filepaths of the indexes
+        :param resolve_local: bool, defaults to False, hashes unsettled
+            collisions on this host
+        """
+        if not index_files:
+            error_msg = "IndexMerge.__init__(): index_files is empty."
+            raise ValueError(error_msg)
+        self._index_files = index_files
+        self._resolve_local = resolve_local
+        self.headers = [read_index_header(index_file) for index_file in index_files]
+        settings = {(header['algorithm'], header['block_size'])
+                    for header in self.headers}
+        if len(settings) > 1:
+            error_msg = (f"IndexMerge.__init__(): index_files, {index_files}, "
+                         f"were written with different algorithms or block "
+                         f"sizes, {sorted(settings)}.")
+            raise ValueError(error_msg)
+        self._algorithm = self.headers[0]['algorithm']
+        self.requests = {idx: [] for idx in range(len(index_files))}
+        self.entries = 0
+        self.collisions = 0
+        self.resolved = 0
+
+    def __str__(self):
+        s = (f"IndexMerge: _index_files: {self._index_files}. "
+             f"entries: {self.entries}. collisions: {self.collisions}. "
+             f"resolved: {self.resolved}.")
+        return s
+
+    def __iter__(self):
+        """
+        This method merges the indexes.
+        :return: generator of lists of IndexEntry with the same full hash
+        """
+        streams = [iter_index(index_file, idx)
+                   for idx, index_file in enumerate(self._index_files)]
+        merged = heapq.merge(*streams, key=lambda entry: (entry.size,
+                                                          entry.partial_hash,
+                                                          entry.path))
+        for _, group in groupby(merged, key=lambda entry: (entry.size,
+                                                           entry.partial_hash)):
+            group = list(group)
+            self.entries += len(group)
+            if len(group) > 1:
+                self.collisions += len(group)
+                yield from self._settle(group)
+
+    def _settle(self, group):
+        """
+        This internal method splits x group sharing size and partial hash by
+        full hash. Entries without one are hashed on this host or requested.
+        :param group: list of IndexEntry
+        :return: generator of lists of IndexEntry
+        """
+        settled = []
+        for entry in group:
+            if entry.full_hash is None and self._resolve_local:
+                entry = entry._replace(full_hash=file_hash(entry.path,
+                                                           self._algorithm))
+                self.resolved += 1
+            if entry.full_hash is None:
+                self.requests[entry.index].append(entry.path)
+            else:
+                settled.append(entry)
+        groups = {}
+        for entry in settled:
+            groups.setdefault(entry.full_hash, []).append(entry)
+        for duplicates in groups.values():
+            if len(duplicates) > 1:
+                yield duplicates
+
+    def write_requests(self, request_dir):
+        """
+        This method writes, for each index with unsettled entries, the list
+        of paths that need x full hash to request_dir, as INDEX_NAME.request
+        with one JSON string per line.
+        :param request_dir: str, filepath of x directory
+        :return: list of str, filepaths of the request files written
+        """
+        written = []
+        for idx, paths in self.requests.items():
+            if paths:
+                name = os.path.basename(self._index_files[idx])
+                request_file = os.path.join(request_dir, f"{name}.request")
+                with open(request_file, mode='w', encoding='UTF-8') as f:
+                    for path in paths:
+                        f.write(json.dumps(path, ensure_ascii=False) + "\n")
+                written.append(request_file)
+        return written
+
+
+def read_requests(request_file):
+    """
+    read_requests reads the paths of x request file written by
+    IndexMerge.write_requests.
+    :param request_file: str, filepath
+    :return: set of str
+    """
+    with open(request_file, encoding='UTF-8') as f:
+        return {json.loads(line) for line in f if line.strip()}
@@ -2,19 +2,31 @@
 
 import os
 import pathlib
+import json
 import sys
-import copy
-from itertools import cycle
-from time import sleep
-from collections import namedtuple
+from functools import partial
+from itertools import cycle, chain
+from time import sleep, perf_counter
+from collections import namedtuple, deque
 
-from functions import FileObject, DirectoryObject, file_hash
+from functions import (FileObject, DirectoryObject, RecordStore,
+                       file_hash, find_duplicate_groups, group_by_hash,
+                       confirm_groups, split_hard_links, reclaimable_bytes,
+                       verify_groups,
+                       resolve_algorithm, HASH_BLOCK_SIZE, SAMPLE_COUNT)
+from .snapshot import TreeSnapshot
+from .instrumentation import Instrumentation
+from .output_formats import STRUCTURED_FORMATS, open_record_writer
+from .filters import ScanFilter
+from .checkpoint import ScanJournal
 
 PIPE = "│"
 ELBOW = "└──"
 TEE = "├──"
 PIPE_PREFIX = "│   "
 SPACE_PREFIX = "    "
+STREAM_BATCH_LINES = 1024
+ENGINES = ['sync', 'async']
 
 
 class DirectoryTree:
@@ -23,18 +35,54 @@ class DirectoryTree:
                  dir_only=False,
                  suppress_hash=False,
                  verbose=False,
+                 quiet=False,
                  output_file=None,
                  file_type='txt',
-                 list_duplicates=False):
+                 list_duplicates=False,
+                 jobs=1,
+                 pool_backend='thread',
+                 cache_file=None,
+                 cache_max_entries=None,
+                 cache_verify_rate=0.0,
+                 io_mode='auto',
+                 block_size=HASH_BLOCK_SIZE,
+                 confirm_with=None,
+                 verify=False,
+                 samples=SAMPLE_COUNT,
+                 stream=False,
+                 incremental=None,
+                 checkpoint=None,
+                 resume=False,
+                 stats=False,
+                 profile_out=None,
+                 engine='sync',
+                 concurrency=32,
+                 per_directory_concurrency=8,
+                 include=None,
+                 exclude=None,
+                 include_regex=None,
+                 exclude_regex=None,
+                 min_size=None,
+                 max_size=None,
+                 follow_symlinks=True,
+                 one_file_system=False):
         """
         This method requires the filepath to the root directory where the
         DirectoryTree will begin. This is x required parameter, but it
-        may be x relative path instead of an absolute path.
+        may be x relative path instead of an absolute path. It may also be x
+        list of root directories, on the same volume or not, which are
+        scanned together: each root gets its own section of the tree and
+        its own workers, and duplicates are searched for across all of
+        them.
 
         Parameter, hash_type, is the type of hash to perform on items found
         in the directory.
 
-        :param root_dir: str of x filepath
+        A root that is the same directory as another root, or lies inside
+        one, is scanned as part of the outer root rather than on its own,
+        so that no file is found twice.
+
+        :param root_dir: str of x filepath, or list of them
         :param hash_type: str, name of the hash algorithm to use to build
             the hash list of all files in the directory, defaults to 'sha256'.
         :param dir_only: bool, defaults to False, used to create a directory only listing
@@ -42,192 +90,702 @@ class DirectoryTree:
             directory tree printout
         :param verbose: bool, defaults to False, allows extra messages to appear as the
             program performs its work
+        :param quiet: bool, defaults to False, silences the progress messages
+            of the run. The tree, the duplicate report, the verification
+            outcome, the filter and hash cache reports and the statistics
+            requested with stats are still printed
         :param output_file: str, filepath to an output file
         :param file_type: str, either 'txt' for ASCII text or 'md' for Markdown which
-            uses UTF-8 encoding, anything else default to 'txt', will be ignored if
-            output_file is None
+            uses UTF-8 encoding, or one of the structured formats 'jsonl',
+            'csv' and 'sqlite', see rptree.output_formats, anything else default
+            to 'txt', will be ignored if output_file is None
         :param list_duplicates: bool, defaults to False, determines if this program attempt
             to find duplicate files in the tree after it has traversed it.
+        :param jobs: int, defaults to 1, number of workers hashing files in
+            parallel while the tree is built, for each root. With several
+            roots, the roots are also walked in parallel, unless streaming.
+        :param pool_backend: str, 'thread' (default) or 'process', type of
+            worker pool used when jobs is greater than 1
+        :param cache_file: str, defaults to None, filepath to x persistent
+            hash cache. Files whose device, inode, size and mtime have not
+            changed since they were cached are not read again.
+        :param cache_max_entries: int, defaults to None, least recently used
+            cache entries beyond this number are pruned by close()
+        :param cache_verify_rate: float, defaults to 0.0, fraction of cache
+            hits that are checked against the real file
+        :param io_mode: str, defaults to 'auto', how file_hash reads files,
+            see file_hash for the valid modes
+        :param block_size: int, defaults to 64k, bytes file_hash reads at x
+            time in the read and readinto modes
+        :param confirm_with: str, defaults to None, cryptographic algorithm
+            used to re-hash the members of each duplicate group, confirming
+            groups found with x fast hash_type such as 'fast' or 'xxh3_128'
+        :param verify: bool, defaults to False, compares the members of each
+            duplicate group byte by byte before reporting them, dropping the
+            files that differ and reporting the read throughput
+        :param samples: int, defaults to 16, number of blocks the staged
+            duplicate search reads from large files of x common size to tell
+            them apart before reading them completely, 0 skips that stage
+        :param stream: bool, defaults to False, walks the tree while
+            print_tree writes it, so lines appear as they are produced and
+            the diagram is never held in memory. Progress messages go to
+            stderr when the tree is written to stdout.
+        :param incremental: str, defaults to None, filepath of x snapshot of
+            the previous run. Directories whose mtime has not changed are not
+            listed again and files whose size and mtime have not changed are
+            not hashed again. The snapshot is updated at the end of the walk.
+            With several roots, the snapshot of the n-th root, from 0, is
+            kept in this filepath followed by .n
+        :param checkpoint: str, defaults to None, filepath of x journal
+            where the hashes and completed directories of the walk are
+            regularly written, see ScanJournal. It is removed once the walk
+            completes. With several roots, the n-th root, from 0, is
+            journaled in this filepath followed by .n
+        :param resume: bool, defaults to False, continues the walk journaled
+            in checkpoint by an interrupted run, without hashing again the
+            files it finished. The output is that of an uninterrupted run
+        :param stats: bool, defaults to False, records the time spent in each
+            phase of the scan and prints x report when the tree is closed
+        :param profile_out: str, defaults to None, filepath where close()
+            writes the recorded statistics as JSON
+        :param engine: str, 'sync' (default) or 'async'. The async engine
+            lists directories and hashes files concurrently before the tree
+            is rendered, which suits network filesystems with high latency.
+            jobs and pool_backend are ignored by it.
+        :param concurrency: int, defaults to 32, maximum number of blocking
+            calls the async engine has in progress at once
+        :param per_directory_concurrency: int, defaults to 8, maximum number
+            of files of x single directory the async engine works on at once
+        :param include: list of str, defaults to None, glob patterns of the
+            files to keep, see ScanFilter for the matching rules
+        :param exclude: list of str, defaults to None, glob patterns of the
+            files and directories to prune, such as .git or node_modules
+        :param include_regex: list of str, defaults to None, regular
+            expressions of the relative paths of the files to keep
+        :param exclude_regex: list of str, defaults to None, regular
+            expressions of the relative paths of the entries to prune
+        :param min_size: int, defaults to None, files smaller than this
+            number of bytes are pruned
+        :param max_size: int, defaults to None, files larger than this
+            number of bytes are pruned
+        :param follow_symlinks: bool, defaults to True, with False symbolic
+            links are pruned
+        :param one_file_system: bool, defaults to False, prunes directories
+            on another filesystem than their root directory
         """
-        # Make sure root_dir is x directory and it exists.
-        if not os.path.exists(root_dir):
-            error_msg = (f"DirectoryTree.__init__(): root_dir, {root_dir}, "
-                         f"does not exist.")
-            raise OSError(error_msg)
-        elif not os.path.isdir(root_dir):
-            error_msg = (f"DirectoryTree.__init__(): root_dir, {root_dir}, is "
-                         f"not x directory. Only an actual directory is"
-                         f"acceptable.")
-            raise OSError(error_msg)
+        if isinstance(root_dir, (str, os.PathLike)):
+            root_dirs = [root_dir]
+        else:
+            root_dirs = list(root_dir)
+        # Make sure every root_dir is x directory and it exists.
+        for root_dir in root_dirs:
+            if not os.path.exists(root_dir):
+                error_msg = (f"DirectoryTree.__init__(): root_dir, {root_dir}, "
+                             f"does not exist.")
+                raise OSError(error_msg)
+            elif not os.path.isdir(root_dir):
+                error_msg = (f"DirectoryTree.__init__(): root_dir, {root_dir}, is "
+                             f"not x directory. Only an actual directory is"
+                             f"acceptable.")
+                raise OSError(error_msg)
+        # Messages about the run, as opposed to the output it was asked for.
+        self._messages = _NullStream() if quiet else sys.stdout
+        root_dirs = self._outer_roots(root_dirs)
+        hash_type = resolve_algorithm(hash_type)
+        if confirm_with:
+            confirm_with = resolve_algorithm(confirm_with)
+        self._hash_function = partial(file_hash, io_mode=io_mode,
+                                      block_size=block_size)
+        if cache_file:
+            from functions.hash_cache import HashCache
+            self._hash_cache = HashCache(cache_file,
+                                         max_entries=cache_max_entries,
+                                         verify_rate=cache_verify_rate,
+                                         hash_function=self._hash_function)
+        else:
+            self._hash_cache = None
+        if stats or profile_out:
+            self._instrumentation = Instrumentation()
+        else:
+            self._instrumentation = None
+        if output_file and file_type in STRUCTURED_FORMATS:
+            self._record_writer = open_record_writer(file_type, output_file,
+                                                     root_dirs, hash_type)
         else:
-            self._diagram_generator = _TreeDiagramGenerator(root_dir,
-                                                            dir_only=dir_only,
-                                                            hash_type=hash_type,
-                                                            suppress_hash=suppress_hash,
-                                                            verbose=verbose)
-            self.tree = []
-            self.root_dir = root_dir
-            self.hash_type = hash_type
-            self._dir_only = dir_only
-            self._suppress_hash = suppress_hash
-            self._verbose = verbose
-            self._output_file = output_file
-            self._list_duplicates = list_duplicates
-            if self._output_file:
-                if file_type == 'md':
-                    self._file_type = 'md'
-                else:
-                    self._file_type = 'txt'
-                self.output_stream = open(self._output_file, mode='w', encoding='UTF-8')
+            self._record_writer = None
+        if (include or exclude or include_regex or exclude_regex
+                or min_size is not None or max_size is not None
+                or not follow_symlinks or one_file_system):
+            self._scan_filter = ScanFilter(include=include, exclude=exclude,
+                                           include_regex=include_regex,
+                                           exclude_regex=exclude_regex,
+                                           min_size=min_size, max_size=max_size,
+                                           follow_symlinks=follow_symlinks,
+                                           one_file_system=one_file_system)
+        else:
+            self._scan_filter = None
+        if quiet:
+            progress_stream = _NullStream()
+        elif stream and not output_file:
+            progress_stream = sys.stderr
+        else:
+            progress_stream = sys.stdout
+        self._diagram_generators = []
+        for idx, root_dir in enumerate(root_dirs):
+            if incremental and len(root_dirs) > 1:
+                snapshot = TreeSnapshot(f"{incremental}.{idx}", root_dir, hash_type)
+            elif incremental:
+                snapshot = TreeSnapshot(incremental, root_dir, hash_type)
             else:
-                self._file_type = None
-                self.output_stream = sys.stdout
-            print(self)
+                snapshot = None
+            if checkpoint and len(root_dirs) > 1:
+                journal = ScanJournal(f"{checkpoint}.{idx}", root_dir, hash_type,
+                                      resume=resume)
+            elif checkpoint:
+                journal = ScanJournal(checkpoint, root_dir, hash_type, resume=resume)
+            else:
+                journal = None
+            generator = _TreeDiagramGenerator(root_dir,
+                                              dir_only=dir_only,
+                                              hash_type=hash_type,
+                                              suppress_hash=suppress_hash,
+                                              verbose=verbose,
+                                              jobs=jobs,
+                                              pool_backend=pool_backend,
+                                              hash_cache=self._hash_cache,
+                                              hash_function=self._hash_function,
+                                              keep_records=list_duplicates or not stream,
+                                              progress_stream=progress_stream,
+                                              snapshot=snapshot,
+                                              instrumentation=self._instrumentation,
+                                              engine=engine,
+                                              concurrency=concurrency,
+                                              per_directory_concurrency=per_directory_concurrency,
+                                              record_writer=self._record_writer,
+                                              scan_filter=self._scan_filter,
+                                              journal=journal)
+            self._diagram_generators.append(generator)
+        self.tree = []
+        self._files = []
+        self.root_dir = root_dirs[0]
+        self.root_dirs = root_dirs
+        self._root_paths = [pathlib.Path(root_dir) for root_dir in root_dirs]
+        self.hash_type = hash_type
+        self._dir_only = dir_only
+        self._suppress_hash = suppress_hash
+        self._verbose = verbose
+        self._quiet = quiet
+        self._output_file = output_file
+        self._list_duplicates = list_duplicates
+        self._jobs = jobs
+        self._pool_backend = pool_backend
+        self._io_mode = io_mode
+        self._block_size = block_size
+        self._confirm_with = confirm_with
+        self._verify = verify
+        self._samples = samples
+        self._stream = stream
+        self._incremental = incremental
+        self._checkpoint = checkpoint
+        self._resume = resume
+        self._stats = stats
+        self._profile_out = profile_out
+        self._engine = engine
+        if self._record_writer:
+            # Records go to the writer, messages to stdout.
+            self._file_type = file_type
+            self.output_stream = sys.stdout
+        elif self._output_file:
+            if file_type == 'md':
+                self._file_type = 'md'
+            else:
+                self._file_type = 'txt'
+            self.output_stream = open(self._output_file, mode='w', encoding='UTF-8')
+        else:
+            self._file_type = None
+            self.output_stream = sys.stdout
 
     def __str__(self):
         s = (f"DirectoryTree: \n"
-             f"root_dir: {self.root_dir}. hash_type: {self.hash_type}\n."
+             f"root_dirs: {self.root_dirs}. hash_type: {self.hash_type}\n."
              f"_dir_only: {self._dir_only}. _suppress_hash: {self._suppress_hash}\n."
-             f"_verbose: {self._verbose}. _list_duplicates: {self._list_duplicates}.\n"
+             f"_verbose: {self._verbose}. _quiet: {self._quiet}.\n"
+             f"_list_duplicates: {self._list_duplicates}.\n"
+             f"_jobs: {self._jobs}. _pool_backend: {self._pool_backend}.\n"
+             f"_hash_cache: {self._hash_cache}.\n"
+             f"_io_mode: {self._io_mode}. _block_size: {self._block_size}.\n"
+             f"_confirm_with: {self._confirm_with}. _verify: {self._verify}.\n"
+             f"_samples: {self._samples}.\n"
+             f"_stream: {self._stream}.\n"
+             f"_incremental: {self._incremental}.\n"
+             f"_checkpoint: {self._checkpoint}. _resume: {self._resume}.\n"
+             f"_stats: {self._stats}. _profile_out: {self._profile_out}.\n"
+             f"_engine: {self._engine}. _scan_filter: {self._scan_filter}.\n"
              f"_output_file: {self._output_file}.\n"
              f"_file_type: {self._file_type}.\n"
-             f"tree: {self.tree}\n."
-             f"_diagram_generator: {self._diagram_generator}\n"
+             f"tree: {len(self.tree)} lines\n."
+             f"_diagram_generators: "
+             f"{', '.join(str(generator) for generator in self._diagram_generators)}\n"
              f"End of DirectoryTree.")
         return s
 
+    def _outer_roots(self, root_dirs):
+        """
+        This internal method drops the roots that are the same directory as
+        an earlier root, or lie inside another root, and names them. Roots
+        are compared once resolved, so x relative path and x symbolic link
+        are recognized.
+        :param root_dirs: list of str or PathLike, existing directories
+        :return: list of the roots to scan, in their order
+        """
+        resolved = [pathlib.Path(root_dir).resolve() for root_dir in root_dirs]
+        outer_roots = []
+        for idx, root_dir in enumerate(root_dirs):
+            for other_idx, other in enumerate(resolved):
+                if (other_idx != idx and resolved[idx].is_relative_to(other)
+                        and (resolved[idx] != other or other_idx < idx)):
+                    print(f"Root directory, {root_dir}, is inside root "
+                          f"directory, {root_dirs[other_idx]}, and is scanned "
+                          f"with it.", file=self._messages)
+                    break
+            else:
+                outer_roots.append(root_dir)
+        return outer_roots
+
     def generate(self):
         """
         This method generates the tree from _TreeDiagramGenerator.
         :return:
         """
-        print(f"Using algorithm {self.hash_type} for the hash values displayed.")
+        print(f"Using algorithm {self.hash_type} for the hash values displayed.",
+              file=self._messages)
         if self._suppress_hash:
-            print("Files hash output has been suppressed.")
-        print("Building directory tree.")
-        self.tree = self._diagram_generator.build_tree()
+            print("Files hash output has been suppressed.", file=self._messages)
+        if self._stream:
+            # The walk happens in print_tree, one line at x time.
+            print("Directory tree will be streamed as it is built.",
+                  file=self._messages)
+            return
+        print("Building directory tree.", file=self._messages)
+        generators = self._diagram_generators
+        if len(generators) == 1:
+            trees = [generators[0].build_tree()]
+        else:
+            # Each root is walked by its own thread, with its own workers,
+            # so roots on different disks are read at the same time.
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=len(generators)) as executor:
+                trees = list(executor.map(_TreeDiagramGenerator.build_tree,
+                                          generators))
+        self.tree = list(chain.from_iterable(trees))
+        self._collect_files()
 
     def print_tree(self):
         """This method prints out the tree to either a file or
-        to stdout."""
+        to stdout. When streaming, the tree is walked here and its lines
+        are written in batches as soon as they are produced. In x structured
+        format, the records of the tree are written while it is walked and
+        no diagram is printed."""
+        if self._record_writer:
+            if self._stream:
+                # Walking the tree writes its records.
+                deque(self._iter_tree(), maxlen=0)
+                self._collect_files()
+            print(f"Tree records written to {self._output_file}.",
+                  file=self._messages)
+            if not self._list_duplicates:
+                self._close_record_writer()
+            return
+        if self._stream:
+            lines = self._iter_tree()
+        else:
+            lines = self.tree
         if self._file_type == 'md':
             # Wrap the tree in a markdown code block.
-            self.tree.insert(0, "```")
-            self.tree.append("```")
+            lines = chain(["```"], lines, ["```"])
 
         if self.output_stream == sys.stdout:
-            print("Printing the completed directory tree.")
-            for entry in self.tree:
-                print(entry)
+            print("Printing the completed directory tree.", file=self._messages)
+            self._write_lines(lines)
         else:
-            print(f"Printing the completed directory tree to {self._output_file}.")
-            for entry in self.tree:
-                print(entry, file=self.output_stream)
+            print(f"Printing the completed directory tree to {self._output_file}.",
+                  file=self._messages)
+            self._write_lines(lines)
             if not self._list_duplicates:
                 self.output_stream.close()
+        if self._stream:
+            self._collect_files()
 
-    def find_duplicates(self):
+    def collect_records(self):
         """
-        This method searches self._tree to find files with matching
-        file_hashes and prints out a report detailing this information,
-        either to the output_file or stdout.
-        :return:
+        This method walks every root without building or printing the
+        diagram and returns the records of the files found, for callers
+        that need the files of the tree rather than its picture. Records
+        are only kept when list_duplicates is set or stream is not.
+        :return: RecordStore, or list of RecordView with several roots, the
+            records having the attributes of FileRecord
         """
-        duplicate_files = []       # Stores the actual duplicate files.
-        previous_path = []         # Stores the path to a file.
-        files_with_full_data = []  # Stores the file list with hash and filepath.
-        dir_end = False            # Flag to set when a directory end is reached.
-        previous_path.append(str(self.root_dir))
-        for item in self.tree:
-            if self.tree.index(item) == 0:
-                # Skip the root directory.
-                continue
-            elif item == PIPE:
-                # Skip the first PIPE.
-                continue
-            # Now, we need to disassemble the item to get the
-            # path to the item.
-            depth_ctr = 0
-            while PIPE in item:
-                # Remove all PIPE_PREFIX strings and track the number.
-                depth_ctr += 1
-                item = item[len(PIPE_PREFIX):]
-            if TEE in item:
-                # Remove TEE since it is the middle of a directory, regardless of whether
-                # the item is really a file or a directory.
-                item = item.replace(f"{TEE} ", '')
-                dir_end = False
-            if ELBOW in item:
-                # This marks the end of the directory.
-                dir_end = True
-                item = item.replace(f"{ELBOW} ", '')
-            if item[-1] == os.sep or item[-2:] == os.sep:
-                # item is a directory name.
-                if depth_ctr < len(previous_path):
-                    # Remove one level due to an empty directory.
-                    previous_path.pop()
-                previous_path.append(item)
-                continue
-            else: # item is a file.
-                filename, hash_val = tuple(item.split('\t\t'))
-                dir_path = "".join(str(directory) for directory in previous_path)
-                f = FileObject(
-                    name=filename,
-                    parent=dir_path,
-                    hash=hash_val,
-                    hash_type=self.hash_type
-                )
-                files_with_full_data.append(f)
-                if dir_end:
-                    # Remove the last directory added to it.
-                    if len(previous_path) != 0:
-                        previous_path.pop()
-        temp_list = copy.deepcopy(files_with_full_data)
-        for f1 in files_with_full_data:
-            # Remove the redundant item.
-            if f1 is None:
-                continue
-            duplicates = []
-            for f2 in temp_list:
-                if f2 is None:
-                    continue
+        deque(self._iter_tree(), maxlen=0)
+        self._collect_files()
+        return self._files
+
+    def _iter_tree(self):
+        """
+        This internal method streams the sections of every root, one root
+        after the other.
+        :return: generator of str, the lines of the diagram
+        """
+        for generator in self._diagram_generators:
+            yield from generator.iter_tree()
 
-                if f1 == f2:
-                    temp_list[temp_list.index(f2)] = None
+    def _collect_files(self):
+        """
+        This internal method gathers the records of every root, in the
+        order of the roots, for the duplicate search. x directory reached
+        twice, through x symbolic link, holds the same files under two
+        paths, so only the records of the first path found are kept. Paths
+        are resolved once per directory, not per file. x symbolic link to x
+        file is an alias of that file rather than x duplicate, so it is
+        dropped too, see _symlink_aliases. With x single root and no such
+        directory or link, its RecordStore is used as is.
+        :return: None
+        """
+        generators = self._diagram_generators
+        real_directories = {}
+        first_directories = {}
+        aliases = set()
+        for idx, generator in enumerate(generators):
+            for directory in generator._files.directories():
+                real_directory = os.path.realpath(directory)
+                real_directories[(idx, directory)] = real_directory
+                first = first_directories.setdefault(real_directory,
+                                                     (idx, directory))
+                if first != (idx, directory):
+                    aliases.add((idx, directory))
+        symlink_aliases = self._symlink_aliases(real_directories, aliases)
+        if len(generators) == 1 and not aliases and not symlink_aliases:
+            self._files = generators[0]._files
+        else:
+            self._files = [record for idx, generator in enumerate(generators)
+                           for file_idx, record in enumerate(generator._files)
+                           if (idx, record.parent) not in aliases
+                           and (idx, file_idx) not in symlink_aliases]
+
+    def _symlink_aliases(self, real_directories, aliases):
+        """
+        This internal method finds the records of symbolic links to files
+        the scan also found through their own path, or through an earlier
+        link. Only links are resolved, and the other records are only
+        looked at when there are links.
+        :param real_directories: dict mapping (root index, directory) to
+            the resolved directory
+        :param aliases: set of (root index, directory) whose records are
+            dropped already
+        :return: set of (root index, record index)
+        """
+        targets = {}
+        for idx, generator in enumerate(self._diagram_generators):
+            for file_idx in generator._symlink_files:
+                target = os.path.realpath(generator._files.path(file_idx))
+                targets.setdefault(target, []).append((idx, file_idx))
+        if not targets:
+            return set()
+        symlink_aliases = set()
+        for idx, generator in enumerate(self._diagram_generators):
+            links = set(generator._symlink_files)
+            for file_idx, record in enumerate(generator._files):
+                directory = (idx, record.parent)
+                if file_idx in links or directory in aliases:
                     continue
+                real_path = os.path.join(real_directories[directory], record.name)
+                if real_path in targets:
+                    symlink_aliases.update(targets.pop(real_path))
+        # Links to x file outside the scan keep the first of them.
+        for links in targets.values():
+            symlink_aliases.update(links[1:])
+        return symlink_aliases
+
+    def _write_lines(self, lines):
+        """
+        This internal method writes lines to output_stream, joining them
+        into batches of STREAM_BATCH_LINES to save on write calls.
+        :param lines: iterable of str
+        :return: None
+        """
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= STREAM_BATCH_LINES:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+        self.output_stream.flush()
 
-                if f1.hash == f2.hash:
-                    dupe = temp_list[temp_list.index(f2)]
-                    temp_list[temp_list.index(f2)] = None
-                    files_with_full_data[files_with_full_data.index(f2)] = None
-                    duplicates.append(dupe)
-            if duplicates != []:
-                duplicate_files.append((f1, duplicates))
-        if duplicate_files == []:
+    def _write_batch(self, batch):
+        """
+        This internal method writes x batch of lines to output_stream.
+        :param batch: list of str
+        :return: None
+        """
+        if self._instrumentation:
+            start = perf_counter()
+            self.output_stream.write("\n".join(batch) + "\n")
+            self._instrumentation.record('render', perf_counter() - start)
+        else:
+            self.output_stream.write("\n".join(batch) + "\n")
+
+    def find_duplicates(self):
+        """
+        This method groups the file records collected while building the
+        tree by their file_hashes and prints out a report detailing this
+        information, either to the output_file or stdout. When file hashes
+        have been suppressed, the staged duplicate search reads only the
+        files that can have x duplicate. Hard links to the same inode are
+        reported apart from content duplicates, since they take no extra
+        space, and each group shows the bytes that removing its duplicates
+        would reclaim.
+        :return: list of tuples of (FileObject, list of duplicate FileObjects),
+            the duplicates including the hard links
+        """
+        start = perf_counter()
+        if self._suppress_hash:
+            groups = self._find_staged_duplicates()
+        else:
+            groups = group_by_hash(self._files)
+        hash_type = self.hash_type
+        if self._confirm_with and groups:
+            print(f"Confirming {len(groups)} duplicate groups with "
+                  f"{self._confirm_with}.", file=self._messages)
+            groups = confirm_groups(groups, self._confirm_with,
+                                    hash_function=self._cache_or_hash_function())
+            hash_type = self._confirm_with
+        if self._verify and groups:
+            groups = self._verify_groups(groups)
+        if self._instrumentation:
+            self._instrumentation.record('dedupe', perf_counter() - start)
+        duplicate_files = []
+        for group in groups:
+            files = [self._file_object(record, hash_type) for record in group]
+            duplicate_files.append((files[0], files[1:]))
+        if self._record_writer:
+            for group_id, group in enumerate(groups, 1):
+                roots = {record.path: self._root_of(record.path) for record in group}
+                self._record_writer.add_group(group_id, group, roots)
+            self._close_record_writer()
+            print(f"Duplicate report: {len(groups)} groups, "
+                  f"{sum(reclaimable_bytes(group) for group in groups)} bytes "
+                  f"can be reclaimed. Written to {self._output_file}.")
+        elif duplicate_files == []:
             print("No duplicate files found.", file=self.output_stream)
         else:
             if self.output_stream != sys.stdout:
-                for f, l in duplicate_files:
-                    print(f"\n\nFile, {f.name}, with hash, {f.hash}, in directory, {f.parent}, has the "
-                          f"following duplicates:", file=self.output_stream)
-                    for item in l:
-                        print(f"{item.parent}{os.sep}{item.name} with hash {item.hash}",
-                              file=self.output_stream)
-                print(f"Duplicate report completed.", file=self.output_stream)
+                total_bytes = 0
+                for group in groups:
+                    print("\n", file=self.output_stream)
+                    total_bytes += self._print_group(group)
+                print(f"Duplicate report completed. {total_bytes} bytes can be "
+                      f"reclaimed.", file=self.output_stream)
                 self.output_stream.close()
-                print(f"Report completed and printed to {self._output_file}.")
+                print(f"Report completed and printed to {self._output_file}.",
+                      file=self._messages)
             else:
-                for f, l in duplicate_files:
-                    print(f"File, {f.name}, with hash, {f.hash}, in directory, {f.parent}, has the "
-                          f"following duplicates:")
-                    for item in l:
-                        print(f"{item.parent}{os.sep}{item.name} with hash {item.hash}")
-                    print(f"Duplicate report completed.")
+                total_bytes = sum(self._print_group(group) for group in groups)
+                print(f"Duplicate report completed. {total_bytes} bytes can be "
+                      f"reclaimed.")
+        return duplicate_files
+
+    def _verify_groups(self, groups):
+        """
+        This internal method compares the members of each duplicate group
+        byte by byte. The outcome is part of the duplicate report, so it is
+        written to output_stream, even in x quiet run: the throughput of the
+        comparison, the files that turned out to differ from the rest of
+        their group and those that could not be read.
+        :param groups: list of lists of FileRecord with the same hash
+        :return: list of lists of FileRecord proven identical
+        """
+        print(f"Verifying {len(groups)} duplicate groups byte by byte.",
+              file=self._messages)
+        groups, report = verify_groups(groups)
+        throughput = report.bytes_read / report.seconds / 1e6 if report.seconds else 0.0
+        print(f"Verified {report.groups} duplicate groups byte by byte: read "
+              f"{report.bytes_read} bytes of {report.files} files in "
+              f"{report.seconds:.3f} s, {throughput:.1f} MB/s. "
+              f"{len(report.mismatches)} mismatches, {len(report.unreadable)} "
+              f"unreadable files.", file=self.output_stream)
+        for record in report.mismatches:
+            print(f"Mismatch: {record.path} differs from the rest of its group "
+                  f"despite hash {record.hash}.", file=self.output_stream)
+        for record in report.unreadable:
+            print(f"Unreadable: {record.path} could not be read and was dropped "
+                  f"from its group.", file=self.output_stream)
+        return groups
+
+    def _print_group(self, group):
+        """
+        This internal method prints the report of x duplicate group to
+        output_stream. The content duplicates of the first file, one per
+        inode, come first, then the hard links, which take no extra space.
+        With several roots, the root of each file is named.
+        :param group: list of FileRecord with the same content
+        :return: int, bytes reclaimable from the group
+        """
+        first = group[0]
+        inodes = split_hard_links(group)
+        duplicates = [links[0] for links in inodes[1:]]
+        hard_links = [(links[0], record) for links in inodes for record in links[1:]]
+        if duplicates:
+            print(f"File, {first.path.name}, with hash, {first.hash}, in directory, "
+                  f"{first.path.parent}{self._root_note(first)}, has the following "
+                  f"duplicates:", file=self.output_stream)
+            for record in duplicates:
+                print(f"{record.path} with hash {record.hash}{self._root_note(record)}",
+                      file=self.output_stream)
+        else:
+            print(f"File, {first.path.name}, with hash, {first.hash}, in directory, "
+                  f"{first.path.parent}{self._root_note(first)}, has no duplicates, "
+                  f"only hard links.", file=self.output_stream)
+        if hard_links:
+            print(f"Hard links, already sharing their data:", file=self.output_stream)
+            for target, record in hard_links:
+                print(f"{record.path}{self._root_note(record)} is x hard link of "
+                      f"{target.path}", file=self.output_stream)
+        reclaimable = reclaimable_bytes(group)
+        print(f"Reclaimable: {reclaimable} bytes.", file=self.output_stream)
+        return reclaimable
+
+    def _root_of(self, path):
+        """
+        This internal method finds the root directory x file was found under.
+        :param path: pathlib.Path of the file
+        :return: pathlib.Path
+        """
+        return next(root for root in self._root_paths if path.is_relative_to(root))
+
+    def _root_note(self, record):
+        """
+        This internal method names the root of x file in the duplicate
+        report. It is empty when there is x single root.
+        :param record: FileRecord
+        :return: str
+        """
+        if len(self._root_paths) == 1:
+            return ""
+        return f" in root {self._root_of(record.path)}"
+
+    def subscribe(self, callback):
+        """
+        This method registers callback to receive progress events from the
+        scan, see Instrumentation.subscribe for the events. It turns the
+        instrumentation on if it is not already, so it must be called
+        before generate().
+        :param callback: callable
+        :return: None
+        """
+        if self._instrumentation is None:
+            self._instrumentation = Instrumentation()
+            for generator in self._diagram_generators:
+                generator._instrumentation = self._instrumentation
+        self._instrumentation.subscribe(callback)
+
+    def close(self):
+        """
+        This method writes out and closes the hash cache, if one is in use,
+        and reports how often it was hit. It also prints and writes out the
+        scan statistics when they were requested, reports what the filters
+        pruned, and closes the structured output if it is still open. The
+        filter and hash cache reports are outcomes of the run, so they are
+        printed even in x quiet run.
+        :return: None
+        """
+        self._close_record_writer()
+        if self._scan_filter:
+            print(self._scan_filter.report())
+        if self._instrumentation and self._stats:
+            print(self._instrumentation.report())
+        if self._instrumentation and self._profile_out:
+            profile = self._instrumentation.to_dict()
+            if self._scan_filter:
+                profile['pruned'] = {
+                    'directories': self._scan_filter.pruned_directories,
+                    'files': self._scan_filter.pruned_files,
+                    'bytes': self._scan_filter.pruned_bytes}
+            with open(self._profile_out, mode='w', encoding='UTF-8') as f:
+                json.dump(profile, f, indent=2)
+            print(f"Scan statistics written to {self._profile_out}.",
+                  file=self._messages)
+        if self._hash_cache:
+            print(f"Hash cache: {self._hash_cache.hits} hits, "
+                  f"{self._hash_cache.misses} misses, "
+                  f"{self._hash_cache.verified} hits verified, "
+                  f"{self._hash_cache.mismatches} mismatches.")
+            self._hash_cache.close()
+            self._hash_cache = None
+
+    def _close_record_writer(self):
+        """
+        This internal method writes out and closes the structured output, if
+        one is open.
+        :return: None
+        """
+        if self._record_writer:
+            self._record_writer.close()
+            self._record_writer = None
+
+    @staticmethod
+    def _file_object(record, hash_type):
+        """
+        This internal method converts x FileRecord or x RecordView into the
+        FileObject used by the duplicate report.
+        :param record: FileRecord or RecordView
+        :param hash_type: str, algorithm that produced the record's hash
+        :return: FileObject
+        """
+        return FileObject(name=record.path.name,
+                          parent=str(record.path.parent),
+                          hash=record.hash,
+                          hash_type=hash_type)
+
+    def _cache_or_hash_function(self):
+        """
+        This internal method returns the function used to hash files outside
+        the tree walk: the hash cache when one is in use, else file_hash
+        with the configured I/O mode.
+        :return: callable with the signature of file_hash
+        """
+        if self._hash_cache:
+            return self._hash_cache.file_hash
+        return self._hash_function
+
+    def _find_staged_duplicates(self):
+        """
+        This internal method runs the staged duplicate search over the
+        files collected while building the tree. It is used when file
+        hashes were suppressed in the tree, so only files sharing their
+        size with another file are read at all. The number of bytes each
+        stage avoided reading is printed.
+        :return: list of lists of FileRecord
+        """
+        groups, reports = find_duplicate_groups(
+            self._files, algorithm=self.hash_type,
+            hash_function=self._cache_or_hash_function(),
+            samples=self._samples)
+        for report in reports:
+            print(f"Duplicate search, {report.stage} stage: examined "
+                  f"{report.files} files, read {report.bytes_read} bytes, "
+                  f"avoided reading {report.bytes_avoided} bytes.", file=self._messages)
+        return groups
 
 
 class _TreeDiagramGenerator:
-    def __init__(self, root_dir, dir_only=False, hash_type='she256',
-                 suppress_hash=False, verbose=False):
+    def __init__(self, root_dir, dir_only=False, hash_type='sha256',
+                 suppress_hash=False, verbose=False, jobs=1,
+                 pool_backend='thread', hash_cache=None,
+                 hash_function=file_hash, keep_records=True,
+                 progress_stream=None, snapshot=None, instrumentation=None,
+                 engine='sync', concurrency=32, per_directory_concurrency=8,
+                 record_writer=None, scan_filter=None, journal=None):
         """
         This method requires the filepath to the root directory where the
         _TreeGenerator will begin. This is x required parameter, but it
@@ -242,21 +800,80 @@ class _TreeDiagramGenerator:
             directory tree output
         :param verbose: bool, defaults to False, allows extra messages to appear as the
             program performs its work
+        :param jobs: int, defaults to 1, number of workers hashing files in
+            parallel. With 1, files are hashed one at a time during the walk.
+        :param pool_backend: str, 'thread' (default) or 'process', see HashPool
+        :param hash_cache: HashCache, defaults to None, persistent cache whose
+            digests are reused for files that have not changed
+        :param hash_function: callable with the signature of file_hash,
+            defaults to file_hash
+        :param keep_records: bool, defaults to True, collects x record of
+            every file in the RecordStore _files for the duplicate search
+        :param progress_stream: file object receiving progress messages,
+            defaults to None, meaning sys.stdout
+        :param snapshot: TreeSnapshot, defaults to None, snapshot of the
+            previous run used to skip unchanged directories and files
+        :param instrumentation: Instrumentation, defaults to None, records
+            the time spent in each phase of the walk. With None, the walk
+            only pays for the checks that it is None.
+        :param engine: str, 'sync' (default) or 'async', see AsyncTreeScanner
+        :param concurrency: int, defaults to 32, overall concurrency limit of
+            the async engine
+        :param per_directory_concurrency: int, defaults to 8, concurrency
+            limit of the async engine within x single directory
+        :param record_writer: RecordWriter, defaults to None, receives x
+            record for every directory and file, in x structured format
+        :param scan_filter: ScanFilter, defaults to None, rules pruning
+            entries from every directory listing
+        :param journal: ScanJournal, defaults to None, checkpoint journal
+            receiving every hash and completed directory, whose hashes of an
+            interrupted scan are reused
         """
+        if engine not in ENGINES:
+            error_msg = (f"_TreeDiagramGenerator.__init__(): engine, {engine}, "
+                         f"is not one of {ENGINES}.")
+            raise ValueError(error_msg)
         self._root_dir = pathlib.Path(root_dir)
         self._dir_only = dir_only
         self._hash_type = hash_type
         self._suppress_hash = suppress_hash
         self._verbose = verbose
+        self._jobs = jobs
+        self._pool_backend = pool_backend
+        self._hash_pool = None
+        self._hash_cache = hash_cache
+        self._hash_function = hash_function
+        self._walk_hash_function = hash_function
+        self._keep_records = keep_records
+        self._progress_stream = progress_stream or sys.stdout
+        self._snapshot = snapshot
+        self._instrumentation = instrumentation
+        self._engine = engine
+        self._concurrency = concurrency
+        self._per_directory_concurrency = per_directory_concurrency
+        self._record_writer = record_writer
+        self._scan_filter = scan_filter
+        self._journal = journal
+        self._root_device = None
+        self._listings = None
+        self._scanned_hashes = None
+        self._inode_hashes = {}
+        self._pending_inodes = {}
+        self.hard_link_files = 0
+        self.hard_link_bytes = 0
         self._tree = []
-        print(self)
+        self._files = RecordStore()
+        # Indexes in _files of the files reached through x symbolic link.
+        self._symlink_files = []
 
     def __str__(self):
         s = (f"_TreeDiagramGenerator:\n"
              f"_root_dir: {self._root_dir}. _dir_only: {self._dir_only}.\n"
              f"_hash_type: {self._hash_type}. _suppress_hash: {self._suppress_hash}\n"
-             f"_verbose: {self._verbose}.\n"
-             f"_tree: {self._tree}\n"
+             f"_verbose: {self._verbose}. _jobs: {self._jobs}. "
+             f"_pool_backend: {self._pool_backend}.\n"
+             f"_keep_records: {self._keep_records}. _engine: {self._engine}.\n"
+             f"_tree: {len(self._tree)} lines.\n"
              f"End of _TreeDiagramGenerator")
         return s
 
@@ -270,55 +887,348 @@ class _TreeDiagramGenerator:
         """
         This method builds the tree structure for x DirectoryTree, storing it
         in the internal attributes of this object as well as returning the
-        structure to make it available to other classes.
+        structure to make it available to other classes. x record of every
+        file found is collected in the RecordStore _files for the duplicate
+        search.
         :return: _tree, x nested list of nodes forming the directory tree.
         """
-        print(f"Added root directory, {self._root_dir}, to tree.")
-        self._tree_head()
-        print(f"Recursing subdirectories collecting data:", flush=True)
-        self._tree_body(self._root_dir)
+        self._tree = list(self.iter_tree())
         return self._tree
 
+    def iter_tree(self):
+        """
+        This method walks the tree and yields the lines of the diagram as
+        they are produced, without keeping them. Only the entries of the
+        directories currently being walked, and the lines still waiting on
+        the worker pool, are held in memory. Records are still collected in
+        _files unless keep_records is False.
+        :return: generator of str, the lines of the diagram
+        """
+        print(f"Added root directory, {self._root_dir}, to tree.",
+              file=self._progress_stream)
+        yield from self._tree_head()
+        if self._scan_filter and self._scan_filter.one_file_system:
+            self._root_device = os.stat(self._root_dir).st_dev
+        print(f"Recursing subdirectories collecting data:",
+              file=self._progress_stream, flush=True)
+        if self._instrumentation and self._pool_backend == 'thread':
+            hash_function = self._instrumentation.timed_file_hash(self._hash_function)
+        else:
+            hash_function = self._hash_function
+        self._walk_hash_function = hash_function
+        try:
+            yield from self._walk(hash_function)
+        except BaseException:
+            # The journal of an interrupted walk is kept for --resume.
+            if self._journal:
+                self._journal.close()
+            raise
+        if self.hard_link_files:
+            print(f"Hard links: {self.hard_link_files} files shared the data of "
+                  f"an inode already hashed, {self.hard_link_bytes} bytes were "
+                  f"not read again.", file=self._progress_stream)
+        if self._snapshot:
+            self._snapshot.save()
+            print(f"Incremental scan: listed {self._snapshot.listed_directories} "
+                  f"directories and reused {self._snapshot.skipped_directories} "
+                  f"listings. Reused the hashes of {self._snapshot.bytes_reused} "
+                  f"bytes and read {self._snapshot.bytes_hashed} bytes.",
+                  file=self._progress_stream)
+        if self._journal:
+            print(f"Checkpoint journal: reused the hashes of "
+                  f"{self._journal.resumed_files} files, "
+                  f"{self._journal.resumed_bytes} bytes, and the listings of "
+                  f"{self._journal.resumed_directories} directories, journaled "
+                  f"by an interrupted scan that completed "
+                  f"{self._journal.journaled_directories} directories.",
+                  file=self._progress_stream)
+            self._journal.close(completed=True)
+        if self._instrumentation:
+            self._instrumentation.finish()
+
+    def _walk(self, hash_function):
+        """
+        This internal method walks the tree with the configured engine and
+        yields the lines of the diagram in order.
+        :param hash_function: callable with the signature of file_hash used
+            by the worker pool
+        :return: generator of str, the lines of the diagram
+        """
+        if self._engine == 'async':
+            from .async_engine import AsyncTreeScanner
+            scanner = AsyncTreeScanner(self, self._concurrency,
+                                       self._per_directory_concurrency)
+            self._listings, self._scanned_hashes = scanner.scan(self._root_dir)
+            # The tree is rendered in order from what the scan found.
+            try:
+                yield from self._tree_body(self._root_dir)
+            finally:
+                self._listings = None
+                self._scanned_hashes = None
+        elif self._jobs > 1 and not self._suppress_hash and not self._dir_only:
+            from .hash_pool import HashPool
+            with HashPool(self._jobs, backend=self._pool_backend,
+                          algorithm=self._hash_type,
+                          hash_function=hash_function) as self._hash_pool:
+                # Lines are released in order, once every line before them
+                # and their own hash value are complete. Finished hashes are
+                # collected before each release, so lines keep streaming
+                # when most files are reused and the pool never fills up.
+                waiting = deque()
+                for line in self._tree_body(self._root_dir):
+                    waiting.append(line)
+                    for key, hash_val in self._hash_pool.poll():
+                        self._apply_hash(key, hash_val)
+                    yield from self._release_lines(waiting)
+                for key, hash_val in self._hash_pool.drain():
+                    self._apply_hash(key, hash_val)
+                yield from self._release_lines(waiting)
+            self._hash_pool = None
+        else:
+            yield from self._tree_body(self._root_dir)
+
+    @staticmethod
+    def _release_lines(waiting):
+        """
+        This internal method yields the lines at the front of waiting that
+        no longer wait on x hash value.
+        :param waiting: deque of str or _PendingLine
+        :return: generator of str
+        """
+        while waiting and (isinstance(waiting[0], str) or waiting[0].done):
+            line = waiting.popleft()
+            yield line if isinstance(line, str) else line.text
+
     def _tree_head(self):
         """
-        This method creates the header of the diagram. All actions take place
-        on the diagram itself.
-        :return: None
+        This method creates the header of the diagram.
+        :return: generator of str, the header lines
         """
-        self._tree.append(f"{self._root_dir}{os.sep}")
-        self._tree.append(PIPE)
+        if self._record_writer:
+            self._record_writer.add_directory(self._root_dir)
+        yield f"{self._root_dir}{os.sep}"
+        yield PIPE
 
     def _tree_body(self, directory, prefix=""):
         """
-        This method creates the body of the diagram. All action takes place
-        on the object itself. directory is x required argument and is the
-        directory that this method will traverse.
+        This method creates the body of the diagram. directory is x required
+        argument and is the directory that this method will traverse.
+        The walk keeps an explicit stack of the directories being listed
+        instead of recursing, so the depth of the tree is not limited by
+        Python's recursion limit. Files handed to the worker pool are
+        yielded as x _PendingLine that is completed once the pool returns
+        their hash. Directories whose entries have all been walked are
+        recorded in the checkpoint journal.
         :param directory: str, directory name
         :param prefix: str, allows the addition of spacers to the program.
-        :return: None
+        :return: generator of str or _PendingLine
         """
-        print(f"Searching {directory}...", flush=True)
         entries = self._prepare_entries(directory)
-        entries_count = len(entries)
-        for idx, entry in enumerate(entries):
-            connector = ELBOW if idx == entries_count - 1 else TEE
-            if entry.is_dir():
-                self._add_directory(entry, idx, entries_count, prefix, connector)
+        stack = [(iter(enumerate(entries)), len(entries), prefix, directory)]
+        while stack:
+            entries, entries_count, prefix, directory = stack[-1]
+            for idx, entry in entries:
+                connector = ELBOW if idx == entries_count - 1 else TEE
+                if entry.is_dir():
+                    yield self._add_directory(entry, prefix, connector)
+                    # Descend into the directory, then resume this one.
+                    if idx != entries_count - 1:
+                        child_prefix = prefix + PIPE_PREFIX
+                    else:
+                        child_prefix = prefix + SPACE_PREFIX
+                    child_entries = self._prepare_entries(entry.path)
+                    stack.append((iter(enumerate(child_entries)),
+                                  len(child_entries), child_prefix, entry.path))
+                    break
+                yield self._file_line(entry, prefix, connector)
+            else:
+                stack.pop()
+                if self._journal:
+                    self._journal.record_directory(directory)
+
+    def _file_line(self, entry, prefix, connector):
+        """
+        This internal method hashes x file, records it and builds its line
+        of the diagram. The stat DirEntry caches is the only one made for
+        the file, and its size and mtime are passed on to the hash cache.
+        An entry that cannot be stat'ed, such as x dangling symbolic link,
+        gets x line without x hash and no record.
+        A hard link whose inode is still being hashed by the worker pool
+        waits on the line of the first link instead of being hashed again.
+        :param entry: os.DirEntry of the file
+        :param prefix: str, graphical representation of the spacing to the
+            connector to the file's parent directory
+        :param connector: str, graphical representation of the connection to
+            the file's parent directory
+        :return: str or _PendingLine
+        """
+        try:
+            if self._instrumentation and self._scanned_hashes is None:
+                start = perf_counter()
+                stat_result = entry.stat()
+                self._instrumentation.record('stat', perf_counter() - start)
             else:
-                if self._suppress_hash:
-                    hash_val = None
-                else:
-                    hash_val = file_hash(entry)
-                self._add_file(entry, prefix, connector, hash_val)
+                stat_result = entry.stat()
+        except OSError:
+            # x dangling symbolic link has no data to record or hash, so it
+            # is only shown in the tree.
+            return self._add_file(entry, prefix, connector)
+        hash_val = self._hash_entry(entry.path, stat_result)
+        if stat_result.st_nlink > 1:
+            inode = (stat_result.st_dev, stat_result.st_ino)
+        else:
+            inode = None
+        file_idx = None
+        if self._keep_records:
+            file_idx = self._files.append(entry.path, stat_result, hash_val)
+            if entry.is_symlink():
+                self._symlink_files.append(file_idx)
+        line = self._add_file(entry, prefix, connector, hash_val)
+        if hash_val is None and self._hash_pool:
+            # The hash is filled into the line once the pool hands it back.
+            line = _PendingLine(line, entry.path, stat_result, file_idx)
+            first_link = self._pending_inodes.get(inode)
+            if first_link is not None:
+                if first_link.followers is None:
+                    first_link.followers = []
+                first_link.followers.append(line)
+                return line
+            if inode is not None:
+                self._pending_inodes[inode] = line
+            for done_line, hash_val in self._hash_pool.submit(line, entry.path):
+                self._apply_hash(done_line, hash_val)
+        elif self._record_writer:
+            self._record_writer.add_file(entry.path, stat_result, hash_val)
+        return line
+
+    def _hash_entry(self, path, stat_result):
+        """
+        This internal method returns the hash value of x file, taking it
+        from an earlier hard link to the same inode, the incremental
+        snapshot or the hash cache when possible. It returns None when
+        hashes are suppressed, or when the file is left to the worker pool.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :return: str or None
+        """
+        if self._scanned_hashes is not None:
+            return self._scanned_hashes.pop(path)
+        if self._suppress_hash:
+            if self._snapshot:
+                self._snapshot.record_file(path, stat_result, None)
+            return None
+        hash_val = self._linked_hash(path, stat_result)
+        if hash_val is None:
+            hash_val = self._reused_hash(path, stat_result)
+        if hash_val is not None or self._hash_pool:
+            return hash_val
+        hash_val = self._walk_hash_function(path, self._hash_type)
+        self._record_hash(path, stat_result, hash_val, hashed=True)
+        return hash_val
+
+    def _linked_hash(self, path, stat_result):
+        """
+        This internal method returns the hash value of x file that is x hard
+        link to an inode already hashed during this walk, or None.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :return: str or None
+        """
+        if stat_result.st_nlink < 2:
+            return None
+        hash_val = self._inode_hashes.get((stat_result.st_dev, stat_result.st_ino))
+        if hash_val is not None:
+            self.hard_link_files += 1
+            self.hard_link_bytes += stat_result.st_size
+            self._record_hash(path, stat_result, hash_val, hashed=False)
+        return hash_val
+
+    def _reused_hash(self, path, stat_result):
+        """
+        This internal method returns the hash value the checkpoint journal,
+        the incremental snapshot or the hash cache holds for an unchanged
+        file, or None.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :return: str or None
+        """
+        if self._journal:
+            hash_val = self._journal.lookup_hash(path, stat_result)
+            if hash_val is not None:
+                self._record_hash(path, stat_result, hash_val, hashed=False)
+                return hash_val
+        if self._snapshot:
+            hash_val = self._snapshot.lookup_hash(path, stat_result)
+            if hash_val is not None:
+                self._snapshot.record_file(path, stat_result, hash_val)
+                return hash_val
+        if self._hash_cache:
+            hash_val = self._hash_cache.lookup(path, self._hash_type, stat_result)
+            if hash_val is not None:
+                self._record_hash(path, stat_result, hash_val, hashed=False)
+                return hash_val
+        return None
+
+    def _record_hash(self, path, stat_result, hash_value, hashed):
+        """
+        This internal method hands x file's hash to the hash cache, when it
+        was just computed, to the checkpoint journal and to the incremental
+        snapshot. The hash of x
+        file with several hard links is kept for its other links.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :param hash_value: str, hash value for the file
+        :param hashed: bool, whether the file was read to produce hash_value
+        :return: None
+        """
+        if hashed and self._hash_cache:
+            self._hash_cache.store(path, self._hash_type, hash_value, stat_result)
+        if hashed and self._instrumentation:
+            self._instrumentation.record_file(path, stat_result, hash_value)
+        if self._journal:
+            self._journal.record_file(path, stat_result, hash_value)
+        if self._snapshot:
+            self._snapshot.record_file(path, stat_result, hash_value, hashed)
+        if stat_result.st_nlink > 1:
+            self._inode_hashes[(stat_result.st_dev, stat_result.st_ino)] = hash_value
 
     def _prepare_entries(self, directory):
         """
-        This internal method applies filters to the tree content based
-        on boolean attributes of _TreeDiagramGenerator.
+        This internal method lists directory with os.scandir and applies
+        filters to the tree content based on boolean attributes of
+        _TreeDiagramGenerator. The type of each entry comes from the
+        directory listing itself, so no stat is needed to sort or filter.
+        In an incremental scan, the listing of an unchanged directory comes
+        from the snapshot instead, and in x resumed scan, the listing of an
+        unchanged directory the interrupted scan completed comes from the
+        checkpoint journal. The rules of the scan filter prune entries
+        before anything else is done with them. Once the async engine has
+        scanned the tree, the listing it prepared is handed back.
         :param directory: filepath
-        :return: list of filepaths
+        :return: list of os.DirEntry, directories first
         """
-        entries = directory.iterdir()
+        if self._listings is not None:
+            return self._listings.pop(str(directory))
+        print(f"Searching {directory}...", file=self._progress_stream, flush=True)
+        if self._instrumentation:
+            start = perf_counter()
+        if self._snapshot:
+            list_directory = self._snapshot.list_directory
+        else:
+            list_directory = _list_directory
+        if self._journal:
+            entries = self._journal.list_directory(directory, list_directory)
+        else:
+            entries = list_directory(directory)
+        if self._instrumentation:
+            self._instrumentation.record_directory(directory, len(entries),
+                                                   perf_counter() - start)
+        if self._scan_filter:
+            relative_dir = os.path.relpath(directory, self._root_dir)
+            if relative_dir == os.curdir:
+                relative_dir = ''
+            entries = self._scan_filter.filter_entries(
+                entries, relative_dir.replace(os.sep, '/'), self._root_device)
         if self._dir_only:
             entries = [entry for entry in entries if entry.is_dir()]
             return entries
@@ -326,45 +1236,105 @@ class _TreeDiagramGenerator:
         entries = sorted(entries, key=lambda entry: entry.is_file())
         return entries
 
-    def _add_directory(self, directory, idx: int, count: int,
-                       prefix: str, connector: str):
+    def _add_directory(self, directory, prefix: str, connector: str):
         """
-        This method recursively traverses the tree below directory by calling
-        _tree_body again..
-        :param directory: filepath of this directory to be added
-        :param idx: int, current index of this director in its parent
-            directory
-        :param count: int: total number of entries in its parent directory
+        This method builds the line of the diagram for x directory. Its
+        contents are walked by _tree_body.
+        :param directory: os.DirEntry of this directory
         :param prefix: str: the graphical string to prepend before the
             connector string when displaying this directory in its parent
         :param connector: str: the graphical string to prepend when connecting
             it to its parent directory
-        :return: None, all action takes place internally
+        :return: str, the line of the diagram
         """
         if self._verbose:
-            print(f"_TreeDiagramGenerator._add_directory: Working on directory, {directory}.")
-        self._tree.append(f"{prefix}{connector} {directory.name}{os.sep}")
-        if idx != count - 1:
-            prefix += PIPE_PREFIX
-        else:
-            prefix += SPACE_PREFIX
-        self._tree_body(directory=directory, prefix=prefix)
+            print(f"_TreeDiagramGenerator._add_directory: Working on directory, {directory.path}.",
+                  file=self._progress_stream)
+        if self._record_writer:
+            self._record_writer.add_directory(directory.path)
+        return f"{prefix}{connector} {directory.name}{os.sep}"
 
     def _add_file(self, file_entry, prefix, connector, hash_value=None):
         """
-        This method adds the filename to the directory tree structure and
-        diagram.
-        :param file_entry: relative filepath to this file
+        This method builds the line of the diagram for x file.
+        :param file_entry: os.DirEntry of this file
         :param prefix: str, graphical representation of the spacing to the
             connector to the file's parent directory
         :param connector: str, graphical representation of the connection to
             the file's parent directory
         :param hash_value: str, hash value for the file, defaults to None
-        :return: None, all action takes place internally
+        :return: str, the line of the diagram
         """
         if self._verbose:
-            print(f"_TreeDiagramGenerator._add_file: Working on file, {file_entry}.")
+            print(f"_TreeDiagramGenerator._add_file: Working on file, {file_entry.path}.",
+                  file=self._progress_stream)
         if hash_value:
-            self._tree.append(f"{prefix}{connector} {file_entry.name}\t\t{hash_value}")
+            return f"{prefix}{connector} {file_entry.name}\t\t{hash_value}"
         else:
-            self._tree.append(f"{prefix}{connector} {file_entry.name}")
+            return f"{prefix}{connector} {file_entry.name}"
+
+    def _apply_hash(self, line, hash_value, hashed=True):
+        """
+        This method fills x hash computed by the worker pool into the line
+        and the FileRecord of its file, and into those of the hard links
+        that waited on it.
+        :param line: _PendingLine of the file
+        :param hash_value: str, hash value for the file
+        :param hashed: bool, defaults to True, False for x hard link that
+            was not read itself
+        :return: None, all action takes place internally
+        """
+        self._record_hash(line.path, line.stat_result, hash_value, hashed=hashed)
+        if self._record_writer:
+            self._record_writer.add_file(line.path, line.stat_result, hash_value)
+        line.text = f"{line.text}\t\t{hash_value}"
+        line.done = True
+        if line.file_idx is not None:
+            self._files.set_hash(line.file_idx, hash_value)
+        stat_result = line.stat_result
+        if hashed and stat_result.st_nlink > 1:
+            self._pending_inodes.pop((stat_result.st_dev, stat_result.st_ino), None)
+        if line.followers:
+            for follower in line.followers:
+                self.hard_link_files += 1
+                self.hard_link_bytes += stat_result.st_size
+                self._apply_hash(follower, hash_value, hashed=False)
+
+
+def _list_directory(directory):
+    """
+    _list_directory lists directory with os.scandir.
+    :param directory: str, filepath of the directory
+    :return: list of os.DirEntry, in listing order
+    """
+    with os.scandir(directory) as scanner:
+        return list(scanner)
+
+
+class _PendingLine:
+    """
+    This class holds x line of the diagram whose file is still being
+    hashed by the worker pool.
+    """
+    __slots__ = ('text', 'path', 'stat_result', 'file_idx', 'done', 'followers')
+
+    def __init__(self, text, path, stat_result, file_idx):
+        self.text = text
+        self.path = path
+        self.stat_result = stat_result
+        self.file_idx = file_idx
+        self.done = False
+        # Lines of later hard links to the same inode, if there are any.
+        self.followers = None
+
+
+class _NullStream:
+    """
+    This class stands in for x file object and discards what is written to
+    it, which silences the messages of x quiet run.
+    """
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
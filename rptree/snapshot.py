@@ -0,0 +1,171 @@
+"""This module supplies the snapshots used by incremental rescans."""
+
+import gzip
+import json
+import os
+import threading
+
+SNAPSHOT_VERSION = 1
+
+
+class _SnapshotEntry:
+    """
+    This class stands in for the os.DirEntry of an entry in x directory
+    whose listing is reused from x snapshot. Its stat is made on demand
+    and cached, like the one of os.DirEntry. Whether it is x symbolic link
+    comes from the listing, or from x lstat for listings that did not
+    record it.
+    """
+    __slots__ = ('name', 'path', '_is_dir', '_is_symlink', '_stat_result')
+
+    def __init__(self, name, path, is_dir, is_symlink=None):
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+        self._is_symlink = is_symlink
+        self._stat_result = None
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_file(self):
+        return not self._is_dir
+
+    def is_symlink(self):
+        if self._is_symlink is None:
+            self._is_symlink = os.path.islink(self.path)
+        return self._is_symlink
+
+    def stat(self):
+        if self._stat_result is None:
+            self._stat_result = os.stat(self.path)
+        return self._stat_result
+
+
+class TreeSnapshot:
+    def __init__(self, snapshot_file, root_dir, hash_type):
+        """
+        This method loads the snapshot left in snapshot_file by the previous
+        run over root_dir, if there is one, and starts x new snapshot for
+        this run. A snapshot holds the mtime and listing of every directory
+        and the size, mtime and hash of every file. Nothing is reused when
+        the previous run was over another root_dir, and hashes are only
+        reused when it used the same hash_type.
+
+        :param snapshot_file: str, filepath of the snapshot
+        :param root_dir: str, filepath of the root directory of the tree
+        :param hash_type: str, hash algorithm of this run
+        """
+        self._snapshot_file = snapshot_file
+        self._root_dir = str(root_dir)
+        self._hash_type = hash_type
+        self._previous_directories = {}
+        self._previous_files = {}
+        self._directories = {}
+        self._files = {}
+        self._lock = threading.Lock()
+        self.listed_directories = 0
+        self.skipped_directories = 0
+        self.bytes_reused = 0
+        self.bytes_hashed = 0
+        if os.path.exists(snapshot_file):
+            with gzip.open(snapshot_file, 'rt', encoding='UTF-8') as f:
+                snapshot = json.load(f)
+            if (snapshot.get('version') == SNAPSHOT_VERSION
+                    and snapshot['root_dir'] == self._root_dir):
+                self._previous_directories = snapshot['directories']
+                if snapshot['hash_type'] == hash_type:
+                    self._previous_files = snapshot['files']
+
+    def __str__(self):
+        s = (f"TreeSnapshot: _snapshot_file: {self._snapshot_file}. "
+             f"_hash_type: {self._hash_type}. "
+             f"previous directories: {len(self._previous_directories)}.")
+        return s
+
+    def _key(self, path):
+        """
+        This internal method returns the path relative to the root directory
+        that keys path in the snapshot.
+        :param path: str, filepath inside the tree
+        :return: str
+        """
+        return path[len(self._root_dir):]
+
+    def list_directory(self, directory):
+        """
+        This method lists directory, reusing the listing of the previous run
+        when the mtime of the directory has not changed since, and records
+        the listing for the next run. It may be called from several threads
+        at once.
+        :param directory: str, filepath of the directory
+        :return: list of os.DirEntry or _SnapshotEntry, in listing order
+        """
+        directory = str(directory)
+        key = self._key(directory)
+        mtime_ns = os.stat(directory).st_mtime_ns
+        previous = self._previous_directories.get(key)
+        if previous is not None and previous[0] == mtime_ns:
+            with self._lock:
+                self.skipped_directories += 1
+            entries = [_SnapshotEntry(name, os.path.join(directory, name),
+                                      *flags)
+                       for name, *flags in previous[1]]
+            self._directories[key] = previous
+        else:
+            with self._lock:
+                self.listed_directories += 1
+            with os.scandir(directory) as scanner:
+                entries = list(scanner)
+            self._directories[key] = [mtime_ns, [[entry.name, entry.is_dir(),
+                                                  entry.is_symlink()]
+                                                 for entry in entries]]
+        return entries
+
+    def lookup_hash(self, path, stat_result):
+        """
+        This method returns the hash the previous run recorded for path, or
+        None when the file's size or mtime changed since then.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :return: str or None
+        """
+        previous = self._previous_files.get(self._key(path))
+        if (previous is not None and previous[2] is not None
+                and previous[0] == stat_result.st_size
+                and previous[1] == stat_result.st_mtime_ns):
+            self.bytes_reused += stat_result.st_size
+            return previous[2]
+        return None
+
+    def record_file(self, path, stat_result, hash_value, hashed=False):
+        """
+        This method records the size, mtime and hash of x file for the next
+        run.
+        :param path: str, filepath of the file
+        :param stat_result: os.stat_result of the file
+        :param hash_value: str or None, hash value of the file
+        :param hashed: bool, defaults to False, whether the file was read
+            to produce hash_value during this run
+        :return: None
+        """
+        self._files[self._key(path)] = [stat_result.st_size,
+                                        stat_result.st_mtime_ns, hash_value]
+        if hashed:
+            self.bytes_hashed += stat_result.st_size
+
+    def save(self):
+        """
+        This method writes the snapshot of this run over the previous one.
+        The new snapshot replaces the old file only once it is complete.
+        :return: None
+        """
+        snapshot = {'version': SNAPSHOT_VERSION,
+                    'root_dir': self._root_dir,
+                    'hash_type': self._hash_type,
+                    'directories': self._directories,
+                    'files': self._files}
+        temp_file = f"{self._snapshot_file}.tmp"
+        with gzip.open(temp_file, 'wt', encoding='UTF-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(temp_file, self._snapshot_file)
@@ -0,0 +1,4 @@
+from rptree.cli import scan_index_main
+
+if __name__ == "__main__":
+    scan_index_main()
@@ -0,0 +1,79 @@
+"""This module tests the resumable scans of RP Tree."""
+
+import os
+import tempfile
+import unittest
+
+from rptree.rptree import DirectoryTree
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._root = os.path.join(self._tmp_dir.name, 'tree')
+        self._journal = os.path.join(self._tmp_dir.name, 'scan.journal')
+        for directory in range(4):
+            os.makedirs(os.path.join(self._root, f"dir{directory}"))
+            for idx in range(5):
+                path = os.path.join(self._root, f"dir{directory}", f"file{idx}")
+                with open(path, 'w', encoding='UTF-8') as f:
+                    f.write(f"content {idx % 3}\n")
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _scan(self, name, resume=False, stop_after=None):
+        """
+        _scan scans the tree with x checkpoint journal and returns its
+        output and the number of files hashed. With stop_after, the scan is
+        interrupted once that many files were hashed.
+        """
+        output_file = os.path.join(self._tmp_dir.name, name)
+        tree = DirectoryTree(self._root, quiet=True, list_duplicates=True,
+                             output_file=output_file, checkpoint=self._journal,
+                             resume=resume)
+        hashed = []
+
+        def callback(event, **data):
+            if event == 'file_hashed':
+                hashed.append(data['path'])
+                if len(hashed) == stop_after:
+                    raise _Interrupted()
+
+        tree.subscribe(callback)
+        try:
+            tree.generate()
+        except _Interrupted:
+            tree.output_stream.close()
+            tree.close()
+            return None, len(hashed)
+        tree.print_tree()
+        tree.find_duplicates()
+        tree.close()
+        with open(output_file, encoding='UTF-8') as f:
+            return f.read(), len(hashed)
+
+    def test_resumed_scan_matches_x_clean_scan(self):
+        """
+        x scan resumed from the journal of an interrupted scan hashes only
+        the files the interrupted scan did not, and writes the output of an
+        uninterrupted scan.
+        """
+        clean_output, clean_hashed = self._scan('clean.txt')
+        self.assertEqual(clean_hashed, 20)
+        self.assertFalse(os.path.exists(self._journal))
+        _, interrupted_hashed = self._scan('interrupted.txt', stop_after=12)
+        self.assertEqual(interrupted_hashed, 12)
+        self.assertTrue(os.path.exists(self._journal))
+        resumed_output, resumed_hashed = self._scan('resumed.txt', resume=True)
+        self.assertEqual(resumed_output, clean_output)
+        self.assertLess(resumed_hashed, clean_hashed)
+        self.assertFalse(os.path.exists(self._journal))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+"""This module tests the staged duplicate search of duplicate-file-finder."""
+
+import os
+import tempfile
+import unittest
+
+from functions.duplicate_functions import (find_duplicate_groups, group_by_hash,
+                                           reclaimable_bytes, split_hard_links,
+                                           verify_groups)
+from functions.file_functions import FileRecord, file_hash
+
+
+def _paths(groups):
+    """
+    _paths returns the filepaths of groups, so groups may be compared
+    whatever the order of their members.
+    :param groups: list of lists of FileRecord
+    :return: list of sorted lists of str
+    """
+    return sorted(sorted(str(record.path) for record in group) for group in groups)
+
+
+class _FilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self._tmp_dir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _record(self, path, hash_value=None):
+        stat_result = os.stat(path)
+        inode = None
+        if stat_result.st_nlink > 1:
+            inode = (stat_result.st_dev, stat_result.st_ino)
+        return FileRecord(path, stat_result.st_size, hash_value, inode)
+
+
+class StagedSearchTest(_FilesTestCase):
+    def setUp(self):
+        super().setUp()
+        # Files of 64 bytes are read in blocks of 4 bytes, so every stage of
+        # the search tells some of them apart.
+        base = bytes(range(64))
+        middle = base[:30] + b'XX' + base[32:]
+        contents = {'unique_size': b'short',
+                    'small_a': b'tiny', 'small_b': b'tiny', 'small_c': b'tinx',
+                    'copy_a': base, 'copy_b': base, 'copy_c': base,
+                    'first_block': b'Z' + base[1:],
+                    'last_block': base[:-1] + b'Z',
+                    'middle_a': middle, 'middle_b': middle,
+                    'one_byte': base[:17] + b'Z' + base[18:]}
+        self._records = [self._record(self._write(name, content))
+                         for name, content in contents.items()]
+
+    def _full_hash_groups(self):
+        records = [record._replace(hash=file_hash(record.path))
+                   for record in self._records]
+        return group_by_hash(records)
+
+    def test_staged_search_finds_the_groups_of_x_full_hash_search(self):
+        """
+        The size, partial, sampled and full hash stages find the groups
+        hashing every file completely finds, with the same hashes.
+        """
+        groups, reports = find_duplicate_groups(self._records, block_size=4,
+                                                samples=2, sample_min_size=16)
+        self.assertEqual(_paths(groups), _paths(self._full_hash_groups()))
+        for group in groups:
+            for record in group:
+                self.assertEqual(record.hash, file_hash(record.path))
+        self.assertEqual([report.stage for report in reports],
+                         ['size', 'partial hash', 'sampled hash', 'full hash'])
+        self.assertGreater(reports[2].files, 0)
+
+    def test_staged_search_without_sampled_stage(self):
+        """
+        Skipping the sampled stage does not change the groups found.
+        """
+        groups, _ = find_duplicate_groups(self._records, block_size=4, samples=0)
+        self.assertEqual(_paths(groups), _paths(self._full_hash_groups()))
+
+    @unittest.skipUnless(hasattr(os, 'link'), "needs hard links")
+    def test_hard_links_are_grouped_with_their_copies(self):
+        """
+        Hard links of one inode are grouped with the copies of their data.
+        """
+        target = os.path.join(self._tmp_dir.name, 'copy_a')
+        link = os.path.join(self._tmp_dir.name, 'copy_link')
+        os.link(target, link)
+        records = [self._record(str(record.path)) for record in self._records]
+        records.append(self._record(link))
+        self._records = records
+        groups, _ = find_duplicate_groups(records, block_size=4, samples=2,
+                                          sample_min_size=16)
+        self.assertEqual(_paths(groups), _paths(self._full_hash_groups()))
+        self.assertIn(link, [str(record.path) for group in groups
+                             for record in group])
+
+
+class HardLinkTest(unittest.TestCase):
+    def setUp(self):
+        self._group = [FileRecord('a', 100, 'h', (1, 10)),
+                       FileRecord('b', 100, 'h'),
+                       FileRecord('c', 100, 'h', (1, 10)),
+                       FileRecord('d', 100, 'h', (1, 11)),
+                       FileRecord('e', 100, 'h', (1, 11))]
+
+    def test_split_hard_links(self):
+        """
+        x group splits into the links of each inode, in group order, and
+        files with x single link stand alone.
+        """
+        self.assertEqual([[record.path for record in links]
+                          for links in split_hard_links(self._group)],
+                         [['a', 'c'], ['b'], ['d', 'e']])
+
+    def test_reclaimable_bytes_count_inodes(self):
+        """
+        Only the inodes beyond the first can be reclaimed.
+        """
+        self.assertEqual(reclaimable_bytes(self._group), 200)
+        self.assertEqual(reclaimable_bytes([self._group[0], self._group[2]]), 0)
+        self.assertEqual(reclaimable_bytes([self._group[1],
+                                            FileRecord('f', 100, 'h')]), 100)
+
+
+class VerifyGroupsTest(_FilesTestCase):
+    def test_verify_with_few_open_files(self):
+        """
+        Groups larger than max_open_files are compared in batches. Files
+        that differ from their group and files that cannot be read are
+        dropped and reported.
+        """
+        content = b'same content ' * 1000
+        same = [self._write(f"same_{idx}", content) for idx in range(5)]
+        other = self._write('other', content[:-1] + b'!')
+        missing = os.path.join(self._tmp_dir.name, 'missing')
+        group = [FileRecord(path, len(content), 'h')
+                 for path in [same[0], other, same[1], missing] + same[2:]]
+        pair = [FileRecord(path, len(content), 'g') for path in [other, same[0]]]
+        for max_open_files in [2, 3, 64]:
+            verified, report = verify_groups([group, pair], block_size=1024,
+                                             max_open_files=max_open_files)
+            self.assertEqual(_paths(verified), [sorted(same)])
+            self.assertEqual(sorted(str(record.path)
+                                    for record in report.mismatches),
+                             sorted([other, other, same[0]]))
+            self.assertEqual([str(record.path) for record in report.unreadable],
+                             [missing])
+            self.assertEqual(report.groups, 2)
+
+    def test_verify_needs_two_open_files(self):
+        """
+        max_open_files below 2 cannot compare two files.
+        """
+        with self.assertRaises(ValueError):
+            verify_groups([], max_open_files=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""This module tests the machine-readable output formats of RP Tree."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from rptree.rptree import DirectoryTree
+
+
+class SqliteOutputTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        tree_dir = os.path.join(self._tmp_dir.name, 'tree')
+        os.makedirs(os.path.join(tree_dir, 'c'))
+        for path in ['a.txt', os.path.join('c', 'y.txt'), 'b.txt']:
+            with open(os.path.join(tree_dir, path), 'w', encoding='UTF-8') as f:
+                f.write('same content\n' if path != 'b.txt' else 'other\n')
+        os.chdir(tree_dir)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp_dir.cleanup()
+
+    def test_duplicate_files_join_files_on_path(self):
+        """
+        The duplicate_files rows of x scan of the default root, ., must
+        join the files rows of the same files.
+        """
+        output_file = os.path.join(self._tmp_dir.name, 'tree.db')
+        tree = DirectoryTree('.', quiet=True, list_duplicates=True,
+                             output_file=output_file, file_type='sqlite')
+        tree.generate()
+        tree.print_tree()
+        tree.find_duplicates()
+        tree.close()
+        connection = sqlite3.connect(output_file)
+        rows = connection.execute(
+            "SELECT duplicate_files.path, files.size FROM duplicate_files "
+            "JOIN files ON files.path = duplicate_files.path "
+            "ORDER BY duplicate_files.path").fetchall()
+        connection.close()
+        self.assertEqual(rows, [('a.txt', 13), (os.path.join('c', 'y.txt'), 13)])
+
+
+if __name__ == '__main__':
+    unittest.main()
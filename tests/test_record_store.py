@@ -0,0 +1,82 @@
+"""This module tests the compact file record store of duplicate-file-finder."""
+
+import hashlib
+import os
+import pathlib
+import unittest
+
+from functions.file_functions import FileRecord
+from functions.record_store import RecordStore
+
+
+def _stat(size, mtime_ns=0, nlink=1, dev=1, ino=1):
+    """
+    _stat builds x stat result with the fields RecordStore reads.
+    :param size: int, st_size
+    :param mtime_ns: int, defaults to 0, st_mtime_ns
+    :param nlink: int, defaults to 1, st_nlink
+    :param dev: int, defaults to 1, st_dev
+    :param ino: int, defaults to 1, st_ino
+    :return: os.stat_result
+    """
+    return os.stat_result((0, ino, dev, nlink, 0, 0, size, 0, 0, 0),
+                          {'st_mtime_ns': mtime_ns})
+
+
+class RecordStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._store = RecordStore()
+        self._hash = hashlib.sha256(b'x').hexdigest()
+        self._store.append(os.path.join('root', 'a.txt'), _stat(1, 5))
+        self._store.append(os.path.join('root', 'sub', 'b.txt'), _stat(2),
+                           self._hash)
+        self._store.append(os.path.join('root', 'c.txt'), _stat(3, nlink=2, ino=7))
+
+    def test_records_read_back(self):
+        """
+        Records read back with the path, size, hash and inode appended.
+        """
+        self.assertEqual(len(self._store), 3)
+        self.assertEqual(self._store.record(0),
+                         FileRecord(pathlib.Path('root', 'a.txt'), 1, None, None))
+        self.assertEqual(self._store.record(1),
+                         FileRecord(pathlib.Path('root', 'sub', 'b.txt'), 2,
+                                    self._hash, None))
+        self.assertEqual(self._store.record(2).inode, (1, 7))
+        view = self._store[0]
+        self.assertEqual((view.name, view.parent, view.size, view.mtime_ns),
+                         ('a.txt', 'root', 1, 5))
+        self.assertEqual([view.size for view in self._store], [1, 2, 3])
+
+    def test_set_hash(self):
+        """
+        Hashes set after x record was appended are seen by its views, and
+        must have the length of the hashes already held.
+        """
+        view = self._store[-1]
+        self.assertIsNone(view.hash)
+        self._store.set_hash(2, self._hash)
+        self.assertEqual(view.hash, self._hash)
+        self.assertIsNone(self._store.hash(0))
+        with self.assertRaises(ValueError):
+            self._store.set_hash(0, hashlib.md5(b'x').hexdigest())
+
+    def test_directories_are_kept_once(self):
+        """
+        Parent directories are listed once, in the order they were first seen.
+        """
+        self.assertEqual(self._store.directories(),
+                         ['root', os.path.join('root', 'sub')])
+
+    def test_index_out_of_range(self):
+        """
+        Indexing beyond the records raises IndexError.
+        """
+        with self.assertRaises(IndexError):
+            self._store[3]
+        with self.assertRaises(IndexError):
+            self._store[-4]
+
+
+if __name__ == '__main__':
+    unittest.main()
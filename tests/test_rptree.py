@@ -0,0 +1,104 @@
+"""This module tests the RP Tree main module."""
+
+import os
+import tempfile
+import unittest
+
+from rptree.rptree import DirectoryTree
+
+
+class NestedRootsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._root = os.path.join(self._tmp_dir.name, 'a')
+        self._inner_root = os.path.join(self._root, 'b')
+        os.makedirs(self._inner_root)
+        with open(os.path.join(self._inner_root, 'z.txt'), 'w', encoding='UTF-8') as f:
+            f.write('only copy\n')
+        with open(os.path.join(self._root, 'x.txt'), 'w', encoding='UTF-8') as f:
+            f.write('another file\n')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _duplicates(self, root_dirs):
+        tree = DirectoryTree(root_dirs, quiet=True, list_duplicates=True,
+                             output_file=os.path.join(self._tmp_dir.name, 'tree.txt'))
+        tree.generate()
+        tree.print_tree()
+        duplicate_files = tree.find_duplicates()
+        tree.close()
+        return tree, duplicate_files
+
+    def test_nested_root_is_scanned_with_outer_root(self):
+        """
+        x root inside another root, or repeated, is scanned once, so its
+        files are not reported as duplicates of themselves.
+        """
+        tree, duplicate_files = self._duplicates([self._root, self._inner_root,
+                                                  self._root])
+        self.assertEqual(tree.root_dirs, [self._root])
+        self.assertEqual(duplicate_files, [])
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), "needs symbolic links")
+    def test_directory_reached_through_symbolic_link_is_kept_once(self):
+        """
+        The files of x directory also reached through x symbolic link are
+        searched for duplicates once.
+        """
+        os.symlink(self._inner_root, os.path.join(self._root, 'link'))
+        _, duplicate_files = self._duplicates([self._root])
+        self.assertEqual(duplicate_files, [])
+
+
+class LinkedFilesTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._root = os.path.join(self._tmp_dir.name, 'tree')
+        os.makedirs(os.path.join(self._root, 'c'))
+        self._target = os.path.join(self._root, 'q.txt')
+        with open(self._target, 'w', encoding='UTF-8') as f:
+            f.write('hello\n')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _groups(self, **kwargs):
+        tree = DirectoryTree(self._root, quiet=True, list_duplicates=True,
+                             output_file=os.path.join(self._tmp_dir.name, 'tree.txt'),
+                             **kwargs)
+        tree.generate()
+        tree.print_tree()
+        duplicate_files = tree.find_duplicates()
+        tree.close()
+        return duplicate_files
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), "needs symbolic links")
+    def test_symbolic_link_is_not_a_duplicate_of_its_target(self):
+        """
+        x symbolic link to x file of the scan is an alias of the file, and
+        is not reported as x duplicate of it.
+        """
+        os.symlink(os.path.join('..', 'q.txt'), os.path.join(self._root, 'c', 'sym'))
+        self.assertEqual(self._groups(), [])
+        self.assertEqual(self._groups(suppress_hash=True), [])
+
+    @unittest.skipUnless(hasattr(os, 'link'), "needs hard links")
+    def test_hard_link_is_reported_without_reclaimable_bytes(self):
+        """
+        x hard link is reported with its target, in x group with nothing to
+        reclaim.
+        """
+        os.link(self._target, os.path.join(self._root, 'c', 'link.txt'))
+        duplicate_files = self._groups()
+        self.assertEqual(len(duplicate_files), 1)
+        self.assertEqual(sorted([duplicate_files[0][0].name,
+                                 duplicate_files[0][1][0].name]),
+                         ['link.txt', 'q.txt'])
+        with open(os.path.join(self._tmp_dir.name, 'tree.txt'), encoding='UTF-8') as f:
+            report = f.read()
+        self.assertIn("Reclaimable: 0 bytes.", report)
+
+
+if __name__ == '__main__':
+    unittest.main()